@@ -1,20 +1,48 @@
-import os
 import re
 import traceback
 
+from pathlib import Path
+from typing import Optional
+
 from PIL import Image
 
 import streamlit as st
 
-from rag import generate_answer
+from config import DEFAULT_CORPUS, IMAGE_CACHE_SIZE, MMR_ENABLED, PROCESSED_IMAGES_DIR
+from rag import generate_answer, get_retriever, tracer
+from vectorstore import SearchFilter
 
 st.set_page_config(page_title="Multimodal RAG Search", layout="wide")
 
+@st.cache_resource(show_spinner="Loading indexes...")
+def load_retriever():
+    return get_retriever()
+
+retriever = load_retriever()
+
 st.title("Multimodal RAG Search")
 st.write("Search for your desired article.")
 
 query = st.text_input("Enter your search query:")
 
+# Per browser session: the checkbox state lives in st.session_state and is
+# passed with each query, so one user's debug panel doesn't trace everyone.
+debug = st.sidebar.checkbox("Debug panel", value=tracer.enabled, key="debug_panel")
+
+corpora = retriever.corpora.names()
+corpus = st.sidebar.selectbox(
+    "Corpus", corpora, index=corpora.index(DEFAULT_CORPUS) if DEFAULT_CORPUS in corpora else 0
+)
+
+st.sidebar.markdown("**Filters**")
+issue_min = st.sidebar.number_input("From issue", min_value=0, value=0, step=1, help="0 means no lower bound")
+issue_max = st.sidebar.number_input("To issue", min_value=0, value=0, step=1, help="0 means no upper bound")
+search_filter = SearchFilter.create(
+    issue_min=int(issue_min) or None,
+    issue_max=int(issue_max) or None
+)
+diversify = st.sidebar.checkbox("Diversify results (MMR)", value=MMR_ENABLED)
+
 def split_into_paragraphs(text: str, sentences_per_paragraph: int = 3) -> list[str]:
     sentences = re.split(r'(?<=[.!?])\s+(?=[A-Z])', text)
     sentences = [s.strip() for s in sentences if s.strip()]
@@ -26,20 +54,27 @@ def split_into_paragraphs(text: str, sentences_per_paragraph: int = 3) -> list[s
     return paragraphs
 
 
-def load_image_from_repo(image_path: str):
-    if not image_path:
-        return None
+def image_file(item: dict, size: str) -> Optional[str]:
+    variants = item.get("image_variants") or {}
+    return variants.get(size) or item.get("image_path")
 
-    repo_path = os.path.join("data", "processed", "images", image_path)
 
-    if os.path.exists(repo_path):
-        return Image.open(repo_path)
-    return None
+@st.cache_resource(max_entries=IMAGE_CACHE_SIZE, show_spinner=False)
+def load_image(filename: str) -> Optional[Image.Image]:
+    path = Path(PROCESSED_IMAGES_DIR) / filename
+    if not path.exists():
+        return None
+    img = Image.open(path)
+    img.load()
+    return img
 
 if st.button("Search") and query.strip():
     with st.spinner("Searching and generating answer..."):
         try:
-            result = generate_answer(query=query, top_k=5)
+            result = generate_answer(
+                query=query, top_k=5, filters=search_filter, diversify=diversify, corpus=corpus,
+                tracing=debug
+            )
         except Exception as e:
             st.error(f"Error: {str(e)}")
             st.text(traceback.format_exc())
@@ -50,24 +85,29 @@ if st.button("Search") and query.strip():
     col_left, col_right = st.columns(2)
 
     with col_left:
-        answer_text = result["answer"].strip()
-
-        parts = answer_text.split("\n", 1)
-        summary = parts[0].replace("### Summary", "").strip()
-        full_article = parts[1].strip() if len(parts) > 1 else ""
-
-        st.markdown("### Summary")
-        st.write(summary)
-
-        if full_article:
-            for paragraph in split_into_paragraphs(full_article, sentences_per_paragraph=3):
+        if result.get("degraded"):
+            st.warning(f"Showing search results only: {result['degraded_reason']}")
+        else:
+            st.write(result["answer"].strip())
+
+        # Summary and article body come from the index, not from the answer,
+        # so they are shown even for retrieval-only results.
+        article = result.get("article")
+        if article:
+            st.markdown(f"### {article['title']}")
+            if article.get("summary"):
+                st.markdown("### Summary")
+                st.write(article["summary"])
+
+            for paragraph in split_into_paragraphs(article["text"], sentences_per_paragraph=3):
                 st.markdown(paragraph)
 
     with col_right:
         if result["results"]["images"]:
-            first_image_path = result["results"]["images"][0].get("image_path", None)
-            if first_image_path:
-                st.image(os.path.join("data", "processed", "images", first_image_path), use_container_width=True)
+            filename = image_file(result["results"]["images"][0], "display")
+            img = load_image(filename) if filename else None
+            if img:
+                st.image(img, use_container_width=True)
             else:
                 st.info("No image available.")
         else:
@@ -95,11 +135,26 @@ if st.button("Search") and query.strip():
             for idx, item in enumerate(result["results"]["images"], 1):
                 with st.container():
                     st.markdown(f"*Score:* `{item.get('score', 0):.4f}`")
-                    img = load_image_from_repo(item.get("image_path", ""))
+                    filename = image_file(item, "thumbnail")
+                    img = load_image(filename) if filename else None
                     if img:
-                        st.image(img, use_container_width=True)
+                        st.image(img)
                     else:
                         st.warning("No image path available.")
                     st.markdown("---")
         else:
             st.info("No image results found.")
+
+    if debug:
+        with st.expander("Debug: latency and token usage"):
+            trace = result.get("trace")
+            if trace:
+                st.markdown(f"*Total:* `{trace['total_ms']:.1f} ms`")
+                st.table([
+                    {"stage": span["stage"], "offset ms": round(span["offset_ms"], 1), "duration ms": round(span["duration_ms"], 1)}
+                    for span in trace["spans"]
+                ])
+                if trace["tokens"]:
+                    st.json(trace["tokens"])
+            st.markdown("**Rolling percentiles**")
+            st.code(tracer.format_report())
@@ -0,0 +1,4 @@
+import os
+
+# Benchmarks run fully offline; config only needs a key to be present.
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
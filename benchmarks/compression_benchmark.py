@@ -0,0 +1,123 @@
+import argparse
+import time
+
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic_corpus import fake_embeddings, make_queries, TEXT_DIM
+from benchmarks.utils import git_commit, write_results
+from config import BENCHMARK_RESULTS_DIR, TEXT_INDEX_PATH, PQ_M, PQ_NBITS, RERANK_POOL, TOP_K
+from evaluation.system_evaluation import hits_matrix, compute_metrics
+from vectorstore.quantization import INDEX_TYPES, build_index, index_memory_bytes, rerank_exact
+
+
+def load_corpus_vectors(source: str, size: int, dim: int, seed: int) -> np.ndarray:
+    if source == "synthetic":
+        return fake_embeddings(size, dim, seed)
+
+    index = faiss.read_index(str(TEXT_INDEX_PATH))
+    vectors = index.reconstruct_n(0, index.ntotal)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def evaluate_index_type(
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    ground_truth: np.ndarray,
+    index_type: str,
+    top_k: int,
+    rerank_pool: int
+) -> dict:
+    start = time.perf_counter()
+    index = build_index(vectors, index_type, pq_m=PQ_M, pq_nbits=PQ_NBITS)
+    build_s = time.perf_counter() - start
+
+    result = {
+        "index_type": index_type,
+        "build_s": build_s,
+        "index_bytes": index_memory_bytes(index),
+        "full_precision_bytes": int(vectors.nbytes),
+    }
+    result["memory_reduction"] = result["full_precision_bytes"] / result["index_bytes"]
+
+    start = time.perf_counter()
+    _, I = index.search(queries, top_k)
+    result["search_ms_per_query"] = (time.perf_counter() - start) * 1000 / len(queries)
+    result.update(_retrieval_metrics(I, ground_truth, top_k, "first_stage"))
+
+    if index_type != "flat":
+        start = time.perf_counter()
+        _, candidates = index.search(queries, max(top_k, rerank_pool))
+        _, I = rerank_exact(queries, candidates, vectors, top_k)
+        result["reranked_search_ms_per_query"] = (time.perf_counter() - start) * 1000 / len(queries)
+        result.update(_retrieval_metrics(I, ground_truth, top_k, "reranked"))
+
+    return result
+
+
+def _retrieval_metrics(I: np.ndarray, ground_truth: np.ndarray, top_k: int, prefix: str) -> dict:
+    hits, num_relevant = hits_matrix(I.tolist(), ground_truth.tolist(), top_k)
+    metrics = compute_metrics(hits, num_relevant, (I >= 0).sum(axis=1))
+    top1, _ = hits_matrix(I[:, :1].tolist(), ground_truth[:, :1].tolist(), 1)
+    return {
+        f"{prefix}_recall@{top_k}": float(metrics["recall"].mean()),
+        f"{prefix}_ndcg@{top_k}": float(metrics["ndcg"].mean()),
+        f"{prefix}_top1_accuracy": float(top1.mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory reduction and recall loss of compressed text indexes")
+    parser.add_argument("--source", choices=["real", "synthetic"], default="real",
+                        help="real reconstructs vectors from the flat text index, synthetic generates them")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=TEXT_DIM)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--rerank-pool", type=int, default=RERANK_POOL)
+    parser.add_argument("--index-types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    vectors = load_corpus_vectors(args.source, args.size, args.dim, args.seed)
+    queries, _ = make_queries(vectors, args.queries, noise=args.noise, seed=args.seed)
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, ground_truth = exact.search(queries, args.top_k)
+
+    results = []
+    for index_type in args.index_types:
+        result = evaluate_index_type(vectors, queries, ground_truth, index_type, args.top_k, args.rerank_pool)
+        results.append(result)
+        line = (
+            f"{index_type:<6} {result['index_bytes'] / 1e6:>9.2f} MB "
+            f"({result['memory_reduction']:.1f}x)  "
+            f"recall@{args.top_k} {result[f'first_stage_recall@{args.top_k}']:.4f}"
+        )
+        if f"reranked_recall@{args.top_k}" in result:
+            line += f" -> {result[f'reranked_recall@{args.top_k}']:.4f} after re-ranking {args.rerank_pool}"
+        print(line)
+
+    params = {
+        "source": args.source,
+        "num_vectors": int(vectors.shape[0]),
+        "dim": int(vectors.shape[1]),
+        "num_queries": args.queries,
+        "noise": args.noise,
+        "top_k": args.top_k,
+        "rerank_pool": args.rerank_pool,
+        "pq_m": PQ_M,
+        "pq_nbits": PQ_NBITS,
+    }
+    output = args.output or BENCHMARK_RESULTS_DIR / f"compression_{args.source}_{git_commit()}.json"
+    write_results(output, "compression", params, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import generate_synthetic_corpus, make_queries, TEXT_DIM, IMAGE_DIM
+from benchmarks.utils import latency_summary, peak_rss_mb, git_commit, write_results
+from config import BENCHMARK_RESULTS_DIR, INDEX_TYPE, METADATA_BACKEND, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, TOP_K
+from vectorstore import QueryExecutor, VectorStore
+from vectorstore.quantization import INDEX_TYPES
+
+MODES = ["direct", "batched"]
+
+
+def default_thread_counts() -> list[int]:
+    cores = os.cpu_count() or 1
+    counts = [1]
+    while counts[-1] * 2 <= cores:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cores:
+        counts.append(cores)
+    return counts
+
+
+def run_clients(search, queries: np.ndarray, clients: int, duration: float) -> dict:
+    latencies = [[] for _ in range(clients)]
+    stop = threading.Event()
+    start_barrier = threading.Barrier(clients + 1)
+
+    def client(worker: int) -> None:
+        rng = np.random.default_rng(worker)
+        start_barrier.wait()
+        while not stop.is_set():
+            query = queries[rng.integers(0, len(queries))][np.newaxis, :]
+            start = time.perf_counter()
+            search(query)
+            latencies[worker].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client, args=(worker,)) for worker in range(clients)]
+    for thread in threads:
+        thread.start()
+    start_barrier.wait()
+    started = time.perf_counter()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = [latency for worker in latencies for latency in worker]
+    return {"qps": len(samples) / elapsed, **latency_summary(samples)}
+
+
+def run_benchmark(params: dict) -> list[dict]:
+    from tools.indexes import build_indexes
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        paths = {
+            "text_index_path": tmp / "text.index",
+            "image_index_path": tmp / "image.index",
+            "metadata_path": tmp / "unified_metadata.json",
+            "mmap_metadata_dir": tmp / "mmap",
+            "metadata_db_path": tmp / "metadata.db",
+            "text_vectors_path": tmp / "text_vectors.npy",
+            "image_vectors_path": tmp / "image_vectors.npy",
+            "text_shards_dir": tmp / "text_shards",
+        }
+
+        corpus = generate_synthetic_corpus(
+            params["size"],
+            text_dim=params["text_dim"],
+            image_dim=params["image_dim"],
+            words_per_chunk=params["words_per_chunk"],
+            seed=params["seed"]
+        )
+        queries, _ = make_queries(corpus["text_vectors"], params["num_queries"], seed=params["seed"])
+        build_indexes(
+            corpus["text_metadata"],
+            corpus["text_vectors"],
+            corpus["image_metadata"],
+            corpus["image_vectors"],
+            index_type=params["index_type"],
+            num_shards=1,
+            summary_cache_path=tmp / "summary_cache.jsonl",
+            summarize=False,
+            **paths
+        )
+        del corpus
+
+        store = VectorStore(metadata_backend=params["metadata_backend"], hosted_shards=None, diversify=False, **paths)
+        top_k = params["top_k"]
+
+        for threads in params["thread_counts"]:
+            # The budget is re-applied lazily in every searching thread.
+            store.threads = threads
+            for mode in params["modes"]:
+                executor = None
+                if mode == "batched":
+                    executor = QueryExecutor(store, params["max_batch"], params["max_wait_ms"])
+                    search_index = lambda query: executor.search(query, top_k)
+                else:
+                    search_index = lambda query: store.search_text_index(query, top_k)
+
+                def search(query):
+                    D, I = search_index(query)
+                    return store.resolve_text_hits(D, I)
+
+                result = {
+                    "threads": threads,
+                    "mode": mode,
+                    "clients": params["clients"],
+                    **run_clients(search, queries, params["clients"], params["duration"]),
+                }
+                if executor is not None:
+                    result["mean_batch_size"] = executor.mean_batch_size
+                    executor.close()
+                results.append(result)
+                print(
+                    f"{threads:>3} threads {mode:<8}: {result['qps']:>8.1f} q/s, "
+                    f"p50 {result['p50_ms']:.2f}ms, p99 {result['p99_ms']:.2f}ms"
+                    + (f", mean batch {result['mean_batch_size']:.1f}" if "mean_batch_size" in result else "")
+                )
+        store.close()
+
+    for mode in params["modes"]:
+        rows = [r for r in results if r["mode"] == mode]
+        for r in rows:
+            r["speedup"] = r["qps"] / rows[0]["qps"] if rows[0]["qps"] else 0.0
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search throughput under concurrent clients as the FAISS thread budget grows")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--threads", type=int, nargs="+", default=default_thread_counts(),
+                        help="FAISS/OpenMP thread budgets to measure (default 1, 2, 4 ... cores)")
+    parser.add_argument("--modes", choices=MODES, nargs="+", default=MODES)
+    parser.add_argument("--clients", type=int, default=2 * (os.cpu_count() or 1),
+                        help="concurrent client threads issuing single queries")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per measurement")
+    parser.add_argument("--max-batch", type=int, default=QUERY_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=QUERY_BATCH_WAIT_MS)
+    parser.add_argument("--queries", type=int, default=1024)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--text-dim", type=int, default=TEXT_DIM)
+    parser.add_argument("--image-dim", type=int, default=IMAGE_DIM)
+    parser.add_argument("--words-per-chunk", type=int, default=50)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--metadata-backend", choices=["json", "mmap", "sqlite"], default=METADATA_BACKEND)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    params = {
+        "size": args.size,
+        "thread_counts": args.threads,
+        "modes": args.modes,
+        "clients": args.clients,
+        "duration": args.duration,
+        "max_batch": args.max_batch,
+        "max_wait_ms": args.max_wait_ms,
+        "num_queries": args.queries,
+        "top_k": args.top_k,
+        "text_dim": args.text_dim,
+        "image_dim": args.image_dim,
+        "words_per_chunk": args.words_per_chunk,
+        "index_type": args.index_type,
+        "metadata_backend": args.metadata_backend,
+        "seed": args.seed,
+    }
+    results = run_benchmark(params)
+    print(f"Peak RSS {peak_rss_mb():.0f}MB")
+
+    output = args.output or BENCHMARK_RESULTS_DIR / f"concurrency_{args.index_type}_{git_commit()}.json"
+    write_results(output, "concurrency", params, results)
+
+
+if __name__ == "__main__":
+    main()
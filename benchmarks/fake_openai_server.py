@@ -0,0 +1,192 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+from typing import Optional
+
+import numpy as np
+
+from aiohttp import web
+
+TITLE_PATTERN = re.compile(r'article title: "([^"]+)"')
+EMBEDDING_DIM = 1536
+LATENCY_DISTRIBUTIONS = ["uniform", "lognormal", "exponential"]
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+
+
+def _count_tokens(text: str) -> int:
+    return max(1, len(text.split()))
+
+
+def fake_chat_content(prompt: str) -> str:
+    match = TITLE_PATTERN.search(prompt)
+    if match:
+        title = match.group(1)
+        return json.dumps({
+            "direct": title,
+            "paraphrased": f"news about {title.lower()}",
+            "noisy": f"recent developments related to {' '.join(title.lower().split()[:2])}"
+        })
+
+    rng = random.Random(_seed(prompt))
+    words = re.findall(r"[A-Za-z]{4,}", prompt) or ["context"]
+    return " ".join(rng.choice(words) for _ in range(60)) + "."
+
+
+def fake_embedding(text: str, dim: int = EMBEDDING_DIM) -> list[float]:
+    vector = np.random.default_rng(_seed(text)).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+class LatencyModel:
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 0.0,
+        distribution: str = "uniform",
+        sigma: float = 0.5,
+        slow_rate: float = 0.0,
+        slow_ms: float = 0.0
+    ):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.distribution = distribution
+        self.sigma = sigma
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+
+    def sample(self, rng: random.Random) -> float:
+        # latency_ms is the median for lognormal and the mean for exponential.
+        if self.distribution == "lognormal":
+            delay = self.latency_ms * rng.lognormvariate(0.0, self.sigma)
+        elif self.distribution == "exponential":
+            delay = rng.expovariate(1.0 / self.latency_ms) if self.latency_ms > 0 else 0.0
+        else:
+            delay = self.latency_ms + rng.uniform(-self.jitter_ms, self.jitter_ms)
+        # Stragglers on top of the base distribution, e.g. a slow replica.
+        if self.slow_rate and rng.random() < self.slow_rate:
+            delay += self.slow_ms
+        return max(0.0, delay)
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+        chat_latency: Optional[LatencyModel] = None,
+        embedding_latency: Optional[LatencyModel] = None
+    ):
+        self.chat_latency = chat_latency or LatencyModel(latency_ms, jitter_ms)
+        self.embedding_latency = embedding_latency or self.chat_latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.requests = 0
+
+    async def _delay(self, model: Optional[LatencyModel] = None):
+        await asyncio.sleep((model or self.chat_latency).sample(self.rng) / 1000)
+
+    def _rate_limited(self) -> bool:
+        return self.rng.random() < self.error_rate
+
+    def _rate_limit_response(self) -> web.Response:
+        return web.json_response({"error": {"message": "Rate limit reached", "type": "rate_limit"}}, status=429)
+
+    async def embeddings(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        await self._delay(self.embedding_latency)
+        if self._rate_limited():
+            return self._rate_limit_response()
+
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = body.get("dimensions") or EMBEDDING_DIM
+        tokens = sum(_count_tokens(text) for text in inputs)
+        return web.json_response({
+            "object": "list",
+            "model": body.get("model", "fake"),
+            "data": [
+                {"object": "embedding", "index": i, "embedding": fake_embedding(text, dim)}
+                for i, text in enumerate(inputs)
+            ],
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens}
+        })
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        await self._delay()
+        if self._rate_limited():
+            return self._rate_limit_response()
+
+        prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+        content = fake_chat_content(prompt)
+        prompt_tokens, completion_tokens = _count_tokens(prompt), _count_tokens(content)
+        return web.json_response({
+            "id": f"chatcmpl-fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        app.router.add_post("/v1/embeddings", self.embeddings)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI stand-in with deterministic outputs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="chat completion latency")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="+/- range for the uniform distribution")
+    parser.add_argument("--embedding-latency-ms", type=float, default=None, help="defaults to --latency-ms")
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-space spread of the lognormal distribution")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests delayed by --slow-ms")
+    parser.add_argument("--slow-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def latency_model(latency_ms: float) -> LatencyModel:
+        return LatencyModel(latency_ms, args.jitter_ms, args.distribution, args.sigma, args.slow_rate, args.slow_ms)
+
+    embedding_latency_ms = args.latency_ms if args.embedding_latency_ms is None else args.embedding_latency_ms
+    server = FakeOpenAIServer(
+        error_rate=args.error_rate,
+        seed=args.seed,
+        chat_latency=latency_model(args.latency_ms),
+        embedding_latency=latency_model(embedding_latency_ms)
+    )
+    print(f"Fake OpenAI server on http://{args.host}:{args.port}/v1", flush=True)
+    web.run_app(server.app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from benchmarks.fake_openai_server import LATENCY_DISTRIBUTIONS
+from benchmarks.utils import current_rss_mb, git_commit, latency_summary, peak_rss_mb, write_results
+from config import BENCHMARK_RESULTS_DIR, QUERY_DEADLINE_S, QUERY_EXPANSION_PATH, TOP_K
+from config.paths import BASE_DIR
+from tools.records import read_queries
+
+
+def start_fake_server(params: dict) -> subprocess.Popen:
+    # A separate process, so the CPU and RSS samples below belong to the
+    # system under test and not to the stand-in.
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    command = [
+        sys.executable, "-m", "benchmarks.fake_openai_server",
+        "--port", str(port),
+        "--latency-ms", str(params["chat_latency_ms"]),
+        "--embedding-latency-ms", str(params["embedding_latency_ms"]),
+        "--jitter-ms", str(params["jitter_ms"]),
+        "--distribution", params["distribution"],
+        "--sigma", str(params["sigma"]),
+        "--slow-rate", str(params["slow_rate"]),
+        "--slow-ms", str(params["slow_ms"]),
+        "--error-rate", str(params["error_rate"]),
+        "--seed", str(params["seed"]),
+    ]
+    server = subprocess.Popen(command, cwd=BASE_DIR)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            params["base_url"] = f"http://127.0.0.1:{port}/v1"
+            return server
+        except OSError:
+            if server.poll() is not None:
+                raise RuntimeError("Fake OpenAI server exited during startup")
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Fake OpenAI server did not start")
+
+
+class ResourceSampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = []
+        self.completed = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self.completed += 1
+            self.errors += not ok
+
+    def _run(self) -> None:
+        start = last_wall = time.perf_counter()
+        last_cpu = time.process_time()
+        last_completed = last_errors = 0
+        while not self._stop.wait(self.interval):
+            wall, cpu = time.perf_counter(), time.process_time()
+            with self._lock:
+                completed, errors = self.completed, self.errors
+            elapsed = wall - last_wall
+            self.samples.append({
+                "t_s": wall - start,
+                "cpu_percent": (cpu - last_cpu) / elapsed * 100,
+                "rss_mb": current_rss_mb(),
+                "throughput_qps": (completed - last_completed) / elapsed,
+                "errors": errors - last_errors,
+            })
+            last_wall, last_cpu, last_completed, last_errors = wall, cpu, completed, errors
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def arrival_times(rate: float, duration: float, poisson: bool, seed: int) -> np.ndarray:
+    count = int(rate * duration)
+    if not poisson:
+        return np.arange(count) / rate
+    gaps = np.random.default_rng(seed).exponential(1.0 / rate, size=count)
+    return np.cumsum(gaps) - gaps[0]
+
+
+def run_load(queries: list[str], params: dict) -> dict:
+    from rag import generate_answer
+    from rag.retriever import MultimodalRetriever
+    import rag.retriever
+
+    if params["no_clip"]:
+        rag.retriever._retriever = MultimodalRetriever(load_clip=False)
+    else:
+        rag.retriever.get_retriever()
+
+    schedule = arrival_times(params["rate"], params["duration"], params["poisson"], params["seed"])
+    latencies, outcomes = [], {"ok": 0, "degraded": 0, "upstream_failed": 0, "error": 0}
+    errors = {}
+    lock = threading.Lock()
+
+    def request(query: str, scheduled: float, sampler: ResourceSampler) -> None:
+        try:
+            result = generate_answer(query, top_k=params["top_k"], deadline=params["deadline"] or None)
+            # Chat completions that failed after every retry come back as
+            # retrieval-only answers; they count as errors, not as degraded.
+            if result.get("upstream_error"):
+                outcome = "upstream_failed"
+                with lock:
+                    errors[result["upstream_error"]] = errors.get(result["upstream_error"], 0) + 1
+            else:
+                outcome = "degraded" if result.get("degraded") else "ok"
+        except Exception as e:
+            outcome = "error"
+            with lock:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+        # Latency counts from the scheduled send time, so time spent queued
+        # behind a saturated system is not hidden (coordinated omission).
+        latency = time.perf_counter() - scheduled
+        with lock:
+            latencies.append(latency)
+            outcomes[outcome] += 1
+        sampler.record(outcome not in ("error", "upstream_failed"))
+
+    with ResourceSampler(params["sample_interval"]) as sampler, \
+            ThreadPoolExecutor(max_workers=params["max_in_flight"], thread_name_prefix="load") as executor:
+        start = time.perf_counter()
+        for i, offset in enumerate(schedule):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(request, queries[i % len(queries)], start + offset, sampler)
+        executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - start
+
+    total = len(latencies)
+    return {
+        "requests": total,
+        "elapsed_s": elapsed,
+        "offered_qps": params["rate"],
+        "achieved_qps": total / elapsed if elapsed else 0.0,
+        "latency": latency_summary(latencies),
+        "ok": outcomes["ok"],
+        "degraded": outcomes["degraded"],
+        "error_rate": (outcomes["error"] + outcomes["upstream_failed"]) / total if total else 0.0,
+        "upstream_failure_rate": outcomes["upstream_failed"] / total if total else 0.0,
+        "errors": errors,
+        "peak_rss_mb": peak_rss_mb(),
+        "timeline": sampler.samples,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a query log against generate_answer at a target request rate")
+    parser.add_argument("--queries", default=str(QUERY_EXPANSION_PATH),
+                        help="query log: generated evaluation queries .json, .jsonl with a query field or one per line")
+    parser.add_argument("--rate", type=float, default=5.0, help="target requests per second")
+    parser.add_argument("--duration", type=float, default=60.0, help="seconds of load")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times instead of a fixed rate")
+    parser.add_argument("--max-in-flight", type=int, default=64)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--deadline", type=float, default=QUERY_DEADLINE_S, help="per-query deadline (0 disables)")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="seconds between CPU/RSS samples")
+    parser.add_argument("--no-clip", action="store_true", help="skip loading CLIP (no image re-ranking)")
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint to use; by default a local fake server is started")
+    parser.add_argument("--chat-latency-ms", type=float, default=800.0)
+    parser.add_argument("--embedding-latency-ms", type=float, default=60.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--distribution", choices=LATENCY_DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--sigma", type=float, default=0.4)
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    queries = read_queries(args.queries)
+    if not queries:
+        raise SystemExit(f"No queries in {args.queries}")
+
+    params = {
+        "queries": args.queries,
+        "num_queries": len(queries),
+        "rate": args.rate,
+        "duration": args.duration,
+        "poisson": args.poisson,
+        "max_in_flight": args.max_in_flight,
+        "top_k": args.top_k,
+        "deadline": args.deadline,
+        "sample_interval": args.sample_interval,
+        "no_clip": args.no_clip,
+        "base_url": args.base_url,
+        "chat_latency_ms": args.chat_latency_ms,
+        "embedding_latency_ms": args.embedding_latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "distribution": args.distribution,
+        "sigma": args.sigma,
+        "slow_rate": args.slow_rate,
+        "slow_ms": args.slow_ms,
+        "error_rate": args.error_rate,
+        "seed": args.seed,
+    }
+
+    server: Optional[subprocess.Popen] = None
+    if args.base_url is None:
+        server = start_fake_server(params)
+    # The OpenAI clients read the endpoint when rag is first imported.
+    os.environ["OPENAI_BASE_URL"] = params["base_url"]
+
+    try:
+        result = run_load(queries, params)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    latency = result["latency"]
+    print(
+        f"{result['requests']} requests in {result['elapsed_s']:.1f}s: "
+        f"{result['achieved_qps']:.2f} q/s of {args.rate:.2f} offered, "
+        f"p50 {latency.get('p50_ms', 0):.0f}ms, p95 {latency.get('p95_ms', 0):.0f}ms, p99 {latency.get('p99_ms', 0):.0f}ms, "
+        f"errors {result['error_rate']:.1%} ({result['upstream_failure_rate']:.1%} upstream failures "
+        f"answered retrieval-only), retrieval-only {result['degraded']}"
+    )
+    for sample in result["timeline"]:
+        print(
+            f"  t={sample['t_s']:>6.1f}s  {sample['throughput_qps']:>6.2f} q/s  "
+            f"CPU {sample['cpu_percent']:>5.0f}%  RSS {sample['rss_mb']:>7.0f}MB  errors {sample['errors']}"
+        )
+
+    output = args.output or BENCHMARK_RESULTS_DIR / f"load_{git_commit()}.json"
+    write_results(output, "load", params, [result])
+
+
+if __name__ == "__main__":
+    main()
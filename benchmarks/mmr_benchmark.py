@@ -0,0 +1,105 @@
+import argparse
+import time
+
+from pathlib import Path
+
+import numpy as np
+
+from benchmarks.synthetic_corpus import TEXT_DIM
+from benchmarks.utils import git_commit, latency_summary, write_results
+from config import BENCHMARK_RESULTS_DIR, MMR_LAMBDA, TOP_K
+from vectorstore.diversity import mmr_rerank, mmr_select
+
+DEFAULT_POOLS = [50, 100, 200, 300, 500]
+BUDGET_MS = 1.0
+
+
+def clustered_pool(pool_size: int, dim: int, windows_per_article: int, rng: np.random.Generator):
+    # Overlapping windows of one article are near-copies of a shared centre,
+    # which is exactly what crowds the plain top_k.
+    num_articles = -(-pool_size // windows_per_article)
+    centres = rng.standard_normal((num_articles, dim), dtype=np.float32)
+    articles = np.repeat(np.arange(num_articles), windows_per_article)[:pool_size]
+    vectors = centres[articles] + 0.3 * rng.standard_normal((pool_size, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    query = centres[: max(1, num_articles // 4)].sum(axis=0) + rng.standard_normal(dim, dtype=np.float32)
+    query /= np.linalg.norm(query)
+    return query.astype("float32"), vectors, articles
+
+
+def run_pool(pool_size: int, params: dict) -> dict:
+    rng = np.random.default_rng([params["seed"], pool_size])
+    top_k = params["top_k"]
+    lambda_ = params["lambda"]
+
+    select_latencies, rerank_latencies = [], []
+    plain_articles, mmr_articles = [], []
+    for _ in range(params["repeats"]):
+        query, vectors, articles = clustered_pool(pool_size, params["dim"], params["windows"], rng)
+        candidates = np.argsort(-(vectors @ query))[np.newaxis, :]
+        pool_vectors = vectors[candidates[0]]
+
+        start = time.perf_counter()
+        picked = mmr_select(query, pool_vectors, top_k, lambda_)
+        select_latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        mmr_rerank(query[np.newaxis, :], candidates, lambda rows: vectors[rows], top_k, lambda_)
+        rerank_latencies.append(time.perf_counter() - start)
+
+        plain_articles.append(len(set(articles[candidates[0, :top_k]])))
+        mmr_articles.append(len(set(articles[candidates[0, picked]])))
+
+    select = latency_summary(select_latencies)
+    return {
+        "pool_size": pool_size,
+        "mmr_select": select,
+        "mmr_rerank_with_lookup": latency_summary(rerank_latencies),
+        "within_budget": select["p99_ms"] < BUDGET_MS,
+        "distinct_articles_plain": float(np.mean(plain_articles)),
+        "distinct_articles_mmr": float(np.mean(mmr_articles)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of vectorized MMR diversification over candidate pools")
+    parser.add_argument("--pools", type=int, nargs="+", default=DEFAULT_POOLS)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--lambda", dest="lambda_", type=float, default=MMR_LAMBDA)
+    parser.add_argument("--dim", type=int, default=TEXT_DIM)
+    parser.add_argument("--windows", type=int, default=4, help="overlapping chunks per synthetic article")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    params = {
+        "pools": args.pools,
+        "top_k": args.top_k,
+        "lambda": args.lambda_,
+        "dim": args.dim,
+        "windows": args.windows,
+        "repeats": args.repeats,
+        "seed": args.seed,
+    }
+
+    results = []
+    for pool_size in args.pools:
+        result = run_pool(pool_size, params)
+        results.append(result)
+        print(
+            f"pool {pool_size:>4}: select p50 {result['mmr_select']['p50_ms']:.3f}ms "
+            f"p99 {result['mmr_select']['p99_ms']:.3f}ms, "
+            f"with lookup p50 {result['mmr_rerank_with_lookup']['p50_ms']:.3f}ms, "
+            f"distinct articles in top {args.top_k}: "
+            f"{result['distinct_articles_plain']:.2f} -> {result['distinct_articles_mmr']:.2f}"
+            f"{'' if result['within_budget'] else '  (over budget)'}"
+        )
+
+    output = args.output or BENCHMARK_RESULTS_DIR / f"mmr_{git_commit()}.json"
+    write_results(output, "mmr", params, results)
+
+
+if __name__ == "__main__":
+    main()
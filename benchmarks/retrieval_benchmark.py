@@ -0,0 +1,226 @@
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import faiss
+
+from benchmarks.synthetic_corpus import generate_synthetic_corpus, make_queries, TEXT_DIM, IMAGE_DIM
+from benchmarks.utils import latency_summary, peak_rss_mb, git_commit, write_results
+from config import BENCHMARK_RESULTS_DIR, DEFAULT_CORPUS, INDEX_TYPE, METADATA_BACKEND, NUM_SHARDS, RERANK_POOL, SERVING_MODE, TOP_K
+from vectorstore.quantization import INDEX_TYPES
+
+DEFAULT_SIZES = [10_000, 100_000]
+DEFAULT_BATCH_SIZES = [1, 8, 32, 128]
+
+
+def run_size(num_vectors: int, params: dict) -> dict:
+    from rag.retriever import MultimodalRetriever
+    from tools.indexes import build_indexes
+
+    result = {"num_vectors": num_vectors}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        text_index_path = tmp / "text.index"
+        image_index_path = tmp / "image.index"
+        metadata_path = tmp / "unified_metadata.json"
+        mmap_metadata_dir = tmp / "mmap"
+        metadata_db_path = tmp / "metadata.db"
+        text_vectors_path = tmp / "text_vectors.npy"
+        image_vectors_path = tmp / "image_vectors.npy"
+        text_shards_dir = tmp / "text_shards"
+
+        start = time.perf_counter()
+        corpus = generate_synthetic_corpus(
+            num_vectors,
+            text_dim=params["text_dim"],
+            image_dim=params["image_dim"],
+            words_per_chunk=params["words_per_chunk"],
+            seed=params["seed"]
+        )
+        result["corpus_generation_s"] = time.perf_counter() - start
+        queries, _ = make_queries(corpus["text_vectors"], params["num_queries"], seed=params["seed"])
+
+        start = time.perf_counter()
+        build_indexes(
+            corpus["text_metadata"],
+            corpus["text_vectors"],
+            corpus["image_metadata"],
+            corpus["image_vectors"],
+            text_index_path=text_index_path,
+            image_index_path=image_index_path,
+            metadata_path=metadata_path,
+            mmap_metadata_dir=mmap_metadata_dir,
+            metadata_db_path=metadata_db_path,
+            text_vectors_path=text_vectors_path,
+            image_vectors_path=image_vectors_path,
+            index_type=params["index_type"],
+            num_shards=params["shards"],
+            text_shards_dir=text_shards_dir,
+            summary_cache_path=tmp / "summary_cache.jsonl",
+            summarize=False
+        )
+        result["index_build_s"] = time.perf_counter() - start
+        del corpus
+
+        if params["shards"] > 1:
+            result["text_index_bytes"] = sum(path.stat().st_size for path in text_shards_dir.glob("*.index"))
+        else:
+            result["text_index_bytes"] = text_index_path.stat().st_size
+            start = time.perf_counter()
+            faiss.read_index(str(text_index_path))
+            result["text_index_load_s"] = time.perf_counter() - start
+        result["metadata_bytes"] = metadata_path.stat().st_size
+        result["metadata_db_bytes"] = metadata_db_path.stat().st_size
+
+        start = time.perf_counter()
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            json.load(f)
+        result["metadata_load_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        retriever = MultimodalRetriever(
+            corpora={DEFAULT_CORPUS: tmp},
+            serving_mode=params["serving_mode"],
+            metadata_backend=params["metadata_backend"],
+            rerank_pool=params["rerank_pool"],
+            hosted_shards=None,
+            load_clip=False
+        )
+        result["retriever_init_s"] = time.perf_counter() - start
+
+        top_k = params["top_k"]
+
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            retriever.search_text(query, top_k)
+            latencies.append(time.perf_counter() - start)
+        result["single_search"] = latency_summary(latencies)
+
+        result["batched_search"] = {}
+        for batch_size in params["batch_sizes"]:
+            batch_latencies = []
+            for offset in range(0, len(queries) - batch_size + 1, batch_size):
+                start = time.perf_counter()
+                retriever.search_text_batch(queries[offset:offset + batch_size], top_k)
+                batch_latencies.append(time.perf_counter() - start)
+            summary = latency_summary(batch_latencies)
+            if batch_latencies:
+                summary["per_query_mean_ms"] = summary["mean_ms"] / batch_size
+            result["batched_search"][str(batch_size)] = summary
+
+        D, I = retriever.search_text_index(queries, top_k)
+        resolve_latencies = []
+        with retriever.corpus() as loaded:
+            for q in range(I.shape[0]):
+                start = time.perf_counter()
+                loaded.store.resolve_text_hits(D[q], I[q])
+                resolve_latencies.append(time.perf_counter() - start)
+        result["metadata_resolution"] = latency_summary(resolve_latencies)
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_benchmark(params: dict) -> list[dict]:
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for num_vectors in params["sizes"]:
+        print(f"Benchmarking synthetic corpus with {num_vectors} vectors...")
+        # Fresh process per size so peak RSS is not inherited from larger runs.
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            result = executor.submit(run_size, num_vectors, params).result()
+        print(
+            f"  build {result['index_build_s']:.2f}s, "
+            f"init {result['retriever_init_s']:.2f}s, "
+            f"search p50 {result['single_search']['p50_ms']:.2f}ms, "
+            f"p99 {result['single_search']['p99_ms']:.2f}ms, "
+            f"peak RSS {result['peak_rss_mb']:.0f}MB"
+        )
+        results.append(result)
+    return results
+
+
+def _flatten(result: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare_results(base_path: Path, new_path: Path) -> None:
+    base = json.loads(Path(base_path).read_text(encoding="utf-8"))
+    new = json.loads(Path(new_path).read_text(encoding="utf-8"))
+    print(f"Comparing {base['environment']['commit']} -> {new['environment']['commit']}")
+
+    base_by_size = {r["num_vectors"]: _flatten(r) for r in base["results"]}
+    for result in new["results"]:
+        size = result["num_vectors"]
+        if size not in base_by_size:
+            continue
+        print(f"\n{size} vectors")
+        old_flat = base_by_size[size]
+        for key, value in _flatten(result).items():
+            old = old_flat.get(key)
+            if key == "num_vectors" or old is None or key.endswith(".count"):
+                continue
+            change = (value - old) / old * 100 if old else 0.0
+            print(f"  {key:<45}{old:>14.3f}{value:>14.3f}{change:>+10.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval microbenchmarks on synthetic corpora")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=DEFAULT_BATCH_SIZES)
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--text-dim", type=int, default=TEXT_DIM)
+    parser.add_argument("--image-dim", type=int, default=IMAGE_DIM)
+    parser.add_argument("--words-per-chunk", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--serving-mode", choices=["heap", "mmap"], default=SERVING_MODE)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE)
+    parser.add_argument("--rerank-pool", type=int, default=RERANK_POOL)
+    parser.add_argument("--metadata-backend", choices=["json", "mmap", "sqlite"], default=METADATA_BACKEND)
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", type=Path, nargs=2, metavar=("BASE", "NEW"))
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+
+    params = {
+        "sizes": args.sizes,
+        "num_queries": args.queries,
+        "batch_sizes": args.batch_sizes,
+        "top_k": args.top_k,
+        "text_dim": args.text_dim,
+        "image_dim": args.image_dim,
+        "words_per_chunk": args.words_per_chunk,
+        "seed": args.seed,
+        "serving_mode": args.serving_mode,
+        "metadata_backend": args.metadata_backend,
+        "index_type": args.index_type,
+        "rerank_pool": args.rerank_pool,
+        "shards": args.shards,
+    }
+    results = run_benchmark(params)
+
+    sharding = f"_{args.shards}shards" if args.shards > 1 else ""
+    output = args.output or BENCHMARK_RESULTS_DIR / f"retrieval_{args.index_type}_{args.serving_mode}_{args.metadata_backend}{sharding}_{git_commit()}.json"
+    write_results(output, "retrieval", params, results)
+
+
+if __name__ == "__main__":
+    main()
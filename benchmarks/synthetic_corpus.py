@@ -0,0 +1,81 @@
+import numpy as np
+
+TEXT_DIM = 1536
+IMAGE_DIM = 768
+FIRST_ISSUE = 1
+BLOCK_SIZE = 65536
+
+VOCABULARY = np.array(
+    "model agent data training inference benchmark chip policy research robot "
+    "language vision reasoning token compute energy startup regulation dataset "
+    "open weights cloud latency accuracy safety market investment image video "
+    "speech search retrieval embedding context memory evaluation hardware".split()
+)
+
+
+def fake_embeddings(num_vectors: int, dim: int, seed: int = 0) -> np.ndarray:
+    vectors = np.empty((num_vectors, dim), dtype="float32")
+    for block, start in enumerate(range(0, num_vectors, BLOCK_SIZE)):
+        end = min(start + BLOCK_SIZE, num_vectors)
+        rng = np.random.default_rng([seed, block])
+        vectors[start:end] = rng.standard_normal((end - start, dim), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+
+def fake_chunk(rng: np.random.Generator, words: int) -> str:
+    return " ".join(VOCABULARY[rng.integers(0, len(VOCABULARY), size=words)])
+
+
+def generate_synthetic_corpus(
+    num_text: int,
+    text_dim: int = TEXT_DIM,
+    image_dim: int = IMAGE_DIM,
+    chunks_per_article: int = 3,
+    articles_per_issue: int = 4,
+    words_per_chunk: int = 300,
+    seed: int = 0
+) -> dict:
+    rng = np.random.default_rng(seed)
+
+    text_metadata = []
+    image_metadata = []
+    for row in range(num_text):
+        article = row // chunks_per_article
+        issue = FIRST_ISSUE + article // articles_per_issue
+        title = f"Synthetic Article {article}"
+        text_metadata.append({
+            "issue": issue,
+            "title": title,
+            "url": f"https://example.com/the-batch/issue-{issue}/",
+            "chunk": fake_chunk(rng, words_per_chunk),
+            "content_type": "text"
+        })
+        if row % chunks_per_article == 0:
+            image_metadata.append({
+                "issue": issue,
+                "title": title,
+                "url": f"https://example.com/the-batch/issue-{issue}/",
+                "image_path": f"issue-{issue}_synthetic-article-{article}.jpg",
+                "content_type": "image"
+            })
+
+    return {
+        "text_metadata": text_metadata,
+        "text_vectors": fake_embeddings(num_text, text_dim, seed),
+        "image_metadata": image_metadata,
+        "image_vectors": fake_embeddings(len(image_metadata), image_dim, seed + 1),
+    }
+
+
+def make_queries(
+    vectors: np.ndarray,
+    num_queries: int,
+    noise: float = 0.05,
+    seed: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng([seed, 1])
+    rows = rng.integers(0, vectors.shape[0], size=num_queries)
+    queries = vectors[rows] + noise * rng.standard_normal((num_queries, vectors.shape[1]), dtype=np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.ascontiguousarray(queries, dtype="float32"), rows
@@ -6,6 +6,17 @@ from .config import (
     CHUNK_SIZE,
     CHUNK_OVERLAP,
 
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    MINHASH_PERMUTATIONS,
+    LSH_BANDS,
+    SHINGLE_SIZE,
+
+    IMAGE_DERIVATIVES,
+    IMAGE_FORMAT,
+    IMAGE_QUALITY,
+    IMAGE_CACHE_SIZE,
+
     OPENAI_API_KEY,
     TEXT_EMBEDDING_MODEL,
     IMAGE_EMBEDDING_MODEL,
@@ -13,6 +24,65 @@ from .config import (
     TEMPERATURE_STRICT,
     TEMPERATURE_CREATIVE,
     TOP_K,
+
+    TRACING_ENABLED,
+    TRACE_WINDOW,
+
+    SERVING_MODE,
+    METADATA_BACKEND,
+    METADATA_CACHE_SIZE,
+
+    INDEX_TYPE,
+    PQ_M,
+    PQ_NBITS,
+    RERANK_POOL,
+
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_POOL,
+
+    NUM_SHARDS,
+    SHARD_BY,
+    HOSTED_SHARDS,
+    SHARD_WORKERS,
+    SHARD_EXECUTOR,
+
+    FAISS_THREADS,
+    QUERY_BATCHING,
+    QUERY_BATCH_SIZE,
+    QUERY_BATCH_WAIT_MS,
+
+    DEFAULT_CORPUS,
+    CORPUS_MEMORY_BUDGET_MB,
+    SNAPSHOT_KEEP,
+    SNAPSHOT_POLL_S,
+    SNAPSHOT_VERIFY,
+
+    QUERY_DEADLINE_S,
+    OPENAI_REQUEST_TIMEOUT_S,
+    OPENAI_MAX_ATTEMPTS,
+    RETRY_BACKOFF_S,
+    RETRY_BACKOFF_MAX_S,
+    HEDGE_ENABLED,
+    HEDGE_PERCENTILE,
+    HEDGE_INITIAL_DELAY_S,
+    HEDGE_MAX_IN_FLIGHT,
+    GENERATION_PERCENTILE,
+    GENERATION_MIN_BUDGET_S,
+    LATENCY_MIN_SAMPLES,
+    LATENCY_WINDOW,
+
+    EMBED_BATCH_SIZE,
+    BATCH_CONCURRENCY,
+
+    EVAL_CONCURRENCY,
+    EVAL_BATCH_SIZE,
+
+    QUERY_GEN_CONCURRENCY,
+    QUERY_GEN_MAX_ATTEMPTS,
+
+    SUMMARY_CONCURRENCY,
+    SUMMARY_MAX_ATTEMPTS,
 )
 from .paths import (
     RAW_JSON,
@@ -23,9 +93,22 @@ from .paths import (
     IMAGE_EMBEDDINGS_PATH,
     TEXT_INDEX_PATH,
     IMAGE_INDEX_PATH,
+    TEXT_SHARDS_DIR,
+    INDEXES_DIR,
+    CORPORA_DIR,
+    TEXT_VECTORS_PATH,
+    IMAGE_VECTORS_PATH,
     UNIFIED_METADATA_PATH,
+    MMAP_METADATA_DIR,
+    METADATA_DB_PATH,
     QUERY_EXPANSION_PATH,
+    QUERY_CACHE_PATH,
+    SUMMARY_CACHE_PATH,
+    EVALUATION_RESULTS_PATH,
+    EVALUATION_CHECKPOINT_PATH,
+    BENCHMARK_RESULTS_DIR,
 )
 from .rag_prompt import RAG_PROMPT
 from .system_prompt import SYSTEM_PROMPT
 from .generate_queries_prompt import GENERATE_QUERIES_PROMPT
+from .summary_prompt import SUMMARY_PROMPT
@@ -22,3 +22,117 @@ NUM_ARTICLES = 10
 
 CHUNK_SIZE = 300
 CHUNK_OVERLAP = 50
+
+# Near-duplicate chunk detection before embedding: MinHash signatures over
+# SHINGLE_SIZE-word shingles, LSH_BANDS bands, estimated Jaccard threshold.
+DEDUP_ENABLED = os.getenv("RAG_DEDUP", "true").lower() in ("1", "true", "yes")
+DEDUP_THRESHOLD = 0.8
+MINHASH_PERMUTATIONS = 128
+LSH_BANDS = 32
+SHINGLE_SIZE = 5
+
+# Image derivatives written by preprocessing; the app shows thumbnails in the
+# result list and the display size next to the answer.
+IMAGE_DERIVATIVES = {"thumbnail": (160, 160), "display": (512, 512)}
+IMAGE_FORMAT = "WEBP"
+IMAGE_QUALITY = 80
+IMAGE_CACHE_SIZE = 128
+
+TRACING_ENABLED = os.getenv("RAG_TRACING", "false").lower() in ("1", "true", "yes")
+TRACE_WINDOW = 1000
+
+# "heap" reads indexes into process memory; "mmap" maps them read-only so
+# several processes on one host share the same pages.
+SERVING_MODE = os.getenv("RAG_SERVING_MODE", "heap")
+
+# "sqlite" keeps chunk text on disk and fetches only the hit rows per query,
+# "mmap" uses the memory-mapped record layout, "json" loads everything.
+METADATA_BACKEND = os.getenv("RAG_METADATA_BACKEND", "sqlite")
+METADATA_CACHE_SIZE = 1024
+
+# "flat" stores float32 vectors in the index; "fp16", "sq8" and "pq" store
+# compressed codes and re-rank a RERANK_POOL of candidates exactly against the
+# full-precision vectors memory-mapped from disk.
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat")
+PQ_M = 64
+PQ_NBITS = 8
+RERANK_POOL = 100
+
+# Maximal Marginal Relevance: over-fetch MMR_POOL candidates and pick top_k
+# trading relevance (MMR_LAMBDA) against similarity to already picked chunks.
+MMR_ENABLED = os.getenv("RAG_MMR", "false").lower() in ("1", "true", "yes")
+MMR_LAMBDA = 0.7
+MMR_POOL = 50
+
+# Text index sharding. Building with --shards N writes N shards (by issue range
+# or by hash of the chunk id) plus a manifest; the retriever fans out over the
+# shards it hosts (RAG_HOSTED_SHARDS=shard_000,shard_001, default all).
+NUM_SHARDS = 1
+SHARD_BY = "issue"
+HOSTED_SHARDS = [name.strip() for name in os.getenv("RAG_HOSTED_SHARDS", "").split(",") if name.strip()] or None
+SHARD_WORKERS = int(os.getenv("RAG_SHARD_WORKERS", "4"))
+SHARD_EXECUTOR = os.getenv("RAG_SHARD_EXECUTOR", "thread")
+
+# Search threads per process (RAG_FAISS_THREADS, 0 = all cores). With several
+# web worker processes on one host give each cores / processes, so FAISS's
+# OpenMP teams do not oversubscribe the machine. Concurrent queries in a
+# process are coalesced into batches of up to QUERY_BATCH_SIZE, waiting at most
+# QUERY_BATCH_WAIT_MS for more (0 only batches what queued during a search).
+FAISS_THREADS = int(os.getenv("RAG_FAISS_THREADS", "0"))
+QUERY_BATCHING = os.getenv("RAG_QUERY_BATCHING", "true").lower() in ("1", "true", "yes")
+QUERY_BATCH_SIZE = 32
+QUERY_BATCH_WAIT_MS = float(os.getenv("RAG_QUERY_BATCH_WAIT_MS", "0"))
+
+# Named corpora: data/indexes is "default", every data/corpora/<name> built
+# with `tools/indexes.py --corpus <name>` is another. They are loaded on first
+# use and the least recently used are unloaded while the loaded set exceeds
+# RAG_CORPUS_MEMORY_MB (0 = no limit). Searches use RAG_CORPUS unless told otherwise.
+DEFAULT_CORPUS = os.getenv("RAG_CORPUS", "default")
+CORPUS_MEMORY_BUDGET_MB = float(os.getenv("RAG_CORPUS_MEMORY_MB", "0"))
+
+# Index builds publish immutable versions under <corpus>/snapshots/ and keep
+# the newest SNAPSHOT_KEEP. Running retrievers check every RAG_SNAPSHOT_POLL
+# seconds (0 disables) for a new version and swap it in. Checksums are
+# computed once, when a version is published; loads and swaps only check file
+# sizes against them unless RAG_SNAPSHOT_VERIFY=full, which reads every file.
+SNAPSHOT_KEEP = 3
+SNAPSHOT_POLL_S = float(os.getenv("RAG_SNAPSHOT_POLL", "5"))
+SNAPSHOT_VERIFY = os.getenv("RAG_SNAPSHOT_VERIFY", "sizes").lower() == "full"
+
+# Query path OpenAI calls. Every query gets QUERY_DEADLINE_S end to end
+# (RAG_QUERY_DEADLINE, 0 disables); each request is capped at
+# OPENAI_REQUEST_TIMEOUT_S and what is left of the deadline, and retried with
+# jittered exponential backoff. An embedding call still outstanding after the
+# HEDGE_PERCENTILE of recent latencies is sent a second time (RAG_HEDGE) from a
+# pool of HEDGE_MAX_IN_FLIGHT threads, skipped when they are all busy; its
+# reply is used if the first request fails. Generation is skipped, returning retrieval-only
+# results, when less than the GENERATION_PERCENTILE chat latency is left.
+QUERY_DEADLINE_S = float(os.getenv("RAG_QUERY_DEADLINE", "30"))
+OPENAI_REQUEST_TIMEOUT_S = 20.0
+OPENAI_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_S = 0.25
+RETRY_BACKOFF_MAX_S = 4.0
+HEDGE_ENABLED = os.getenv("RAG_HEDGE", "true").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = 95
+HEDGE_INITIAL_DELAY_S = 1.0
+HEDGE_MAX_IN_FLIGHT = 32
+GENERATION_PERCENTILE = 50
+GENERATION_MIN_BUDGET_S = 1.0
+LATENCY_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# `python main.py --batch FILE`: questions are embedded EMBED_BATCH_SIZE per
+# request and searched together, then answered BATCH_CONCURRENCY at a time.
+EMBED_BATCH_SIZE = 64
+BATCH_CONCURRENCY = 8
+
+EVAL_CONCURRENCY = 8
+EVAL_BATCH_SIZE = 1
+
+QUERY_GEN_CONCURRENCY = 8
+QUERY_GEN_MAX_ATTEMPTS = 5
+
+# tools/indexes.py: one summary per article at indexing time, cached per
+# corpus by article content so only new or changed articles are sent.
+SUMMARY_CONCURRENCY = 8
+SUMMARY_MAX_ATTEMPTS = 5
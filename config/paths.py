@@ -2,18 +2,34 @@ from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
-RAW_JSON = BASE_DIR / "data" / "raw" / "News.json"
-PROCESSED_JSON = BASE_DIR / "data" / "processed" / "News_processed.json"
+RAW_JSON = BASE_DIR / "data" / "raw" / "News.jsonl"
+PROCESSED_JSON = BASE_DIR / "data" / "processed" / "News_processed.jsonl"
 
 RAW_IMAGES_DIR = BASE_DIR / "data" / "raw" / "images"
 PROCESSED_IMAGES_DIR = BASE_DIR / "data" / "processed" / "images"
 
-TEXT_EMBEDDINGS_PATH = BASE_DIR / "data" / "embeddings" / "text_embeddings.json"
-IMAGE_EMBEDDINGS_PATH = BASE_DIR / "data" / "embeddings" / "image_embeddings.json"
+TEXT_EMBEDDINGS_PATH = BASE_DIR / "data" / "embeddings" / "text_embeddings.jsonl"
+IMAGE_EMBEDDINGS_PATH = BASE_DIR / "data" / "embeddings" / "image_embeddings.jsonl"
+
+# A corpus directory holds the same files as data/indexes.
+INDEXES_DIR = BASE_DIR / "data" / "indexes"
+CORPORA_DIR = BASE_DIR / "data" / "corpora"
 
 TEXT_INDEX_PATH = BASE_DIR / "data" / "indexes" / "text.index"
 IMAGE_INDEX_PATH = BASE_DIR / "data" / "indexes" / "image.index"
+TEXT_SHARDS_DIR = BASE_DIR / "data" / "indexes" / "text_shards"
+
+TEXT_VECTORS_PATH = BASE_DIR / "data" / "indexes" / "text_vectors.npy"
+IMAGE_VECTORS_PATH = BASE_DIR / "data" / "indexes" / "image_vectors.npy"
 
 UNIFIED_METADATA_PATH = BASE_DIR / "data" / "indexes" / "unified_metadata.json"
+MMAP_METADATA_DIR = BASE_DIR / "data" / "indexes" / "mmap"
+METADATA_DB_PATH = BASE_DIR / "data" / "indexes" / "metadata.db"
+SUMMARY_CACHE_PATH = BASE_DIR / "data" / "indexes" / "summary_cache.jsonl"
 
 QUERY_EXPANSION_PATH = BASE_DIR / "evaluation" / "generated_test_queries.json"
+QUERY_CACHE_PATH = BASE_DIR / "evaluation" / "query_cache.jsonl"
+EVALUATION_RESULTS_PATH = BASE_DIR / "evaluation" / "evaluation_results.json"
+EVALUATION_CHECKPOINT_PATH = BASE_DIR / "evaluation" / "evaluation_checkpoint.jsonl"
+
+BENCHMARK_RESULTS_DIR = BASE_DIR / "benchmarks" / "results"
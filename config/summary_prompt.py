@@ -0,0 +1,11 @@
+SUMMARY_PROMPT = """
+You are summarizing an article from The Batch news.
+
+## Instructions:
+- Write a short summary of the article (1–3 sentences) that concisely explains the main point.
+- Use only information from the article; do not add or fabricate details.
+- Respond with the summary text only, without headings or Markdown.
+
+## Article: {title}
+{text}
+"""
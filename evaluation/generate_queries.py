@@ -1,11 +1,28 @@
+import argparse
+import asyncio
+import hashlib
 import json
+import os
+import random
 import re
 
-from openai import OpenAI
+from pathlib import Path
+from typing import Optional
 
-from config import UNIFIED_METADATA_PATH, CHAT_MODEL, GENERATE_QUERIES_PROMPT, TEMPERATURE_CREATIVE
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
 
-client = OpenAI()
+from config import (
+    UNIFIED_METADATA_PATH,
+    QUERY_EXPANSION_PATH,
+    QUERY_CACHE_PATH,
+    CHAT_MODEL,
+    GENERATE_QUERIES_PROMPT,
+    TEMPERATURE_CREATIVE,
+    QUERY_GEN_CONCURRENCY,
+    QUERY_GEN_MAX_ATTEMPTS,
+)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
 
 def load_metadata(metadata_path: str):
     with open(metadata_path, "r", encoding="utf-8") as f:
@@ -19,46 +36,146 @@ def extract_unique_articles_from_ids(metadata: dict):
         articles.setdefault(article_title, []).append(chunk_id)
     return articles
 
-def generate_queries(title: str):
+QUERY_KINDS = ("direct", "paraphrased", "noisy")
+
+def valid_queries(queries) -> bool:
+    return isinstance(queries, dict) and all(isinstance(queries.get(kind), str) for kind in QUERY_KINDS)
+
+def title_hash(title: str) -> str:
+    return hashlib.sha256(title.encode("utf-8")).hexdigest()[:16]
+
+def load_query_cache(cache_path: Path) -> dict[str, dict]:
+    cache = {}
+    if not Path(cache_path).exists():
+        return cache
+    with open(cache_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Entries missing a query kind are generated again.
+            if "title_hash" in record and valid_queries(record.get("queries")):
+                cache[record["title_hash"]] = record["queries"]
+    return cache
+
+def fallback_queries(readable_title: str) -> dict:
+    return {
+        "direct": readable_title,
+        "paraphrased": f"About {readable_title.lower()}",
+        "noisy": f"Something related to {readable_title.lower()}"
+    }
+
+async def generate_queries(client: AsyncOpenAI, semaphore: asyncio.Semaphore, title: str) -> tuple[dict, bool]:
     readable_title = title.replace("-", " ")
-    prompt = GENERATE_QUERIES_PROMPT.format(readable_title=readable_title)
-    try:
-        response = client.chat.completions.create(
-            model=CHAT_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=TEMPERATURE_CREATIVE
-        )
-        raw_content = response.choices[0].message.content.strip()
+    prompt = GENERATE_QUERIES_PROMPT.replace("{readable_title}", readable_title)
+
+    for attempt in range(QUERY_GEN_MAX_ATTEMPTS):
+        try:
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=TEMPERATURE_CREATIVE
+                )
+            raw_content = response.choices[0].message.content.strip()
+            raw_content = re.sub(r"^```json\s*|\s*```$", "", raw_content.strip(), flags=re.MULTILINE)
+            queries = json.loads(raw_content)
+            if not valid_queries(queries):
+                raise ValueError(f"reply lacks one of {', '.join(QUERY_KINDS)}: {raw_content[:200]}")
+            return {kind: queries[kind].replace("-", " ") for kind in QUERY_KINDS}, True
+        except RETRYABLE_ERRORS as e:
+            if attempt == QUERY_GEN_MAX_ATTEMPTS - 1:
+                print(f"Failed to generate query for '{title}' after {attempt + 1} attempts: {e}")
+                break
+            await asyncio.sleep(min(2 ** attempt, 30) * (0.5 + random.random()))
+        except Exception as e:
+            print(f"Failed to generate query for '{title}': {e}")
+            break
+
+    return fallback_queries(readable_title), False
 
-        raw_content = re.sub(r"^```json\s*|\s*```$", "", raw_content.strip(), flags=re.MULTILINE)
+async def generate_all(
+    articles: dict[str, list[str]],
+    output_path: Path = QUERY_EXPANSION_PATH,
+    cache_path: Path = QUERY_CACHE_PATH,
+    concurrency: int = QUERY_GEN_CONCURRENCY,
+    base_url: Optional[str] = None
+) -> int:
+    cache = load_query_cache(cache_path)
+    pending = [title for title in articles if title_hash(title) not in cache]
+    pending_set = set(pending)
+    print(f"{len(articles) - len(pending)} articles cached, {len(pending)} to generate")
 
-        queries = json.loads(raw_content)
+    client = AsyncOpenAI(base_url=base_url, max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
 
-    except Exception as e:
-        print(f"Failed to generate query for '{title}': {e}")
-        queries = {
-            "direct": readable_title,
-            "paraphrased": f"About {readable_title.lower()}",
-            "noisy": f"Something related to {readable_title.lower()}"
-        }
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
 
-    return {k: v.replace("-", " ") for k, v in queries.items()}
+    # Streamed into a temporary file and renamed at the end, so a crash leaves
+    # the previous queries file in place instead of truncated JSON.
+    tmp_path = Path(output_path).with_name(Path(output_path).name + ".tmp")
+    written = 0
+    with open(tmp_path, "w", encoding="utf-8") as out, open(cache_path, "a", encoding="utf-8") as cache_file:
+        out.write("{")
+
+        def write_queries(title: str, queries: dict):
+            nonlocal written
+            for query in (queries[kind] for kind in QUERY_KINDS):
+                out.write(("," if written else "") + "\n  ")
+                out.write(f"{json.dumps(query, ensure_ascii=False)}: {json.dumps(articles[title], ensure_ascii=False)}")
+                written += 1
+            out.flush()
+
+        for title in articles:
+            if title not in pending_set:
+                write_queries(title, cache[title_hash(title)])
+
+        async def run(title: str):
+            return title, *await generate_queries(client, semaphore, title)
+
+        for task in asyncio.as_completed([run(title) for title in pending]):
+            title, queries, from_model = await task
+            if from_model:
+                cache_file.write(json.dumps({
+                    "title_hash": title_hash(title),
+                    "title": title,
+                    "queries": queries
+                }, ensure_ascii=False) + "\n")
+                cache_file.flush()
+            write_queries(title, queries)
+
+        out.write("\n}\n")
+
+    os.replace(tmp_path, output_path)
+    await client.close()
+    return written
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate test queries for every indexed article")
+    parser.add_argument("--concurrency", type=int, default=QUERY_GEN_CONCURRENCY)
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint, e.g. a local fake server for testing")
+    parser.add_argument("--output", type=Path, default=QUERY_EXPANSION_PATH)
+    parser.add_argument("--cache", type=Path, default=QUERY_CACHE_PATH)
+    args = parser.parse_args()
+
     metadata = load_metadata(UNIFIED_METADATA_PATH)
     articles = extract_unique_articles_from_ids(metadata)
 
-    test_queries = {}
-    for article_title, chunk_ids in articles.items():
-        queries = generate_queries(article_title)
-        test_queries[queries["direct"]] = chunk_ids
-        test_queries[queries["paraphrased"]] = chunk_ids
-        test_queries[queries["noisy"]] = chunk_ids
-
-    with open("generated_test_queries.json", "w", encoding="utf-8") as f:
-        json.dump(test_queries, f, ensure_ascii=False, indent=2)
+    written = asyncio.run(generate_all(
+        articles,
+        output_path=args.output,
+        cache_path=args.cache,
+        concurrency=args.concurrency,
+        base_url=args.base_url
+    ))
 
-    print(f"Generated {len(test_queries)} queries for {len(articles)} unique articles")
+    print(f"Generated {written} queries for {len(articles)} unique articles")
 
 if __name__ == "__main__":
     main()
@@ -1,119 +1,311 @@
+import argparse
+import hashlib
 import json
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 
 import numpy as np
 
-from config import QUERY_EXPANSION_PATH, TOP_K
-from rag import retriever_instance
-
-def precision_at_k(retrieved: list[str], relevant: list[str], k: int) -> float:
-    retrieved_k = retrieved[:k]
-    if not retrieved_k:
-        return 0.0
-    return len(set(retrieved_k) & set(relevant)) / len(retrieved_k)
-
-def recall_at_k(retrieved: list[str], relevant: list[str], k: int) -> float:
-    if not relevant:
-        return 0.0
-    retrieved_k = retrieved[:k]
-    return len(set(retrieved_k) & set(relevant)) / len(relevant)
-
-def mean_reciprocal_rank(retrieved: list[str], relevant: list[str]) -> float:
-    for rank, item in enumerate(retrieved, start=1):
-        if item in relevant:
-            return 1.0 / rank
-    return 0.0
-
-def ndcg_at_k(retrieved: list[str], relevant: list[str], k: int) -> float:
-    dcg = 0.0
-    for i, item in enumerate(retrieved[:k]):
-        if item in relevant:
-            dcg += 1.0 / np.log2(i + 2)
-    ideal_hits = min(len(relevant), k)
-    idcg = sum(1.0 / np.log2(i + 2) for i in range(ideal_hits))
-    return dcg / idcg if idcg > 0 else 0.0
-
-def average_precision(retrieved: list[str], relevant: list[str]) -> float:
-    if not relevant:
-        return 0.0
-    score = 0.0
-    hits = 0
-    for i, item in enumerate(retrieved, start=1):
-        if item in relevant:
-            hits += 1
-            score += hits / i
-    return score / len(relevant)
-
-def top1_accuracy(retrieved: list[str], relevant: list[str]) -> float:
-    if not retrieved:
-        return 0.0
-    return 1.0 if retrieved[0] in relevant else 0.0
-
-def evaluate_system():
-    retriever = retriever_instance
-
-    with open(QUERY_EXPANSION_PATH, "r", encoding="utf-8") as f:
-        test_queries: dict[str, list[str]] = json.load(f)
+from openai import APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+from config import (
+    QUERY_EXPANSION_PATH,
+    EVALUATION_RESULTS_PATH,
+    EVALUATION_CHECKPOINT_PATH,
+    EVAL_CONCURRENCY,
+    EVAL_BATCH_SIZE,
+    DEFAULT_CORPUS,
+    TEXT_EMBEDDING_MODEL,
+    RERANK_POOL,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_POOL,
+    TOP_K,
+)
+from rag import get_retriever
+from vectorstore.snapshots import corpus_paths
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+MAX_ATTEMPTS = 5
+
+
+def hits_matrix(retrieved: list[list], relevant: list[list], k: int) -> tuple[np.ndarray, np.ndarray]:
+    hits = np.zeros((len(retrieved), k), dtype=bool)
+    num_relevant = np.zeros(len(retrieved), dtype="float64")
+    for q, (retrieved_ids, relevant_ids) in enumerate(zip(retrieved, relevant)):
+        relevant_set = set(relevant_ids)
+        num_relevant[q] = len(relevant_set)
+        for rank, item in enumerate(retrieved_ids[:k]):
+            hits[q, rank] = item in relevant_set
+    return hits, num_relevant
+
+
+def compute_metrics(hits: np.ndarray, num_relevant: np.ndarray, num_retrieved: np.ndarray) -> dict[str, np.ndarray]:
+    k = hits.shape[1]
+    ranks = np.arange(1, k + 1, dtype="float64")
+    discounts = 1.0 / np.log2(ranks + 1)
+    hit_counts = hits.sum(axis=1)
+    cumulative_hits = np.cumsum(hits, axis=1)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(num_retrieved > 0, hit_counts / np.minimum(num_retrieved, k), 0.0)
+        recall = np.where(num_relevant > 0, hit_counts / num_relevant, 0.0)
+
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1) + 1, np.inf)
+        mrr = 1.0 / first_hit
+
+        dcg = (hits * discounts).sum(axis=1)
+        ideal_discounts = np.concatenate([[0.0], np.cumsum(discounts)])
+        idcg = ideal_discounts[np.minimum(num_relevant, k).astype(int)]
+        ndcg = np.where(idcg > 0, dcg / idcg, 0.0)
 
-    metrics = {
-        "precision": [],
-        "recall": [],
-        "mrr": [],
-        "ndcg": [],
-        "map": [],
-        "top1_acc": []
+        ap = np.where(num_relevant > 0, (hits * cumulative_hits / ranks).sum(axis=1) / num_relevant, 0.0)
+
+    return {
+        "precision": precision,
+        "recall": recall,
+        "mrr": mrr,
+        "ndcg": ndcg,
+        "map": ap,
+        "top1_acc": hits[:, 0].astype("float64"),
     }
 
-    per_query_results = {}
 
-    for query, relevant_ids in test_queries.items():
-        results = retriever.search_multimodal(query, top_k=TOP_K)
-        retrieved_ids = [r["id"] for r in results["text"]]
+def latency_percentiles(latencies_ms: list[float]) -> dict:
+    if not latencies_ms:
+        return {"count": 0}
+    values = np.asarray(latencies_ms, dtype="float64")
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {
+        "count": int(values.size),
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(p50),
+        "p95_ms": float(p95),
+        "p99_ms": float(p99),
+        "max_ms": float(values.max()),
+    }
+
+
+def index_version(corpus) -> str:
+    if corpus.version is not None:
+        return corpus.version
+    # Indexes built in place, before snapshots: their modification times stand
+    # in for a version.
+    paths = corpus_paths(corpus.directory)
+    stamps = [
+        f"{path.name}:{path.stat().st_mtime_ns}"
+        for path in (paths["text_index_path"], paths["text_shards_dir"], paths["metadata_path"])
+        if path.exists()
+    ]
+    return hashlib.sha256("\n".join(stamps).encode("utf-8")).hexdigest()[:16]
+
+
+def run_config(retriever, top_k: int) -> dict:
+    with retriever.corpus(DEFAULT_CORPUS) as loaded:
+        version = index_version(loaded)
+    return {
+        "index_version": version,
+        "embedding_model": TEXT_EMBEDDING_MODEL,
+        "top_k": top_k,
+        "rerank_pool": RERANK_POOL,
+        "mmr": [MMR_ENABLED, MMR_LAMBDA, MMR_POOL],
+    }
+
+
+def load_checkpoint(checkpoint_path: Path, config: dict) -> dict[str, dict]:
+    # The first line records the index and settings the run was started
+    # with; results from any other index or configuration are discarded.
+    completed = {}
+    if not Path(checkpoint_path).exists():
+        return completed
+    checkpoint_config = None
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "config" in record:
+                checkpoint_config = record["config"]
+            elif "query" in record:
+                completed[record["query"]] = record
+    if checkpoint_config != config:
+        print(f"Discarding {checkpoint_path}: written for a different index or configuration")
+        Path(checkpoint_path).unlink()
+        return {}
+    return completed
+
 
-        p = precision_at_k(retrieved_ids, relevant_ids, TOP_K)
-        r = recall_at_k(retrieved_ids, relevant_ids, TOP_K)
-        mrr = mean_reciprocal_rank(retrieved_ids, relevant_ids)
-        ndcg = ndcg_at_k(retrieved_ids, relevant_ids, TOP_K)
-        ap = average_precision(retrieved_ids, relevant_ids)
-        t1 = top1_accuracy(retrieved_ids, relevant_ids)
+def with_retries(fn, *args):
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            return fn(*args)
+        except RETRYABLE_ERRORS:
+            if attempt == MAX_ATTEMPTS - 1:
+                raise
+            time.sleep(min(2 ** attempt, 30) * (0.5 + np.random.random()))
 
-        metrics["precision"].append(p)
-        metrics["recall"].append(r)
-        metrics["mrr"].append(mrr)
-        metrics["ndcg"].append(ndcg)
-        metrics["map"].append(ap)
-        metrics["top1_acc"].append(t1)
 
+def search_batch(retriever, queries: list[str], top_k: int) -> list[dict]:
+    start = time.perf_counter()
+    vectors = retriever.embed_texts_openai(queries)
+    batch_results = retriever.search_text_batch(vectors, top_k)
+    latency_ms = (time.perf_counter() - start) * 1000 / len(queries)
+    return [
+        {
+            "query": query,
+            "top_k": top_k,
+            "retrieved_ids": [r["id"] for r in results],
+            "latency_ms": latency_ms,
+        }
+        for query, results in zip(queries, batch_results)
+    ]
+
+
+def run_queries(
+    queries: list[str],
+    top_k: int,
+    concurrency: int,
+    batch_size: int,
+    checkpoint_path: Path,
+    config: dict
+) -> tuple[list[dict], list[str]]:
+    retriever = get_retriever()
+    checkpoint_lock = threading.Lock()
+    records, failed = [], []
+
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if checkpoint.tell() == 0:
+            checkpoint.write(json.dumps({"config": config}, ensure_ascii=False) + "\n")
+        futures = {executor.submit(with_retries, search_batch, retriever, batch, top_k): batch for batch in batches}
+        for done, future in enumerate(as_completed(futures), 1):
+            batch = futures[future]
+            try:
+                batch_records = future.result()
+            except Exception as e:
+                print(f"Batch of {len(batch)} queries failed: {e}")
+                failed.extend(batch)
+                continue
+
+            with checkpoint_lock:
+                for record in batch_records:
+                    checkpoint.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.flush()
+            records.extend(batch_records)
+            print(f"Completed {done}/{len(batches)} batches")
+
+    return records, failed
+
+
+def evaluate_system(
+    top_k: int = TOP_K,
+    concurrency: int = EVAL_CONCURRENCY,
+    batch_size: int = EVAL_BATCH_SIZE,
+    queries_path: Path = QUERY_EXPANSION_PATH,
+    results_path: Path = EVALUATION_RESULTS_PATH,
+    checkpoint_path: Path = EVALUATION_CHECKPOINT_PATH,
+    restart: bool = False
+):
+    with open(queries_path, "r", encoding="utf-8") as f:
+        test_queries: dict[str, list[str]] = json.load(f)
+
+    if restart and Path(checkpoint_path).exists():
+        Path(checkpoint_path).unlink()
+
+    # Round-tripped through JSON so it compares equal to the checkpoint's copy.
+    config = json.loads(json.dumps(run_config(get_retriever(), top_k)))
+    completed = load_checkpoint(checkpoint_path, config)
+    pending = [query for query in test_queries if query not in completed]
+    print(f"{len(completed)} queries restored from checkpoint, {len(pending)} to run")
+
+    if pending:
+        records, failed = run_queries(pending, top_k, concurrency, batch_size, checkpoint_path, config)
+        for record in records:
+            completed[record["query"]] = record
+        if failed:
+            print(f"{len(failed)} queries failed; rerun to resume from the checkpoint")
+
+    # A finished run leaves nothing to resume.
+    if all(query in completed for query in test_queries) and Path(checkpoint_path).exists():
+        Path(checkpoint_path).unlink()
+
+    evaluated = [query for query in test_queries if query in completed]
+    retrieved = [completed[query]["retrieved_ids"] for query in evaluated]
+    relevant = [test_queries[query] for query in evaluated]
+
+    hits, num_relevant = hits_matrix(retrieved, relevant, top_k)
+    num_retrieved = np.array([len(ids[:top_k]) for ids in retrieved], dtype="float64")
+    metrics = compute_metrics(hits, num_relevant, num_retrieved)
+
+    per_query_results = {}
+    for q, query in enumerate(evaluated):
         per_query_results[query] = {
-            "retrieved_ids": retrieved_ids,
-            "relevant_ids": relevant_ids,
-            f"precision@{TOP_K}": p,
-            f"recall@{TOP_K}": r,
-            "mrr": mrr,
-            f"ndcg@{TOP_K}": ndcg,
-            "ap": ap,
-            "top1_accuracy": t1
+            "retrieved_ids": retrieved[q],
+            "relevant_ids": relevant[q],
+            f"precision@{top_k}": float(metrics["precision"][q]),
+            f"recall@{top_k}": float(metrics["recall"][q]),
+            "mrr": float(metrics["mrr"][q]),
+            f"ndcg@{top_k}": float(metrics["ndcg"][q]),
+            "ap": float(metrics["map"][q]),
+            "top1_accuracy": float(metrics["top1_acc"][q]),
+            "latency_ms": completed[query].get("latency_ms"),
         }
 
+    def mean(values: np.ndarray) -> float:
+        return float(values.mean()) if values.size else 0.0
+
     avg_metrics = {
-        f"mean_precision@{TOP_K}": np.mean(metrics["precision"]),
-        f"mean_recall@{TOP_K}": np.mean(metrics["recall"]),
-        "mean_mrr": np.mean(metrics["mrr"]),
-        f"mean_ndcg@{TOP_K}": np.mean(metrics["ndcg"]),
-        "map": np.mean(metrics["map"]),
-        "mean_top1_accuracy": np.mean(metrics["top1_acc"])
+        f"mean_precision@{top_k}": mean(metrics["precision"]),
+        f"mean_recall@{top_k}": mean(metrics["recall"]),
+        "mean_mrr": mean(metrics["mrr"]),
+        f"mean_ndcg@{top_k}": mean(metrics["ndcg"]),
+        "map": mean(metrics["map"]),
+        "mean_top1_accuracy": mean(metrics["top1_acc"])
     }
+    latency = latency_percentiles([completed[query]["latency_ms"] for query in evaluated])
 
     results_to_save = {
         "per_query": per_query_results,
-        "average_metrics": avg_metrics
+        "average_metrics": avg_metrics,
+        "retrieval_latency": latency,
+        "evaluated_queries": len(evaluated),
+        "total_queries": len(test_queries)
     }
 
-    with open("evaluation_results.json", "w", encoding="utf-8") as f:
+    with open(results_path, "w", encoding="utf-8") as f:
         json.dump(results_to_save, f, indent=2, ensure_ascii=False)
 
     print("\n=== AVERAGE METRICS ===")
     for k, v in avg_metrics.items():
         print(f"{k}: {v:.4f}")
 
+    print("\n=== RETRIEVAL LATENCY ===")
+    for k, v in latency.items():
+        print(f"{k}: {v:.2f}" if isinstance(v, float) else f"{k}: {v}")
+
+
 if __name__ == "__main__":
-    evaluate_system()
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency on generated test queries")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    parser.add_argument("--batch-size", type=int, default=EVAL_BATCH_SIZE,
+                        help="queries embedded and searched together per request")
+    parser.add_argument("--restart", action="store_true", help="discard the checkpoint and evaluate every query again")
+    args = parser.parse_args()
+
+    evaluate_system(
+        top_k=args.top_k,
+        concurrency=args.concurrency,
+        batch_size=args.batch_size,
+        restart=args.restart
+    )
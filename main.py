@@ -1,16 +1,122 @@
-from config import TOP_K
-from rag import generate_answer
+import argparse
+import json
+import sys
+import time
+
+from contextlib import nullcontext, redirect_stdout
+from pathlib import Path
+
+import numpy as np
+
+from config import TOP_K, BATCH_CONCURRENCY, QUERY_DEADLINE_S, DEFAULT_CORPUS
+from rag import generate_answer, generate_answers, get_retriever, tracer
+from tools.records import RecordWriter, read_queries
+
+def answer_record(result: dict) -> dict:
+    return {
+        "index": result["index"],
+        "query": result["query"],
+        "corpus": result["results"].get("corpus"),
+        "answer": result.get("answer"),
+        "degraded": result.get("degraded", False),
+        "degraded_reason": result.get("degraded_reason"),
+        "error": result.get("error"),
+        "main_image": result.get("main_image"),
+        "article_title": (result.get("article") or {}).get("title"),
+        "summary": (result.get("article") or {}).get("summary"),
+        "sources": [
+            {"title": r.get("title"), "issue": r.get("issue"), "url": r.get("url"), "score": r.get("score")}
+            for r in result["results"].get("text", [])
+        ],
+        "latency_ms": result["latency_ms"],
+    }
+
+def run_batch(source: str, output: str, top_k: int, concurrency: int, deadline: float, corpus: str):
+    questions = read_queries(source)
+    if not questions:
+        print("No questions to answer.", file=sys.stderr)
+        return
+
+    # With output on stdout, everything else printed during the run goes to
+    # stderr to keep the JSONL clean, including corpus loads and snapshot
+    # swaps printed from other threads.
+    records = sys.stdout
+    with redirect_stdout(sys.stderr) if output == "-" else nullcontext():
+        _run_batch(questions, output, records, top_k, concurrency, deadline, corpus)
+
+def _run_batch(questions: list[str], output: str, records, top_k: int, concurrency: int, deadline: float, corpus: str):
+    get_retriever()
+    print(f"Answering {len(questions)} questions with concurrency {concurrency}")
+
+    latencies = []
+    degraded = failed = 0
+    start = time.perf_counter()
+    first_answer = None
+
+    if output == "-":
+        writer = nullcontext()
+        emit = lambda record: print(json.dumps(record, ensure_ascii=False), file=records, flush=True)
+    else:
+        writer = RecordWriter(Path(output))
+        emit = writer.write
+
+    with writer:
+        for result in generate_answers(
+            questions, top_k=top_k, concurrency=concurrency, deadline=deadline or None, corpus=corpus
+        ):
+            if first_answer is None:
+                first_answer = time.perf_counter() - start
+            record = answer_record(result)
+            emit(record)
+            latencies.append(record["latency_ms"])
+            degraded += record["degraded"]
+            failed += record["error"] is not None
+
+    elapsed = time.perf_counter() - start
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"Answered {len(questions)} questions in {elapsed:.1f}s ({len(questions) / elapsed:.2f} questions/s)")
+    print(f"Retrieval and first answer after {first_answer:.1f}s")
+    print(f"Answer latency p50 {p50:.0f}ms, p95 {p95:.0f}ms, p99 {p99:.0f}ms")
+    print(f"Retrieval-only: {degraded}, failed: {failed}")
+    if output != "-":
+        print(f"Answers saved: {output}")
+    if tracer.enabled:
+        print(tracer.format_report())
 
 def main():
+    parser = argparse.ArgumentParser(description="Answer questions about The Batch news")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="answer every question in FILE (one per line, .jsonl with a query field, "
+                             "or generated evaluation queries .json); - reads stdin")
+    parser.add_argument("--output", default="-", help="JSONL answers file for --batch (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="chat completions in flight")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="name of the corpus to search")
+    parser.add_argument("--deadline", type=float, default=QUERY_DEADLINE_S,
+                        help="seconds per answer before falling back to retrieval only (0 disables)")
+    args = parser.parse_args()
+
+    if args.batch:
+        run_batch(args.batch, args.output, args.top_k, args.concurrency, args.deadline, args.corpus)
+        return
+
     query = input("Enter your search query: ").strip()
     if not query:
         print("Query cannot be empty.")
         return
 
-    result = generate_answer(query=query, top_k=TOP_K)
+    result = generate_answer(query=query, top_k=args.top_k, corpus=args.corpus)
 
     print("GPT Answer")
-    print(result["answer"])
+    if result.get("degraded"):
+        print(f"Showing search results only: {result['degraded_reason']}")
+    else:
+        print(result["answer"])
+
+    article = result.get("article")
+    if article and article.get("summary"):
+        print(f"Summary of {article['title']}")
+        print(article["summary"])
 
     print("Top 5 Text Results")
     if result["results"]["text"]:
@@ -30,5 +136,9 @@ def main():
     else:
         print("No image results found.")
 
+    if tracer.enabled:
+        print("Latency and Token Usage")
+        print(tracer.format_report())
+
 if __name__ == "__main__":
     main()
@@ -1,10 +1,11 @@
-import json
+import argparse
 
 from pathlib import Path
 
 from config import RAW_JSON, PROCESSED_JSON, RAW_IMAGES_DIR, PROCESSED_IMAGES_DIR, CHUNK_SIZE, CHUNK_OVERLAP
-from preprocessing.image_processor import process_image
+from preprocessing.image_processor import create_image_derivatives
 from preprocessing.text_cleaner import clean_text
+from tools.records import RecordWriter, iter_records
 
 def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
     words = text.split()
@@ -19,44 +20,76 @@ def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVE
         start += chunk_size - overlap
     return chunks
 
-def preprocess_articles():
-    if not Path(RAW_JSON).exists():
-        raise FileNotFoundError(f"File {RAW_JSON} not found")
+def merge_chunks(chunks: list[str], overlap: int = CHUNK_OVERLAP) -> str:
+    # Inverse of chunk_text: each chunk after the first repeats the last
+    # `overlap` words of the one before it. The overlap is checked rather
+    # than assumed, so chunks written with other settings still join cleanly.
+    words = []
+    for chunk in chunks:
+        chunk_words = chunk.split()
+        shared = min(overlap, len(words), len(chunk_words))
+        while shared and words[-shared:] != chunk_words[:shared]:
+            shared -= 1
+        words.extend(chunk_words[shared:])
+    return " ".join(words)
 
-    with open(RAW_JSON, "r", encoding="utf-8") as f:
-        articles = json.load(f)
+def preprocess_article(article: dict) -> dict:
+    title = article.get("title", "").strip()
+    content = clean_text(article.get("content", ""))
 
-    Path(PROCESSED_IMAGES_DIR).mkdir(parents=True, exist_ok=True)
-    processed_articles = []
+    chunks = chunk_text(content)
+
+    image_filename = article.get("image_filename")
+    image_variants = None
 
-    for article in articles:
-        title = article.get("title", "").strip()
-        content = clean_text(article.get("content", ""))
+    if image_filename:
+        raw_image_path = Path(RAW_IMAGES_DIR) / image_filename
+        if raw_image_path.exists():
+            image_variants = create_image_derivatives(str(raw_image_path), str(PROCESSED_IMAGES_DIR))
 
-        chunks = chunk_text(content)
+    return {
+        "issue": article.get("issue"),
+        "title": title,
+        "url": article.get("url"),
+        "chunks": chunks,
+        "image_url": article.get("image_url"),
+        "image_path": image_variants["display"] if image_variants else None,
+        "image_variants": image_variants
+    }
 
-        image_filename = article.get("image_filename")
-        processed_image_path = None
+def preprocess_articles(
+    input_path: Path = RAW_JSON,
+    output_path: Path = PROCESSED_JSON,
+    follow: bool = False,
+    append: bool = False
+):
+    if not follow and not Path(input_path).exists():
+        raise FileNotFoundError(f"File {input_path} not found")
 
-        if image_filename:
-            raw_image_path = Path(RAW_IMAGES_DIR) / image_filename
-            if raw_image_path.exists():
-                processed_image_path = process_image(str(raw_image_path), str(PROCESSED_IMAGES_DIR))
+    Path(PROCESSED_IMAGES_DIR).mkdir(parents=True, exist_ok=True)
 
-        processed_articles.append({
-            "issue": article.get("issue"),
-            "title": title,
-            "url": article.get("url"),
-            "chunks": chunks,
-            "image_url": article.get("image_url"),
-            "image_path": processed_image_path
-        })
+    processed = set()
+    if append and Path(output_path).exists():
+        processed = {(str(a["issue"]), a["title"]) for a in iter_records(output_path)}
 
-    with open(PROCESSED_JSON, "w", encoding="utf-8") as f:
-        json.dump(processed_articles, f, ensure_ascii=False, indent=2)
+    with RecordWriter(output_path, append=append) as writer:
+        for article in iter_records(input_path, follow=follow):
+            if (str(article.get("issue")), article.get("title", "").strip()) in processed:
+                continue
+            writer.write(preprocess_article(article))
 
-    print(f"Processing has been finished! Results in: {PROCESSED_JSON}")
+    print(f"Processing has been finished! {writer.count} articles in: {output_path}")
 
 
 if __name__ == "__main__":
-    preprocess_articles()
+    parser = argparse.ArgumentParser(description="Clean, chunk and resize scraped articles")
+    parser.add_argument("--input", type=Path, default=RAW_JSON)
+    parser.add_argument("--output", type=Path, default=PROCESSED_JSON,
+                        help="records file; .gz/.bz2/.xz suffixes are compressed")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep consuming records while the scraper is still writing them")
+    parser.add_argument("--append", action="store_true",
+                        help="append articles that are not in the output records yet")
+    args = parser.parse_args()
+
+    preprocess_articles(args.input, args.output, follow=args.follow, append=args.append)
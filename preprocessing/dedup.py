@@ -0,0 +1,143 @@
+import re
+import zlib
+
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from config import (
+    PROCESSED_JSON,
+    DEDUP_THRESHOLD,
+    MINHASH_PERMUTATIONS,
+    LSH_BANDS,
+    SHINGLE_SIZE,
+)
+from tools.records import iter_records
+
+# Universal hashing (a * x + b) mod p over 32-bit shingle hashes; with a, b
+# and x below 2**32 the products still fit in uint64.
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(2 ** 32 - 1)
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> np.ndarray:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    grams = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype="uint64", count=len(grams))
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = MINHASH_PERMUTATIONS, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.a = rng.integers(1, 2 ** 32, size=num_perm, dtype="uint64")
+        self.b = rng.integers(0, 2 ** 32, size=num_perm, dtype="uint64")
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text)
+        values = (np.outer(hashes, self.a) + self.b) % _PRIME & _MAX_HASH
+        return values.min(axis=0).astype("uint32")
+
+
+@dataclass
+class DedupReport:
+    total: int = 0
+    duplicates: int = 0
+    cross_article: int = 0
+    tokens_total: int = 0
+    tokens_saved: int = 0
+
+    @property
+    def canonical(self) -> int:
+        return self.total - self.duplicates
+
+    def format(self, dim: Optional[int] = None) -> str:
+        lines = [
+            f"Chunks: {self.total}, canonical: {self.canonical}, "
+            f"near-duplicates: {self.duplicates} ({self.cross_article} across articles)",
+            f"Embedding tokens: ~{self.tokens_total - self.tokens_saved} instead of ~{self.tokens_total} "
+            f"({self.tokens_saved / max(self.tokens_total, 1):.1%} saved)",
+        ]
+        if dim:
+            saved_bytes = self.duplicates * dim * 4
+            lines.append(
+                f"Index vectors: {self.canonical} instead of {self.total} "
+                f"({saved_bytes / 1e6:.2f} MB of float32 saved at dim {dim})"
+            )
+        return "\n".join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        threshold: float = DEDUP_THRESHOLD,
+        num_perm: int = MINHASH_PERMUTATIONS,
+        bands: int = LSH_BANDS
+    ):
+        if num_perm % bands:
+            raise ValueError(f"{num_perm} permutations cannot be split into {bands} LSH bands")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.report = DedupReport()
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+        self._owners = {}
+
+    def add(self, text: str, owner=None, cost_text: Optional[str] = None) -> Optional[int]:
+        position = self.report.total
+        signature = self.hasher.signature(text)
+        keys = [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+        candidates = {c for band, key in enumerate(keys) for c in self._buckets[band].get(key, ())}
+        match = None
+        if candidates:
+            candidates = np.fromiter(candidates, dtype="int64", count=len(candidates))
+            similarity = (np.stack([self._signatures[c] for c in candidates]) == signature).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] >= self.threshold:
+                match = int(candidates[best])
+
+        tokens = estimate_tokens(cost_text or text)
+        self.report.total += 1
+        self.report.tokens_total += tokens
+        if match is not None:
+            self.report.duplicates += 1
+            self.report.tokens_saved += tokens
+            self.report.cross_article += owner != self._owners[match]
+            return match
+
+        # Only canonical chunks are inserted into the LSH buckets, so a
+        # boilerplate paragraph repeated across hundreds of issues stays a
+        # single candidate.
+        self._signatures[position] = signature
+        self._owners[position] = owner
+        for band, key in enumerate(keys):
+            self._buckets[band].setdefault(key, []).append(position)
+        return None
+
+
+def main():
+    index = NearDuplicateIndex()
+    chunks = []
+    for article in iter_records(PROCESSED_JSON):
+        owner = (article.get("issue"), article.get("title"))
+        for chunk in article.get("chunks", []):
+            canonical = index.add(chunk, owner)
+            if canonical is not None:
+                print(f"- {owner[1]} (issue {owner[0]}) duplicates {chunks[canonical][1]} (issue {chunks[canonical][0]})")
+            chunks.append(owner)
+
+    print(index.report.format())
+
+
+if __name__ == "__main__":
+    main()
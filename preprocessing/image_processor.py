@@ -3,19 +3,46 @@ import os
 from PIL import Image
 from typing import Optional
 
-def process_image(image_path: str, output_dir: str, size: tuple[int, int] = (512, 512)) -> Optional[str]:
+from config import IMAGE_DERIVATIVES, IMAGE_FORMAT, IMAGE_QUALITY, PROCESSED_IMAGES_DIR, RAW_IMAGES_DIR
+
+EXTENSIONS = {"WEBP": ".webp", "JPEG": ".jpg", "PNG": ".png"}
+
+def create_image_derivatives(
+    image_path: str,
+    output_dir: str,
+    derivatives: dict[str, tuple[int, int]] = IMAGE_DERIVATIVES,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY
+) -> Optional[dict[str, str]]:
     if not os.path.exists(image_path):
         return None
 
     os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(image_path))[0]
+    extension = EXTENSIONS.get(image_format, "." + image_format.lower())
 
     try:
         img = Image.open(image_path).convert("RGB")
-        img.thumbnail(size)
-        filename = os.path.splitext(os.path.basename(image_path))[0] + ".jpg"
-        output_path = os.path.join(output_dir, filename)
-        img.save(output_path, format="JPEG", quality=90)
-        return output_path
+        variants = {}
+        # Largest size first so each smaller derivative is resampled from the
+        # previous one instead of decoding the original again.
+        for name, size in sorted(derivatives.items(), key=lambda item: -item[1][0] * item[1][1]):
+            img.thumbnail(size, Image.Resampling.LANCZOS)
+            filename = f"{stem}_{name}{extension}"
+            img.save(os.path.join(output_dir, filename), format=image_format, quality=quality, method=6)
+            variants[name] = filename
+        return variants
     except Exception as e:
         print(f"Image processing error {image_path}: {e}")
         return None
+
+def backfill_derivatives(raw_dir: str = str(RAW_IMAGES_DIR), output_dir: str = str(PROCESSED_IMAGES_DIR)) -> int:
+    created = 0
+    for filename in sorted(os.listdir(raw_dir)):
+        if create_image_derivatives(os.path.join(raw_dir, filename), output_dir):
+            created += 1
+    return created
+
+
+if __name__ == "__main__":
+    print(f"Created derivatives for {backfill_derivatives()} images in {PROCESSED_IMAGES_DIR}")
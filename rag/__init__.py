@@ -1,2 +1,8 @@
-from .rag import generate_answer
-from .retriever import retriever_instance
+from .rag import generate_answer, generate_answers
+from .retriever import MultimodalRetriever, get_retriever
+from .tracing import tracer
+
+def __getattr__(name: str):
+    if name == "retriever_instance":
+        return get_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
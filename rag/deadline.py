@@ -0,0 +1,194 @@
+import random
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+import numpy as np
+
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from config import (
+    OPENAI_REQUEST_TIMEOUT_S,
+    OPENAI_MAX_ATTEMPTS,
+    RETRY_BACKOFF_S,
+    RETRY_BACKOFF_MAX_S,
+    HEDGE_PERCENTILE,
+    HEDGE_INITIAL_DELAY_S,
+    HEDGE_MAX_IN_FLIGHT,
+    LATENCY_MIN_SAMPLES,
+    LATENCY_WINDOW,
+)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds: float, elapsed: float = 0.0):
+        self.seconds = seconds
+        self.at = time.monotonic() + seconds - elapsed
+
+    def remaining(self) -> float:
+        return self.at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def query_deadline(seconds: Optional[float], elapsed: float = 0.0):
+    # Nested scopes never extend the deadline of the enclosing query. elapsed
+    # is time the query already spent elsewhere, e.g. in batch retrieval.
+    outer = _current_deadline.get()
+    deadline = Deadline(seconds, elapsed) if seconds else None
+    if outer is not None and (deadline is None or outer.at < deadline.at):
+        deadline = outer
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+def remaining(default: Optional[float] = None) -> Optional[float]:
+    deadline = _current_deadline.get()
+    return deadline.remaining() if deadline is not None else default
+
+
+def check_deadline(stage: str) -> None:
+    deadline = _current_deadline.get()
+    if deadline is not None and deadline.expired:
+        raise DeadlineExceeded(f"Query deadline of {deadline.seconds:.1f}s exceeded before {stage}")
+
+
+class LatencyTracker:
+    def __init__(self, window: int = LATENCY_WINDOW, min_samples: int = LATENCY_MIN_SAMPLES):
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._window = window
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def percentile(self, name: str, q: float, default: Optional[float] = None) -> Optional[float]:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None or len(samples) < self.min_samples:
+                return default
+            values = np.fromiter(samples, dtype="float64")
+        return float(np.percentile(values, q))
+
+
+latencies = LatencyTracker()
+
+# Only the second, hedged request of a call runs here; the first one runs on
+# the caller's thread. A hedge that cannot get a free slot is not sent, so
+# hedges never queue behind each other. A hedge still running when the first
+# request succeeds is left to finish on its own (bounded by its request
+# timeout) since an HTTP call cannot be interrupted.
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_MAX_IN_FLIGHT, thread_name_prefix="hedge")
+_hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_IN_FLIGHT)
+
+
+def _request_timeout(stage: str, deadline: Optional[Deadline] = None) -> float:
+    # Computed when the request starts, from the deadline of the query.
+    deadline = deadline or _current_deadline.get()
+    if deadline is None:
+        return OPENAI_REQUEST_TIMEOUT_S
+    left = deadline.remaining()
+    if left <= 0:
+        raise DeadlineExceeded(f"Query deadline exceeded before {stage}")
+    return min(OPENAI_REQUEST_TIMEOUT_S, left)
+
+
+def _timed(stage: str, call: Callable, deadline: Optional[Deadline] = None):
+    timeout = _request_timeout(stage, deadline)
+    start = time.monotonic()
+    result = call(timeout)
+    latencies.record(stage, time.monotonic() - start)
+    return result
+
+
+def _hedged(stage: str, call: Callable):
+    deadline = _current_deadline.get()
+    delay = latencies.percentile(stage, HEDGE_PERCENTILE, HEDGE_INITIAL_DELAY_S)
+    lock = threading.Lock()
+    primary_done = False
+    hedges = []
+
+    def send_hedge():
+        with lock:
+            if primary_done or not _hedge_slots.acquire(blocking=False):
+                return
+            hedge = _hedge_pool.submit(_timed, stage, call, deadline)
+            hedge.add_done_callback(lambda _: _hedge_slots.release())
+            hedges.append(hedge)
+
+    timer = threading.Timer(delay, send_hedge)
+    timer.daemon = True
+    timer.start()
+    try:
+        result = _timed(stage, call, deadline)
+    except (DeadlineExceeded, *RETRYABLE_ERRORS) as e:
+        error = e
+    else:
+        error = None
+    finally:
+        timer.cancel()
+        with lock:
+            primary_done = True
+
+    hedge = hedges[0] if hedges else None
+    if error is None:
+        if hedge is not None:
+            hedge.cancel()
+        return result
+    if hedge is None:
+        raise error
+    # The first request failed with a hedge in flight: its reply stands in for
+    # a retry.
+    try:
+        return hedge.result(timeout=remaining())
+    except FutureTimeoutError as e:
+        hedge.cancel()
+        raise DeadlineExceeded(f"Query deadline exceeded during {stage}") from e
+
+
+def call_openai(stage: str, call: Callable, hedge: bool = False, attempts: int = OPENAI_MAX_ATTEMPTS):
+    # `call` takes the per-request timeout, bounded by what is left of the
+    # query deadline, and must be safe to send twice when hedging.
+    for attempt in range(attempts):
+        try:
+            if hedge:
+                return _hedged(stage, call)
+            return _timed(stage, call)
+        except RETRYABLE_ERRORS:
+            if attempt == attempts - 1:
+                raise
+            # Full jitter, so clients retrying after a shared hiccup spread out.
+            backoff = random.uniform(0, min(RETRY_BACKOFF_MAX_S, RETRY_BACKOFF_S * 2 ** attempt))
+            left = remaining()
+            if left is not None and backoff >= left:
+                raise DeadlineExceeded(f"Query deadline exceeded while retrying {stage}")
+            time.sleep(backoff)
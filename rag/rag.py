@@ -1,13 +1,144 @@
-from openai import OpenAI
+import time
 
-from config import RAG_PROMPT, SYSTEM_PROMPT, CHAT_MODEL, TEMPERATURE_STRICT, TOP_K
-from rag.retriever import retriever_instance
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, Optional
 
-client = OpenAI()
+from openai import APITimeoutError, OpenAI
 
-def generate_answer(query: str, top_k: int = TOP_K) -> dict:
-    results = retriever_instance.search_multimodal(query, top_k=top_k)
+from config import (
+    RAG_PROMPT,
+    SYSTEM_PROMPT,
+    CHAT_MODEL,
+    TEMPERATURE_STRICT,
+    TOP_K,
+    QUERY_DEADLINE_S,
+    GENERATION_PERCENTILE,
+    GENERATION_MIN_BUDGET_S,
+    BATCH_CONCURRENCY,
+    EMBED_BATCH_SIZE,
+    DEFAULT_CORPUS,
+)
+from rag.deadline import RETRYABLE_ERRORS, DeadlineExceeded, call_openai, latencies, query_deadline, remaining
+from rag.retriever import get_retriever
+from rag.tracing import tracer
+from vectorstore import SearchFilter
 
+client = OpenAI(max_retries=0)
+
+def generate_answer(
+    query: str,
+    top_k: int = TOP_K,
+    filters: Optional[SearchFilter] = None,
+    diversify: Optional[bool] = None,
+    deadline: Optional[float] = QUERY_DEADLINE_S,
+    corpus: str = DEFAULT_CORPUS,
+    tracing: Optional[bool] = None
+) -> dict:
+    # tracing turns tracing on or off for this answer only; None follows tracer.enabled.
+    with tracer.trace(tracing) as trace, query_deadline(deadline):
+        result = _generate_answer(query, top_k, filters, diversify, corpus)
+    result["trace"] = trace.to_dict() if trace else None
+    return result
+
+def generate_answers(
+    queries: list[str],
+    top_k: int = TOP_K,
+    filters: Optional[SearchFilter] = None,
+    diversify: Optional[bool] = None,
+    concurrency: int = BATCH_CONCURRENCY,
+    deadline: Optional[float] = QUERY_DEADLINE_S,
+    corpus: str = DEFAULT_CORPUS
+) -> Iterator[dict]:
+    # Retrieval for each embedding batch shares one embedding request and
+    # search, bounded by the per-question deadline; a batch that fails turns
+    # into error records for its questions only. Each question's deadline and
+    # latency include its batch's retrieval time. Answers are yielded as their
+    # chat completions finish, also while later batches are still retrieved.
+    def answer(index: int, query: str, results: dict, retrieval_s: float) -> dict:
+        start = time.perf_counter()
+        try:
+            with tracer.trace() as trace, query_deadline(deadline, elapsed=retrieval_s):
+                result = _answer(query, results)
+            result["trace"] = trace.to_dict() if trace else None
+        except Exception as e:
+            result = {"query": query, "answer": None, "error": f"{type(e).__name__}: {e}", "results": results}
+        result["index"] = index
+        result["latency_ms"] = (retrieval_s + time.perf_counter() - start) * 1000
+        return result
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="answer") as executor:
+        pending = set()
+        for offset in range(0, len(queries), EMBED_BATCH_SIZE):
+            batch = queries[offset:offset + EMBED_BATCH_SIZE]
+            start = time.perf_counter()
+            try:
+                with tracer.span("batch_retrieval"), query_deadline(deadline):
+                    retrieved = get_retriever().search_multimodal_batch(
+                        batch, top_k=top_k, filters=filters, diversify=diversify, corpus=corpus
+                    )
+            except Exception as e:
+                latency_ms = (time.perf_counter() - start) * 1000
+                for index, query in enumerate(batch, offset):
+                    yield {
+                        "index": index,
+                        "query": query,
+                        "answer": None,
+                        "error": f"retrieval failed: {type(e).__name__}: {e}",
+                        "results": {"text": [], "images": [], "query": query, "total_results": 0, "corpus": corpus},
+                        "latency_ms": latency_ms
+                    }
+                retrieved = []
+            retrieval_s = time.perf_counter() - start
+            pending.update(
+                executor.submit(answer, index, query, results, retrieval_s)
+                for index, (query, results) in enumerate(zip(batch, retrieved), offset)
+            )
+            finished = {future for future in pending if future.done()}
+            pending -= finished
+            for future in finished:
+                yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+def _generation_budget() -> float:
+    return max(GENERATION_MIN_BUDGET_S, latencies.percentile("chat_completion", GENERATION_PERCENTILE, 0.0))
+
+def _retrieval_only(query: str, results: dict, reason: str, upstream_error: Optional[str] = None) -> dict:
+    return {
+        "query": query,
+        "answer": None,
+        "degraded": True,
+        "degraded_reason": reason,
+        "upstream_error": upstream_error,
+        "results": results,
+        "total_results": results.get("total_results", 0),
+        "text_count": len(results.get("text", [])),
+        "image_count": len(results.get("images", [])),
+        "main_image": results.get("main_image"),
+        "article": results.get("article")
+    }
+
+def _generation_failure(query: str, results: dict, error: Exception) -> dict:
+    # A request timeout is the deadline running out when the timeout was cut
+    # short by it; otherwise the upstream kept failing until retries ran out.
+    if isinstance(error, DeadlineExceeded) or (isinstance(error, APITimeoutError) and remaining() <= 0):
+        return _retrieval_only(query, results, f"generation did not finish within the query deadline: {error}")
+    return _retrieval_only(
+        query, results, f"chat completion failed after retries ({type(error).__name__}): {error}",
+        upstream_error=type(error).__name__
+    )
+
+def _generate_answer(
+    query: str,
+    top_k: int,
+    filters: Optional[SearchFilter],
+    diversify: Optional[bool],
+    corpus: str
+) -> dict:
+    results = get_retriever().search_multimodal(query, top_k=top_k, filters=filters, diversify=diversify, corpus=corpus)
+    return _answer(query, results)
+
+def _answer(query: str, results: dict) -> dict:
     if results.get("text"):
         results["text"] = sorted(
             results["text"],
@@ -15,30 +146,46 @@ def generate_answer(query: str, top_k: int = TOP_K) -> dict:
             reverse=True
         )
 
-    context_parts = []
-    if results.get("text"):
-        for i, r in enumerate(results["text"], 1):
-            title = r.get("title", "Unknown")
-            issue = r.get("issue", "")
-            chunk = r.get("chunk", "")
-            score = r.get("score", 0)
-            context_parts.append(f"{i}. Article: {title} (Issue {issue})")
-            context_parts.append(f"   Content: {chunk}")
-            context_parts.append(f"   Relevance Score: {score:.4f}")
-            context_parts.append("")
-
-    context = "\n".join(context_parts) if context_parts else "No relevant context found."
-
-    prompt_with_context = RAG_PROMPT.format(context=context, query=query)
-
-    response = client.chat.completions.create(
-        model=CHAT_MODEL,
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": prompt_with_context}
-        ],
-        temperature=TEMPERATURE_STRICT
-    )
+    left = remaining()
+    if left is not None and left < _generation_budget():
+        return _retrieval_only(query, results, f"only {max(left, 0.0):.1f}s of the query deadline left for generation")
+
+    with tracer.span("prompt_assembly"):
+        context_parts = []
+        if results.get("text"):
+            for i, r in enumerate(results["text"], 1):
+                title = r.get("title", "Unknown")
+                issue = r.get("issue", "")
+                chunk = r.get("chunk", "")
+                score = r.get("score", 0)
+                context_parts.append(f"{i}. Article: {title} (Issue {issue})")
+                context_parts.append(f"   Content: {chunk}")
+                context_parts.append(f"   Relevance Score: {score:.4f}")
+                context_parts.append("")
+
+        context = "\n".join(context_parts) if context_parts else "No relevant context found."
+
+        prompt_with_context = RAG_PROMPT.format(context=context, query=query)
+
+    try:
+        with tracer.span("chat_completion"):
+            response = call_openai(
+                "chat_completion",
+                lambda timeout: client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt_with_context}
+                    ],
+                    temperature=TEMPERATURE_STRICT,
+                    timeout=timeout
+                )
+            )
+    except (DeadlineExceeded, *RETRYABLE_ERRORS) as e:
+        if remaining() is None:
+            raise
+        return _generation_failure(query, results, e)
+    tracer.record_usage("chat_completion", getattr(response, "usage", None))
 
     answer_text = response.choices[0].message.content
 
@@ -46,13 +193,16 @@ def generate_answer(query: str, top_k: int = TOP_K) -> dict:
         results["main_image"] = None
         results["images"] = []
         results["text"] = []
+        results["article"] = None
 
     return {
         "query": query,
         "answer": answer_text,
+        "degraded": False,
         "results": results,
         "total_results": results.get("total_results", 0),
         "text_count": len(results.get("text", [])),
         "image_count": len(results.get("images", [])),
-        "main_image": results.get("main_image")
+        "main_image": results.get("main_image"),
+        "article": results.get("article")
     }
@@ -1,4 +1,8 @@
-import json
+import threading
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
 
 import faiss
 import numpy as np
@@ -7,121 +11,235 @@ from openai import OpenAI
 from transformers import CLIPProcessor, CLIPModel
 
 from config import (
-    TEXT_INDEX_PATH,
-    IMAGE_INDEX_PATH,
-    UNIFIED_METADATA_PATH,
+    SERVING_MODE,
+    METADATA_BACKEND,
+    RERANK_POOL,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_POOL,
+    HOSTED_SHARDS,
+    FAISS_THREADS,
+    QUERY_BATCHING,
+    DEFAULT_CORPUS,
+    CORPUS_MEMORY_BUDGET_MB,
+    HEDGE_ENABLED,
+    EMBED_BATCH_SIZE,
     IMAGE_EMBEDDING_MODEL,
     TEXT_EMBEDDING_MODEL,
     TOP_K,
 )
+from preprocessing.data_processing import merge_chunks
+from rag.deadline import DeadlineExceeded, call_openai, remaining
+from rag.tracing import tracer
+from vectorstore import Corpus, CorpusRegistry, SearchFilter, discover_corpora
 
 class MultimodalRetriever:
-    def __init__(self):
-        self.client = OpenAI()
-
-        self.text_index = faiss.read_index(str(TEXT_INDEX_PATH))
-        self.image_index = faiss.read_index(str(IMAGE_INDEX_PATH))
+    def __init__(
+        self,
+        corpora: Optional[dict[str, Path]] = None,
+        default_corpus: Optional[str] = DEFAULT_CORPUS,
+        memory_budget_mb: float = CORPUS_MEMORY_BUDGET_MB,
+        serving_mode: str = SERVING_MODE,
+        metadata_backend: str = METADATA_BACKEND,
+        rerank_pool: int = RERANK_POOL,
+        hosted_shards: Optional[list[str]] = HOSTED_SHARDS,
+        diversify: bool = MMR_ENABLED,
+        mmr_lambda: float = MMR_LAMBDA,
+        mmr_pool: int = MMR_POOL,
+        threads: int = FAISS_THREADS,
+        batching: bool = QUERY_BATCHING,
+        load_clip: bool = True
+    ):
+        # Retries are done by call_openai within the query deadline.
+        self.client = OpenAI(max_retries=0)
+        self.corpora = CorpusRegistry(
+            discover_corpora() if corpora is None else corpora,
+            memory_budget_mb=memory_budget_mb,
+            batching=batching,
+            serving_mode=serving_mode,
+            metadata_backend=metadata_backend,
+            rerank_pool=rerank_pool,
+            hosted_shards=hosted_shards,
+            diversify=diversify,
+            mmr_lambda=mmr_lambda,
+            mmr_pool=mmr_pool,
+            threads=threads,
+            tracer=tracer
+        )
 
-        with open(UNIFIED_METADATA_PATH, "r", encoding="utf-8") as f:
-            metadata_data = json.load(f)
+        self.clip_model = None
+        self.clip_processor = None
+        if load_clip:
+            self.clip_model = CLIPModel.from_pretrained(IMAGE_EMBEDDING_MODEL)
+            self.clip_processor = CLIPProcessor.from_pretrained(IMAGE_EMBEDDING_MODEL)
 
-        self.issues = metadata_data.get("issues", {})
-        self.ids = metadata_data.get("ids", {})
-        self.types = metadata_data.get("types", [])
+        # Other corpora are loaded on their first search.
+        if default_corpus is not None:
+            self.corpora.load(default_corpus)
 
-        self.clip_model = CLIPModel.from_pretrained(IMAGE_EMBEDDING_MODEL)
-        self.clip_processor = CLIPProcessor.from_pretrained(IMAGE_EMBEDDING_MODEL)
+    @contextmanager
+    def corpus(self, name: str = DEFAULT_CORPUS) -> Iterator[Corpus]:
+        try:
+            loaded = self.corpora.acquire(name, timeout=remaining())
+        except TimeoutError as exc:
+            raise DeadlineExceeded(f"Query deadline exceeded while loading corpus {name!r}") from exc
+        try:
+            yield loaded
+        finally:
+            self.corpora.release(loaded)
 
-        print(f"Loaded text index with {len(self.ids['text'])} text chunks")
-        print(f"Loaded image index with {len(self.ids['image'])} images")
+    def embed_texts_openai(self, texts: list[str]) -> np.ndarray:
+        with tracer.span("embed_query"):
+            response = call_openai(
+                "embed_query",
+                lambda timeout: self.client.embeddings.create(
+                    model=TEXT_EMBEDDING_MODEL,
+                    input=texts,
+                    timeout=timeout
+                ),
+                hedge=HEDGE_ENABLED
+            )
+        tracer.record_usage("embed_query", getattr(response, "usage", None))
+        data = sorted(response.data, key=lambda item: item.index)
+        vectors = np.array([item.embedding for item in data], dtype="float32")
+        faiss.normalize_L2(vectors)
+        return vectors
 
     def embed_text_openai(self, text: str) -> np.ndarray:
-        response = self.client.embeddings.create(
-            model=TEXT_EMBEDDING_MODEL,
-            input=text
-        )
-        vector = np.array(response.data[0].embedding, dtype="float32").reshape(1, -1)
-        faiss.normalize_L2(vector)
-        return vector
+        return self.embed_texts_openai([text])
 
     def embed_text_clip(self, text: str) -> np.ndarray:
-        inputs = self.clip_processor(text=[text], return_tensors="pt", padding=True)
-        text_features = self.clip_model.get_text_features(**inputs)
-        vector = text_features.detach().numpy().astype("float32")
+        with tracer.span("clip_title_encode"):
+            inputs = self.clip_processor(text=[text], return_tensors="pt", padding=True)
+            text_features = self.clip_model.get_text_features(**inputs)
+            vector = text_features.detach().numpy().astype("float32")
         faiss.normalize_L2(vector)
         return vector
 
-    def search_multimodal(self, query: str, top_k: int = TOP_K) -> dict:
+    def search_text_index(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        corpus: str = DEFAULT_CORPUS
+    ) -> tuple[np.ndarray, np.ndarray]:
+        with self.corpus(corpus) as loaded:
+            return self._search_text_index(loaded, query_vectors, top_k, filters, diversify)
+
+    def _search_text_index(
+        self,
+        loaded: Corpus,
+        query_vectors: np.ndarray,
+        top_k: int,
+        filters: Optional[SearchFilter],
+        diversify: Optional[bool]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if loaded.executor is not None:
+            try:
+                return loaded.executor.search(query_vectors, top_k, filters, diversify, timeout=remaining())
+            except TimeoutError as exc:
+                raise DeadlineExceeded("Query deadline exceeded during text search") from exc
+        return loaded.store.search_text_index(query_vectors, top_k, filters, diversify)
+
+    def search_text_batch(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        corpus: str = DEFAULT_CORPUS
+    ) -> list[list[dict]]:
+        with self.corpus(corpus) as loaded:
+            return self._search_text_batch(loaded, query_vectors, top_k, filters, diversify)
+
+    def _search_text_batch(
+        self,
+        loaded: Corpus,
+        query_vectors: np.ndarray,
+        top_k: int,
+        filters: Optional[SearchFilter],
+        diversify: Optional[bool]
+    ) -> list[list[dict]]:
+        with tracer.span("text_search"):
+            D, I = self._search_text_index(loaded, query_vectors, top_k, filters, diversify)
+
+        with tracer.span("metadata_lookup"):
+            return loaded.store.resolve_text_hits(D, I)
+
+    def search_text(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        corpus: str = DEFAULT_CORPUS
+    ) -> list[dict]:
+        return self.search_text_batch(query_vector.reshape(1, -1), top_k, filters, diversify, corpus)[0]
+
+    def search_multimodal(
+        self,
+        query: str,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        corpus: str = DEFAULT_CORPUS
+    ) -> dict:
         query_vector_text = self.embed_text_openai(query)
-        D, I = self.text_index.search(query_vector_text, top_k)
-
-        if I.size == 0:
-            return {"text": [], "images": [], "query": query, "total_results": 0, "context": ""}
-
-        text_results = []
-        for rank, idx in enumerate(I[0]):
-            if idx == -1:
-                continue
-            text_id = self.ids["text"][idx]
-
-            found_meta = None
-            for issue_num, articles in self.issues.items():
-                for title, content in articles.items():
-                    for txt in content.get("text", []):
-                        if txt["id"] == text_id:
-                            found_meta = {
-                                "issue": issue_num,
-                                "title": title,
-                                **txt
-                            }
-                            break
-                    if found_meta:
-                        break
-                if found_meta:
-                    break
-
-            if found_meta:
-                text_results.append({
-                    "id": text_id,
-                    "score": float(D[0][rank]),
-                    "rank": rank + 1,
-                    **found_meta
-                })
+        # One lease for the whole query, so the text hits, images and article
+        # all come from the same loaded corpus.
+        with self.corpus(corpus) as loaded:
+            text_results = self._search_text_batch(loaded, query_vector_text, top_k, filters, diversify)[0]
+            return self._attach_images(loaded, query, text_results)
+
+    def search_multimodal_batch(
+        self,
+        queries: list[str],
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        corpus: str = DEFAULT_CORPUS,
+        embed_batch_size: int = EMBED_BATCH_SIZE
+    ) -> list[dict]:
+        if not queries:
+            return []
+        vectors = np.concatenate([
+            self.embed_texts_openai(queries[offset:offset + embed_batch_size])
+            for offset in range(0, len(queries), embed_batch_size)
+        ])
+        with self.corpus(corpus) as loaded:
+            text_results = self._search_text_batch(loaded, vectors, top_k, filters, diversify)
+            return [self._attach_images(loaded, query, results) for query, results in zip(queries, text_results)]
 
+    def _attach_images(self, loaded: Corpus, query: str, text_results: list[dict]) -> dict:
         if not text_results:
-            return {"text": [], "images": [], "query": query, "total_results": 0, "context": ""}
+            return {
+                "text": [], "images": [], "query": query, "total_results": 0, "context": "",
+                "article": None, "corpus": loaded.name
+            }
 
         main_article_title = text_results[0]["title"]
-        main_issue = text_results[0]["issue"]
 
-        article_images = self.issues[main_issue][main_article_title].get("image", [])
+        article_images = loaded.store.metadata.article_images(text_results[0]["article"])
 
         image_results = []
         markdown_image = ""
-        if article_images:
+        if article_images and self.clip_model is not None:
             title_vector = self.embed_text_clip(main_article_title)
 
-            image_indices = []
-            for img in article_images:
-                if img["id"] in self.ids["image"]:
-                    image_indices.append(self.ids["image"].index(img["id"]))
+            image_indices = [img["row"] for img in article_images]
 
             if image_indices:
-                sub_image_index = faiss.IndexFlatIP(self.image_index.d)
-                sub_embeds = np.zeros((len(image_indices), self.image_index.d), dtype="float32")
-                for i, idx in enumerate(image_indices):
-                    self.image_index.reconstruct(idx, sub_embeds[i])
-                sub_image_index.add(sub_embeds)
-
-                D_img, I_img = sub_image_index.search(title_vector, len(image_indices))
-
-                for rank, local_idx in enumerate(I_img[0]):
-                    global_idx = image_indices[local_idx]
-                    img_id = self.ids["image"][global_idx]
-                    img_meta = next((img for img in article_images if img["id"] == img_id), None)
-                    if img_meta:
+                with tracer.span("image_rerank"):
+                    sub_image_index = faiss.IndexFlatIP(loaded.store.image_index.d)
+                    sub_image_index.add(loaded.store.image_vectors_for(image_indices))
+
+                    D_img, I_img = sub_image_index.search(title_vector, len(image_indices))
+
+                    for rank, local_idx in enumerate(I_img[0]):
+                        img_meta = article_images[local_idx]
                         image_results.append({
-                            "id": img_id,
+                            "id": img_meta["id"],
                             "score": float(D_img[0][rank]),
                             "rank": rank + 1,
                             **img_meta
@@ -145,7 +263,33 @@ class MultimodalRetriever:
             "query": query,
             "total_results": len(text_results) + len(image_results),
             "context": context,
-            "main_image": main_image
+            "main_image": main_image,
+            "article": self._article_view(loaded, text_results[0]["article"]),
+            "corpus": loaded.name
         }
 
-retriever_instance = MultimodalRetriever()
+    def _article_view(self, loaded: Corpus, article: int) -> dict:
+        metadata = loaded.store.metadata
+        record = metadata.article(article)
+        return {
+            "title": record["title"],
+            "issue": record["issue"],
+            "summary": metadata.article_summary(article),
+            "text": merge_chunks(metadata.article_chunks(article))
+        }
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+def get_retriever() -> MultimodalRetriever:
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = MultimodalRetriever()
+    return _retriever
+
+def __getattr__(name: str):
+    if name == "retriever_instance":
+        return get_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,205 @@
+import threading
+import time
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+import numpy as np
+
+from config import TRACING_ENABLED, TRACE_WINDOW
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+# Set by trace(enabled=...) to turn tracing on or off for one request without
+# touching the process-wide switch.
+_trace_enabled: ContextVar[Optional[bool]] = ContextVar("trace_enabled", default=None)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "start", "duration")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.duration = time.perf_counter() - self.start
+        self.tracer._record_span(self)
+        return False
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans = []
+        self.tokens = {}
+
+    def add_span(self, span: Span) -> None:
+        self.spans.append({
+            "stage": span.name,
+            "offset_ms": (span.start - self.start) * 1000,
+            "duration_ms": span.duration * 1000,
+        })
+
+    def add_tokens(self, stage: str, counts: dict) -> None:
+        stage_tokens = self.tokens.setdefault(stage, {})
+        for key, value in counts.items():
+            stage_tokens[key] = stage_tokens.get(key, 0) + value
+
+    def to_dict(self) -> dict:
+        return {
+            "total_ms": self.duration * 1000,
+            "spans": self.spans,
+            "tokens": self.tokens,
+        }
+
+
+class Tracer:
+    def __init__(self, enabled: bool = TRACING_ENABLED, window: int = TRACE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.last_trace = None
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._tokens = {}
+
+    @property
+    def active(self) -> bool:
+        enabled = _trace_enabled.get()
+        return self.enabled if enabled is None else enabled
+
+    def span(self, name: str):
+        if not self.active:
+            return _NULL_SPAN
+        return Span(self, name)
+
+    @contextmanager
+    def trace(self, enabled: Optional[bool] = None):
+        enabled_token = _trace_enabled.set(enabled) if enabled is not None else None
+        try:
+            if not self.active:
+                yield None
+                return
+
+            trace = Trace()
+            token = _current_trace.set(trace)
+            try:
+                yield trace
+            finally:
+                trace.duration = time.perf_counter() - trace.start
+                _current_trace.reset(token)
+                self._record_duration("total", trace.duration)
+                self.last_trace = trace.to_dict()
+        finally:
+            if enabled_token is not None:
+                _trace_enabled.reset(enabled_token)
+
+    def record_usage(self, stage: str, usage) -> None:
+        if not self.active or usage is None:
+            return
+
+        counts = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+            "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        }
+
+        with self._lock:
+            stage_tokens = self._tokens.setdefault(stage, {"calls": 0, **{k: 0 for k in counts}})
+            stage_tokens["calls"] += 1
+            for key, value in counts.items():
+                stage_tokens[key] += value
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_tokens(stage, counts)
+
+    def _record_span(self, span: Span) -> None:
+        self._record_duration(span.name, span.duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(span)
+
+    def _record_duration(self, name: str, duration: float) -> None:
+        with self._lock:
+            samples = self._durations.get(name)
+            if samples is None:
+                samples = self._durations[name] = deque(maxlen=self.window)
+            samples.append(duration)
+
+    def stats(self) -> dict:
+        with self._lock:
+            snapshot = {name: np.fromiter(samples, dtype="float64") for name, samples in self._durations.items()}
+
+        stats = {}
+        for name, samples in snapshot.items():
+            if samples.size == 0:
+                continue
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+            stats[name] = {
+                "count": int(samples.size),
+                "mean_ms": float(samples.mean() * 1000),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+            }
+        return stats
+
+    def export(self) -> dict:
+        with self._lock:
+            tokens = {stage: dict(counts) for stage, counts in self._tokens.items()}
+        return {
+            "enabled": self.enabled,
+            "window": self.window,
+            "stages": self.stats(),
+            "tokens": tokens,
+            "last_trace": self.last_trace,
+        }
+
+    def format_report(self) -> str:
+        exported = self.export()
+        if not exported["stages"]:
+            return "No trace data recorded."
+
+        lines = [f"{'stage':<20}{'count':>8}{'mean ms':>12}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}"]
+        for name, s in exported["stages"].items():
+            lines.append(
+                f"{name:<20}{s['count']:>8}{s['mean_ms']:>12.2f}{s['p50_ms']:>12.2f}{s['p95_ms']:>12.2f}{s['p99_ms']:>12.2f}"
+            )
+
+        if exported["tokens"]:
+            lines.append("")
+            lines.append(f"{'stage':<20}{'calls':>8}{'prompt':>12}{'completion':>12}{'total':>12}")
+            for stage, t in exported["tokens"].items():
+                lines.append(
+                    f"{stage:<20}{t['calls']:>8}{t['prompt_tokens']:>12}{t['completion_tokens']:>12}{t['total_tokens']:>12}"
+                )
+        return "\n".join(lines)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self._tokens.clear()
+            self.last_trace = None
+
+
+tracer = Tracer()
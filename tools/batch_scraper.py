@@ -1,23 +1,22 @@
 import aiohttp
+import argparse
 import asyncio
-import json
 import os
 import re
 
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 
-from config import BASE_URL, START_URL
+from config import BASE_URL, START_URL, RAW_JSON, RAW_IMAGES_DIR
+from tools.records import RecordWriter, iter_records
 
 class BatchScraper:
-    def __init__(self):
-        root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-        self.data_dir = os.path.join(root_dir, "data", "raw")
-        self.images_dir = os.path.join(self.data_dir, "images")
-        os.makedirs(self.data_dir, exist_ok=True)
+    def __init__(self, news_path: str = str(RAW_JSON), append: bool = False):
+        self.images_dir = str(RAW_IMAGES_DIR)
         os.makedirs(self.images_dir, exist_ok=True)
-        self.news_path = os.path.join(self.data_dir, "News.json")
-        self.all_articles = []
+        self.news_path = news_path
+        self.append = append
+        self.writer = None
 
     async def fetch(self, session: aiohttp.ClientSession, url: str) -> str:
         async with session.get(url) as response:
@@ -106,7 +105,7 @@ class BatchScraper:
                 image_path = os.path.join(self.images_dir, image_filename)
                 await self.download_image(session, image_url, image_path)
 
-            self.all_articles.append({
+            self.writer.write({
                 "issue": issue_num,
                 "title": title,
                 "url": issue_url,
@@ -122,21 +121,33 @@ class BatchScraper:
                     with open(filepath, "wb") as f:
                         f.write(await resp.read())
 
-    async def save_all_articles(self):
-        with open(self.news_path, "w", encoding="utf-8") as f:
-            json.dump(self.all_articles, f, ensure_ascii=False, indent=2)
-        print(f"[INFO] Saved all articles to {self.news_path}")
+    def scraped_issues(self) -> set[int]:
+        if not (self.append and os.path.exists(self.news_path)):
+            return set()
+        return {int(article["issue"]) for article in iter_records(self.news_path)}
 
     async def run(self):
         async with aiohttp.ClientSession() as session:
             issues = await self.get_last_issues(session)
-            for issue_num, issue_url in issues:
-                print(f"[INFO] Scraping issue {issue_num}: {issue_url}")
-                await self.scrape_issue(session, issue_num, issue_url)
+            done = self.scraped_issues()
+            # Each article is written as its own record as soon as it is
+            # scraped, so preprocessing can follow the file while this runs.
+            with RecordWriter(self.news_path, append=self.append) as self.writer:
+                for issue_num, issue_url in issues:
+                    if issue_num in done:
+                        print(f"[INFO] Skipping already scraped issue {issue_num}")
+                        continue
+                    print(f"[INFO] Scraping issue {issue_num}: {issue_url}")
+                    await self.scrape_issue(session, issue_num, issue_url)
 
-            await self.save_all_articles()
+        print(f"[INFO] Saved {self.writer.count} articles to {self.news_path}")
 
 
 if __name__ == "__main__":
-    scraper = BatchScraper()
+    parser = argparse.ArgumentParser(description="Scrape the latest issues of The Batch")
+    parser.add_argument("--output", default=str(RAW_JSON), help="records file; .gz/.bz2/.xz suffixes are compressed")
+    parser.add_argument("--append", action="store_true", help="append new issues to the existing records")
+    args = parser.parse_args()
+
+    scraper = BatchScraper(news_path=args.output, append=args.append)
     asyncio.run(scraper.run())
@@ -1,7 +1,8 @@
-import json
+import argparse
 import os
 
 from pathlib import Path
+from typing import Optional
 
 from openai import OpenAI
 from transformers import CLIPProcessor, CLIPModel
@@ -11,8 +12,11 @@ from config import (
     TEXT_EMBEDDING_MODEL,
     PROCESSED_JSON,
     TEXT_EMBEDDINGS_PATH,
-    IMAGE_EMBEDDINGS_PATH
+    IMAGE_EMBEDDINGS_PATH,
+    DEDUP_ENABLED
 )
+from preprocessing.dedup import NearDuplicateIndex
+from tools.records import RecordWriter, iter_records
 
 
 class MultimodalEmbeddings:
@@ -21,13 +25,16 @@ class MultimodalEmbeddings:
         self.clip_model = CLIPModel.from_pretrained(IMAGE_EMBEDDING_MODEL)
         self.clip_processor = CLIPProcessor.from_pretrained(IMAGE_EMBEDDING_MODEL)
         self.processed_data = None
-        self.text_embeddings = []
-        self.image_embeddings = []
+        self.text_writer = None
+        self.image_writer = None
+        self.embedded = 0
+        self.dim = None
+        self.dedup = None
 
-    def load_data(self):
-        data_path = Path(PROCESSED_JSON)
-        self.processed_data = json.loads(data_path.read_text(encoding="utf-8"))
-        print(f"Loaded {len(self.processed_data)} articles")
+    def load_data(self, data_path: Path = PROCESSED_JSON, follow: bool = False):
+        # A generator, so embedding starts with the first article and can keep
+        # up with preprocessing that is still writing the records file.
+        self.processed_data = iter_records(data_path, follow=follow)
 
     def embed_text_openai(self, text: str) -> list[float]:
         response = self.client.embeddings.create(
@@ -41,30 +48,48 @@ class MultimodalEmbeddings:
         text_features = self.clip_model.get_text_features(**inputs)
         return text_features.detach().numpy().flatten().tolist()
 
+    def find_duplicate(self, article: dict, chunk: str) -> Optional[int]:
+        if self.dedup is None:
+            return None
+        weighted_text = (article["title"] + " ") * 3 + chunk
+        return self.dedup.add(chunk, (article["issue"], article["title"]), cost_text=weighted_text)
+
     def process_article(self, article: dict):
         issue = article["issue"]
         title = article["title"]
         url = article["url"]
 
         for idx, chunk in enumerate(article.get("chunks", [])):
-            weighted_text = (title + " ") * 3 + chunk
-            embedding = self.embed_text_openai(weighted_text)
-            self.text_embeddings.append({
+            metadata = {
+                "issue": issue,
+                "title": title,
+                "url": url,
+                "chunk": chunk,
+                "content_type": "text"
+            }
+            # Positions in the dedup index line up with the text embedding
+            # records, since every chunk is added to both in the same order.
+            canonical = self.find_duplicate(article, chunk)
+            if canonical is not None:
+                # Near-duplicates reuse the canonical chunk's vector instead of
+                # costing another embedding call and another index row.
+                metadata["duplicate_of"] = canonical
+                embedding = None
+            else:
+                weighted_text = (title + " ") * 3 + chunk
+                embedding = self.embed_text_openai(weighted_text)
+                self.embedded += 1
+                self.dim = len(embedding)
+            self.text_writer.write({
                 "id": f"{issue}_chunk_{idx}",
                 "embedding": embedding,
-                "metadata": {
-                    "issue": issue,
-                    "title": title,
-                    "url": url,
-                    "chunk": chunk,
-                    "content_type": "text"
-                }
+                "metadata": metadata
             })
 
         img_path = article.get("image_path")
         if img_path:
             embedding = self.embed_text_clip(title)  # не картинка, а title
-            self.image_embeddings.append({
+            self.image_writer.write({
                 "id": f"{issue}_image",
                 "embedding": embedding,
                 "metadata": {
@@ -72,37 +97,54 @@ class MultimodalEmbeddings:
                     "title": title,
                     "url": url,
                     "image_path": os.path.basename(img_path) if img_path else None,
+                    "image_variants": article.get("image_variants"),
                     "content_type": "image"
                 }
             })
 
-    def create_embeddings(self):
+    def create_embeddings(
+        self,
+        text_embeddings_path: Path = TEXT_EMBEDDINGS_PATH,
+        image_embeddings_path: Path = IMAGE_EMBEDDINGS_PATH
+    ):
+        # Written record by record, so memory stays flat however large the
+        # archive; the files replace the previous ones only once complete.
         print("Creating separate text and image embeddings...")
-        for article in self.processed_data:
-            self.process_article(article)
-        print(f"Created {len(self.text_embeddings)} text embeddings and {len(self.image_embeddings)} image embeddings")
-
-    def save_embeddings(self):
-        Path(TEXT_EMBEDDINGS_PATH).parent.mkdir(parents=True, exist_ok=True)
-        Path(IMAGE_EMBEDDINGS_PATH).parent.mkdir(parents=True, exist_ok=True)
-
-        with open(TEXT_EMBEDDINGS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(self.text_embeddings, f, ensure_ascii=False, indent=2)
-        print(f"Text embeddings saved: {TEXT_EMBEDDINGS_PATH}")
-
-        with open(IMAGE_EMBEDDINGS_PATH, 'w', encoding='utf-8') as f:
-            json.dump(self.image_embeddings, f, ensure_ascii=False, indent=2)
-        print(f"Image embeddings saved: {IMAGE_EMBEDDINGS_PATH}")
+        self.dedup = NearDuplicateIndex() if DEDUP_ENABLED else None
+        text_tmp = Path(f"{text_embeddings_path}.tmp")
+        image_tmp = Path(f"{image_embeddings_path}.tmp")
+        articles = 0
+        with RecordWriter(text_tmp) as self.text_writer, RecordWriter(image_tmp) as self.image_writer:
+            for article in self.processed_data:
+                self.process_article(article)
+                articles += 1
+        os.replace(text_tmp, text_embeddings_path)
+        os.replace(image_tmp, image_embeddings_path)
+
+        print(f"Loaded {articles} articles")
+        print(
+            f"Created {self.embedded} text embeddings for {self.text_writer.count} chunks "
+            f"and {self.image_writer.count} image embeddings"
+        )
+        if DEDUP_ENABLED and self.embedded:
+            print(self.dedup.report.format(dim=self.dim))
+        print(f"Text embeddings saved: {text_embeddings_path}")
+        print(f"Image embeddings saved: {image_embeddings_path}")
 
-    def run_indexing(self):
-        self.load_data()
+    def run_indexing(self, data_path: Path = PROCESSED_JSON, follow: bool = False):
+        self.load_data(data_path, follow=follow)
         self.create_embeddings()
-        self.save_embeddings()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Create text and image embeddings for processed articles")
+    parser.add_argument("--input", type=Path, default=PROCESSED_JSON)
+    parser.add_argument("--follow", action="store_true",
+                        help="keep embedding articles while preprocessing is still writing them")
+    args = parser.parse_args()
+
     indexer = MultimodalEmbeddings()
-    indexer.run_indexing()
+    indexer.run_indexing(args.input, follow=args.follow)
 
 
 if __name__ == "__main__":
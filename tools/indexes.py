@@ -1,3 +1,4 @@
+import argparse
 import json
 import re
 
@@ -11,26 +12,43 @@ from config import (
     IMAGE_EMBEDDINGS_PATH,
     TEXT_INDEX_PATH,
     IMAGE_INDEX_PATH,
-    UNIFIED_METADATA_PATH
+    TEXT_SHARDS_DIR,
+    UNIFIED_METADATA_PATH,
+    MMAP_METADATA_DIR,
+    METADATA_DB_PATH,
+    TEXT_VECTORS_PATH,
+    IMAGE_VECTORS_PATH,
+    INDEX_TYPE,
+    PQ_M,
+    PQ_NBITS,
+    NUM_SHARDS,
+    SHARD_BY,
+    INDEXES_DIR,
+    CORPORA_DIR,
+    SUMMARY_CACHE_PATH,
+    SUMMARY_CONCURRENCY
 )
+from tools.records import iter_records
+from tools.summaries import apply_summaries, load_summary_cache, summarize_metadata, summary_cache_path
+from vectorstore.metadata import write_mmap_metadata, write_sqlite_metadata
+from vectorstore.quantization import INDEX_TYPES, build_index, index_memory_bytes, is_compressed
+from vectorstore.sharding import SHARD_STRATEGIES, remove_shards, write_shards
+from vectorstore.snapshots import INDEX_FILES, SnapshotWriter, corpus_paths, link_files, snapshot_dir
 
 def slugify(text: str) -> str:
     text = text.lower()
     text = re.sub(r'[^a-z0-9]+', '-', text)
     return text.strip('-')
 
-def build_separate_indexes():
-    text_data = json.loads(Path(TEXT_EMBEDDINGS_PATH).read_text(encoding="utf-8"))
-    image_data = json.loads(Path(IMAGE_EMBEDDINGS_PATH).read_text(encoding="utf-8"))
-
+def group_metadata(text_metadata: list[dict], image_metadata: list[dict]) -> dict:
     grouped_issues = {}
     text_ids, image_ids, types = [], [], []
 
     text_counter = {}
-    text_vectors = []
-    for txt in text_data:
-        issue = txt["metadata"]["issue"]
-        title = txt["metadata"]["title"]
+    text_entries = []
+    for meta in text_metadata:
+        issue = meta["issue"]
+        title = meta["title"]
         title_slug = slugify(title)
         key = (issue, title_slug)
         text_counter[key] = text_counter.get(key, 0)
@@ -38,24 +56,32 @@ def build_separate_indexes():
         item_id = f"{issue}_{title_slug}_chunk_{text_counter[key]}"
         text_counter[key] += 1
 
-        text_ids.append(item_id)
-        types.append("text")
-        text_vectors.append(txt["embedding"])
+        entry = {
+            "id": item_id,
+            "chunk": meta.get("chunk"),
+            "url": meta.get("url"),
+            "content_type": "text"
+        }
+        text_entries.append(entry)
+
+        # Near-duplicates stay in their article but get no index row; the
+        # canonical chunk keeps back-references to them.
+        canonical = meta.get("duplicate_of")
+        if canonical is not None:
+            entry["duplicate_of"] = text_entries[canonical]["id"]
+            text_entries[canonical].setdefault("duplicates", []).append(item_id)
+        else:
+            text_ids.append(item_id)
+            types.append("text")
 
         issue_str = str(issue)
         grouped_issues.setdefault(issue_str, {}).setdefault(title, {"text": [], "image": []})
-        grouped_issues[issue_str][title]["text"].append({
-            "id": item_id,
-            "chunk": txt["metadata"].get("chunk"),
-            "url": txt["metadata"].get("url"),
-            "content_type": "text"
-        })
+        grouped_issues[issue_str][title]["text"].append(entry)
 
     image_counter = {}
-    image_vectors = []
-    for img in image_data:
-        issue = img["metadata"]["issue"]
-        title = img["metadata"]["title"]
+    for meta in image_metadata:
+        issue = meta["issue"]
+        title = meta["title"]
         title_slug = slugify(title)
         key = (issue, title_slug)
         image_counter[key] = image_counter.get(key, 0)
@@ -65,49 +91,233 @@ def build_separate_indexes():
 
         image_ids.append(item_id)
         types.append("image")
-        image_vectors.append(img["embedding"])
 
         issue_str = str(issue)
         grouped_issues.setdefault(issue_str, {}).setdefault(title, {"text": [], "image": []})
         grouped_issues[issue_str][title]["image"].append({
             "id": item_id,
-            "image_path": img["metadata"].get("image_path"),
+            "image_path": meta.get("image_path"),
+            "image_variants": meta.get("image_variants"),
             "content_type": "image"
         })
 
-    if text_vectors:
-        text_vectors = np.array(text_vectors, dtype="float32")
-        faiss.normalize_L2(text_vectors)
-        text_index = faiss.IndexFlatIP(text_vectors.shape[1])
-        text_index.add(text_vectors)
-        faiss.write_index(text_index, str(TEXT_INDEX_PATH))
-        print(f"Text index saved: {TEXT_INDEX_PATH}")
-
-    if image_vectors:
-        image_vectors = np.array(image_vectors, dtype="float32")
-        faiss.normalize_L2(image_vectors)
-        image_index = faiss.IndexFlatIP(image_vectors.shape[1])
-        image_index.add(image_vectors)
-        faiss.write_index(image_index, str(IMAGE_INDEX_PATH))
-        print(f"Image index saved: {IMAGE_INDEX_PATH}")
-
-    with open(UNIFIED_METADATA_PATH, "w", encoding="utf-8") as f:
-        json.dump({
-            "issues": grouped_issues,
-            "ids": {
-                "text": text_ids,
-                "image": image_ids
-            },
-            "types": types
-        }, f, ensure_ascii=False, indent=2)
-
-    print(f"Unified metadata saved: {UNIFIED_METADATA_PATH}")
-
-def run_index_building():
-    print("Building separate text and image indexes with grouped metadata...")
-    build_separate_indexes()
+    return {
+        "issues": grouped_issues,
+        "ids": {
+            "text": text_ids,
+            "image": image_ids
+        },
+        "types": types
+    }
+
+def write_vector_index(vectors: np.ndarray, index_path: Path, vectors_path: Path, index_type: str, label: str):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    index = build_index(vectors, index_type, pq_m=PQ_M, pq_nbits=PQ_NBITS)
+    faiss.write_index(index, str(index_path))
+    print(f"{label} index saved: {index_path}")
+
+    if is_compressed(index):
+        np.save(vectors_path, vectors)
+        full_bytes = vectors.nbytes
+        compressed_bytes = index_memory_bytes(index)
+        print(
+            f"{label} index ({index_type}): {compressed_bytes / 1e6:.2f} MB in RAM vs "
+            f"{full_bytes / 1e6:.2f} MB full precision ({full_bytes / compressed_bytes:.1f}x smaller)"
+        )
+        print(f"{label} full-precision vectors saved for re-ranking: {vectors_path}")
+
+def write_text_shards(
+    vectors: np.ndarray,
+    text_metadata: list[dict],
+    text_ids: list[str],
+    shards_dir: Path,
+    vectors_path: Path,
+    num_shards: int,
+    shard_by: str,
+    index_type: str
+):
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    faiss.normalize_L2(vectors)
+    issues = [int(meta["issue"]) for meta in text_metadata]
+    manifest = write_shards(
+        vectors, text_ids, issues, shards_dir, num_shards,
+        strategy=shard_by, index_type=index_type, pq_m=PQ_M, pq_nbits=PQ_NBITS
+    )
+    for shard in manifest["shards"]:
+        print(f"Text {shard['name']}: {shard['rows']} chunks, issues {shard['issue_min']}-{shard['issue_max']}")
+    print(f"Text index sharded by {shard_by} into {len(manifest['shards'])} shards: {shards_dir}")
+
+    if index_type != "flat":
+        np.save(vectors_path, vectors)
+        print(f"Text full-precision vectors saved for re-ranking: {vectors_path}")
+
+def build_indexes(
+    text_metadata: list[dict],
+    text_vectors: np.ndarray,
+    image_metadata: list[dict],
+    image_vectors: np.ndarray,
+    text_index_path: Path = TEXT_INDEX_PATH,
+    image_index_path: Path = IMAGE_INDEX_PATH,
+    metadata_path: Path = UNIFIED_METADATA_PATH,
+    mmap_metadata_dir: Path = MMAP_METADATA_DIR,
+    metadata_db_path: Path = METADATA_DB_PATH,
+    text_vectors_path: Path = TEXT_VECTORS_PATH,
+    image_vectors_path: Path = IMAGE_VECTORS_PATH,
+    index_type: str = INDEX_TYPE,
+    num_shards: int = NUM_SHARDS,
+    shard_by: str = SHARD_BY,
+    text_shards_dir: Path = TEXT_SHARDS_DIR,
+    summary_cache_path: Path = SUMMARY_CACHE_PATH,
+    summarize: bool = True,
+    summary_concurrency: int = SUMMARY_CONCURRENCY
+):
+    metadata = group_metadata(text_metadata, image_metadata)
+
+    indexed_metadata = [meta for meta in text_metadata if meta.get("duplicate_of") is None]
+    if len(indexed_metadata) != len(text_vectors):
+        raise ValueError(f"{len(text_vectors)} text vectors for {len(indexed_metadata)} indexed chunks")
+
+    if len(text_vectors) and num_shards > 1:
+        write_text_shards(
+            text_vectors, indexed_metadata, metadata["ids"]["text"], text_shards_dir,
+            text_vectors_path, num_shards, shard_by, index_type
+        )
+    elif len(text_vectors):
+        write_vector_index(text_vectors, text_index_path, text_vectors_path, index_type, "Text")
+        # A stale manifest would otherwise keep the retriever on the old shards.
+        remove_shards(text_shards_dir)
+
+    if len(image_vectors):
+        write_vector_index(image_vectors, image_index_path, image_vectors_path, index_type, "Image")
+
+    # Each article is summarized once; the cache is keyed by article content,
+    # so a rebuild only sends new or edited articles.
+    if summarize:
+        summarize_metadata(metadata, summary_cache_path, summary_concurrency)
+    else:
+        summarized = apply_summaries(metadata, load_summary_cache(summary_cache_path))
+        print(f"Article summaries applied from cache: {summarized}")
+
+    with open(metadata_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
+
+    print(f"Unified metadata saved: {metadata_path}")
+
+    write_metadata_stores(metadata, mmap_metadata_dir, metadata_db_path)
+
+def write_metadata_stores(
+    metadata: dict,
+    mmap_metadata_dir: Path = MMAP_METADATA_DIR,
+    metadata_db_path: Path = METADATA_DB_PATH
+):
+    write_mmap_metadata(metadata, mmap_metadata_dir)
+    print(f"Memory-mapped metadata saved: {mmap_metadata_dir}")
+
+    write_sqlite_metadata(metadata, metadata_db_path)
+    print(f"SQLite metadata saved: {metadata_db_path}")
+
+def publish_metadata(metadata: dict, corpus_dir: Path = INDEXES_DIR):
+    # Snapshots are immutable, so new metadata goes into a new version that
+    # shares the current index files.
+    with SnapshotWriter(corpus_dir) as snapshot:
+        link_files(snapshot_dir(corpus_dir), snapshot.directory, INDEX_FILES)
+        paths = corpus_paths(snapshot.directory)
+        with open(paths["metadata_path"], "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2)
+        print(f"Unified metadata saved: {paths['metadata_path']}")
+        write_metadata_stores(metadata, paths["mmap_metadata_dir"], paths["metadata_db_path"])
+
+def export_metadata_stores(corpus_dir: Path = INDEXES_DIR, summarize: bool = True):
+    metadata_path = corpus_paths(snapshot_dir(corpus_dir))["metadata_path"]
+    metadata = json.loads(Path(metadata_path).read_text(encoding="utf-8"))
+    if summarize:
+        summarize_metadata(metadata, summary_cache_path(corpus_dir))
+    publish_metadata(metadata, corpus_dir)
+
+def read_embeddings(path: Path, chunk_rows: int = 4096) -> tuple[list[dict], np.ndarray]:
+    # Records are streamed and their vectors packed into float32 blocks, so
+    # the file is never held whole, nor its vectors as Python float lists.
+    metadata, blocks, pending = [], [], []
+    for record in iter_records(path):
+        metadata.append(record["metadata"])
+        if record["embedding"] is not None:
+            pending.append(record["embedding"])
+            if len(pending) == chunk_rows:
+                blocks.append(np.array(pending, dtype="float32"))
+                pending.clear()
+    if pending:
+        blocks.append(np.array(pending, dtype="float32"))
+    vectors = np.concatenate(blocks) if blocks else np.empty((0, 0), dtype="float32")
+    return metadata, vectors
+
+def build_separate_indexes(
+    index_type: str = INDEX_TYPE,
+    num_shards: int = NUM_SHARDS,
+    shard_by: str = SHARD_BY,
+    text_embeddings_path: Path = TEXT_EMBEDDINGS_PATH,
+    image_embeddings_path: Path = IMAGE_EMBEDDINGS_PATH,
+    corpus_dir: Path = INDEXES_DIR,
+    summarize: bool = True
+):
+    text_metadata, text_vectors = read_embeddings(text_embeddings_path)
+    image_metadata, image_vectors = read_embeddings(image_embeddings_path)
+
+    # Written to a new snapshot and published only once complete, so running
+    # retrievers never read a half-written set of files.
+    with SnapshotWriter(corpus_dir) as snapshot:
+        build_indexes(
+            text_metadata,
+            text_vectors,
+            image_metadata,
+            image_vectors,
+            index_type=index_type,
+            num_shards=num_shards,
+            shard_by=shard_by,
+            summary_cache_path=summary_cache_path(corpus_dir),
+            summarize=summarize,
+            **corpus_paths(snapshot.directory)
+        )
+
+def run_index_building(
+    index_type: str = INDEX_TYPE,
+    num_shards: int = NUM_SHARDS,
+    shard_by: str = SHARD_BY,
+    text_embeddings_path: Path = TEXT_EMBEDDINGS_PATH,
+    image_embeddings_path: Path = IMAGE_EMBEDDINGS_PATH,
+    corpus_dir: Path = INDEXES_DIR,
+    summarize: bool = True
+):
+    print(f"Building separate {index_type} text and image indexes with grouped metadata...")
+    build_separate_indexes(
+        index_type, num_shards, shard_by, text_embeddings_path, image_embeddings_path, corpus_dir, summarize
+    )
     print("Index building completed!")
 
 
 if __name__ == "__main__":
-    run_index_building()
+    parser = argparse.ArgumentParser(description="Build FAISS indexes and unified metadata")
+    parser.add_argument("--metadata-only", action="store_true",
+                        help="only rebuild the mmap and SQLite metadata stores from existing unified metadata")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                        help="flat keeps float32 vectors; fp16/sq8/pq compress them and re-rank from disk")
+    parser.add_argument("--shards", type=int, default=NUM_SHARDS,
+                        help="split the text index into this many shards with a manifest")
+    parser.add_argument("--shard-by", choices=SHARD_STRATEGIES, default=SHARD_BY,
+                        help="issue: contiguous issue ranges; hash: chunk id hash")
+    parser.add_argument("--corpus", default=None,
+                        help="write a named corpus to data/corpora/<name> instead of data/indexes")
+    parser.add_argument("--text-embeddings", type=Path, default=TEXT_EMBEDDINGS_PATH)
+    parser.add_argument("--image-embeddings", type=Path, default=IMAGE_EMBEDDINGS_PATH)
+    parser.add_argument("--no-summaries", action="store_true",
+                        help="only apply cached article summaries instead of generating missing ones")
+    args = parser.parse_args()
+
+    corpus_dir = CORPORA_DIR / args.corpus if args.corpus else INDEXES_DIR
+    if args.metadata_only:
+        export_metadata_stores(corpus_dir, not args.no_summaries)
+    else:
+        run_index_building(
+            args.index_type, args.shards, args.shard_by, args.text_embeddings, args.image_embeddings, corpus_dir,
+            not args.no_summaries
+        )
@@ -0,0 +1,133 @@
+import bz2
+import gzip
+import json
+import lzma
+import os
+import sys
+import time
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+def _opener(path: Path):
+    return OPENERS.get(Path(path).suffix, open)
+
+def writing_marker(path: Path) -> Path:
+    return Path(f"{path}.writing")
+
+def open_records(path: Path, mode: str = "r"):
+    opener = _opener(path)
+    if opener is not open:
+        mode += "t"
+    return opener(path, mode, encoding="utf-8")
+
+def _is_json_array(path: Path) -> bool:
+    with open_records(path) as f:
+        while True:
+            char = f.read(1)
+            if not char or not char.isspace():
+                return char == "["
+
+def iter_records(path: Path, follow: bool = False, poll_interval: float = 0.5) -> Iterator[dict]:
+    path = Path(path)
+
+    if follow:
+        yield from _follow_records(path, poll_interval)
+        return
+
+    # Corpora written before the line-delimited format are a single JSON array.
+    if _is_json_array(path):
+        with open_records(path) as f:
+            yield from json.load(f)
+        return
+
+    with open_records(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _follow_records(path: Path, poll_interval: float) -> Iterator[dict]:
+    if _opener(path) is not open:
+        raise ValueError(f"Following is only supported for uncompressed record files: {path}")
+
+    while not path.exists():
+        time.sleep(poll_interval)
+
+    buffer = ""
+    with open(path, "r", encoding="utf-8") as f:
+        while True:
+            chunk = f.readline()
+            if chunk:
+                buffer += chunk
+                if buffer.endswith("\n"):
+                    line, buffer = buffer.strip(), ""
+                    if line:
+                        yield json.loads(line)
+                continue
+            # Check the marker before the final read so records written just
+            # before the producer finished are not lost.
+            if not writing_marker(path).exists():
+                rest = (buffer + f.read()).strip()
+                for line in rest.splitlines():
+                    if line.strip():
+                        yield json.loads(line)
+                return
+            time.sleep(poll_interval)
+
+class RecordWriter:
+    def __init__(self, path: Path, append: bool = False):
+        self.path = Path(path)
+        self.append = append
+        self.count = 0
+        self._file = None
+
+    def __enter__(self) -> "RecordWriter":
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Followers keep waiting for new records while this marker exists.
+        writing_marker(self.path).touch()
+        self._file = open_records(self.path, "a" if self.append else "w")
+        return self
+
+    def write(self, record: dict) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        # Plain files are flushed per record so followers see it immediately;
+        # flushing a compressed stream per record would ruin the compression.
+        if _opener(self.path) is open:
+            self._file.flush()
+        self.count += 1
+
+    def write_all(self, records: Iterable[dict]) -> int:
+        for record in records:
+            self.write(record)
+        return self.count
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self._file.close()
+        writing_marker(self.path).unlink(missing_ok=True)
+
+def append_records(path: Path, records: Iterable[dict]) -> int:
+    with RecordWriter(path, append=True) as writer:
+        return writer.write_all(records)
+
+def convert_json_array(source: Path, target: Optional[Path] = None) -> Path:
+    target = Path(target) if target else Path(source).with_suffix(".jsonl")
+    tmp_path = Path(f"{target}.tmp")
+    with RecordWriter(tmp_path) as writer:
+        writer.write_all(iter_records(source))
+    os.replace(tmp_path, target)
+    return target
+
+def read_queries(source: str) -> list[str]:
+    if source == "-":
+        lines = sys.stdin.read().splitlines()
+    elif Path(source).suffix == ".json":
+        # Generated evaluation queries: {query: [relevant chunk ids]}
+        return list(json.loads(Path(source).read_text(encoding="utf-8")))
+    elif Path(source).suffix in (".jsonl", *OPENERS):
+        return [record["query"] for record in iter_records(Path(source))]
+    else:
+        lines = Path(source).read_text(encoding="utf-8").splitlines()
+    return [line.strip() for line in lines if line.strip()]
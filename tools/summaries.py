@@ -0,0 +1,168 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+
+from pathlib import Path
+from typing import Optional
+
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, RateLimitError, InternalServerError
+
+from config import (
+    INDEXES_DIR,
+    CORPORA_DIR,
+    SUMMARY_CACHE_PATH,
+    CHAT_MODEL,
+    SUMMARY_PROMPT,
+    TEMPERATURE_STRICT,
+    SUMMARY_CONCURRENCY,
+    SUMMARY_MAX_ATTEMPTS,
+)
+from preprocessing.data_processing import merge_chunks
+from vectorstore.metadata import iter_articles
+from vectorstore.snapshots import corpus_paths, snapshot_dir
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+def article_text(content: dict) -> str:
+    return merge_chunks([txt.get("chunk") or "" for txt in content.get("text", [])])
+
+def article_hash(title: str, text: str) -> str:
+    # Keyed by content as well as title, so an edited article is summarized again.
+    return hashlib.sha256(f"{title}\n{text}".encode("utf-8")).hexdigest()[:16]
+
+def summary_cache_path(corpus_dir: Path = INDEXES_DIR) -> Path:
+    # One cache per corpus, next to its snapshots, so named corpora and
+    # benchmark corpora never read or extend another corpus's summaries.
+    return Path(corpus_dir) / SUMMARY_CACHE_PATH.name
+
+def load_summary_cache(cache_path: Path = SUMMARY_CACHE_PATH) -> dict[str, str]:
+    cache = {}
+    if not Path(cache_path).exists():
+        return cache
+    with open(cache_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            cache[record["article_hash"]] = record["summary"]
+    return cache
+
+def apply_summaries(metadata: dict, cache: dict[str, str]) -> int:
+    applied = 0
+    for _, title, content in iter_articles(metadata):
+        summary = cache.get(article_hash(title, article_text(content)))
+        content["summary"] = summary
+        applied += summary is not None
+    return applied
+
+async def summarize_article(client: AsyncOpenAI, semaphore: asyncio.Semaphore, title: str, text: str) -> Optional[str]:
+    prompt = SUMMARY_PROMPT.format(title=title, text=text)
+
+    for attempt in range(SUMMARY_MAX_ATTEMPTS):
+        try:
+            async with semaphore:
+                response = await client.chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=TEMPERATURE_STRICT
+                )
+            return response.choices[0].message.content.strip()
+        except RETRYABLE_ERRORS as e:
+            if attempt == SUMMARY_MAX_ATTEMPTS - 1:
+                print(f"Failed to summarize '{title}' after {attempt + 1} attempts: {e}")
+                break
+            await asyncio.sleep(min(2 ** attempt, 30) * (0.5 + random.random()))
+        except Exception as e:
+            print(f"Failed to summarize '{title}': {e}")
+            break
+
+    return None
+
+async def summarize_all(
+    metadata: dict,
+    cache_path: Path = SUMMARY_CACHE_PATH,
+    concurrency: int = SUMMARY_CONCURRENCY,
+    base_url: Optional[str] = None
+) -> int:
+    cache = load_summary_cache(cache_path)
+    pending = {}
+    articles = 0
+    for _, title, content in iter_articles(metadata):
+        articles += 1
+        text = article_text(content)
+        key = article_hash(title, text)
+        if key not in cache and text:
+            pending[key] = (title, text)
+    print(f"{articles - len(pending)} articles cached, {len(pending)} to summarize")
+    if not pending:
+        return 0
+
+    client = AsyncOpenAI(base_url=base_url, max_retries=0)
+    semaphore = asyncio.Semaphore(concurrency)
+    Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+
+    async def run(key: str, title: str, text: str):
+        return key, title, await summarize_article(client, semaphore, title, text)
+
+    written = 0
+    with open(cache_path, "a", encoding="utf-8") as cache_file:
+        for task in asyncio.as_completed([run(key, *article) for key, article in pending.items()]):
+            key, title, summary = await task
+            if summary is None:
+                continue
+            cache_file.write(json.dumps({
+                "article_hash": key,
+                "title": title,
+                "summary": summary
+            }, ensure_ascii=False) + "\n")
+            cache_file.flush()
+            written += 1
+
+    await client.close()
+    return written
+
+def summarize_metadata(
+    metadata: dict,
+    cache_path: Path = SUMMARY_CACHE_PATH,
+    concurrency: int = SUMMARY_CONCURRENCY,
+    base_url: Optional[str] = None
+) -> int:
+    # Only articles missing from the cache are sent; everything else is
+    # applied from it.
+    written = asyncio.run(summarize_all(metadata, cache_path, concurrency, base_url))
+    applied = apply_summaries(metadata, load_summary_cache(cache_path))
+    print(f"Generated {written} summaries, {applied} articles summarized")
+    return applied
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize any unsummarized articles of an existing index and store the summaries in the metadata")
+    parser.add_argument("--concurrency", type=int, default=SUMMARY_CONCURRENCY)
+    parser.add_argument("--base-url", default=None,
+                        help="OpenAI-compatible endpoint, e.g. a local fake server for testing")
+    parser.add_argument("--corpus", default=None, help="summarize data/corpora/<name> instead of data/indexes")
+    parser.add_argument("--cache", type=Path, default=None, help="defaults to <corpus>/summary_cache.jsonl")
+    args = parser.parse_args()
+
+    # Imported here: tools.indexes summarizes articles on every build.
+    from tools.indexes import publish_metadata
+
+    corpus_dir = CORPORA_DIR / args.corpus if args.corpus else INDEXES_DIR
+    metadata_path = corpus_paths(snapshot_dir(corpus_dir))["metadata_path"]
+    metadata = json.loads(Path(metadata_path).read_text(encoding="utf-8"))
+    summarize_metadata(
+        metadata,
+        cache_path=args.cache or summary_cache_path(corpus_dir),
+        concurrency=args.concurrency,
+        base_url=args.base_url
+    )
+
+    publish_metadata(metadata, corpus_dir)
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,13 @@
 from .vectorstore import VectorStore
+from .executor import QueryExecutor
+from .registry import Corpus, CorpusRegistry, discover_corpora
+from .snapshots import SnapshotWriter, corpus_paths, current_version, snapshot_dir, verify_snapshot
+from .metadata import (
+    JsonMetadata,
+    MmapMetadata,
+    SqliteMetadata,
+    open_metadata,
+    write_mmap_metadata,
+    write_sqlite_metadata,
+)
+from .filters import SearchFilter
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+def mmr_select(
+    query_vector: np.ndarray,
+    candidate_vectors: np.ndarray,
+    top_k: int,
+    lambda_: float = 0.7
+) -> np.ndarray:
+    num_candidates = candidate_vectors.shape[0]
+    top_k = min(top_k, num_candidates)
+    if top_k == 0:
+        return np.empty(0, dtype="int64")
+
+    relevance = candidate_vectors @ query_vector
+
+    selected = np.empty(top_k, dtype="int64")
+    # Running max similarity to the selected set. Only the rows of picked
+    # candidates are ever needed, so each pick costs one matrix-vector product
+    # instead of materialising the full pool x pool similarity matrix.
+    redundancy = np.full(num_candidates, -np.inf, dtype=relevance.dtype)
+    available = np.ones(num_candidates, dtype=bool)
+
+    first = int(relevance.argmax())
+    selected[0] = first
+    available[first] = False
+    np.maximum(redundancy, candidate_vectors @ candidate_vectors[first], out=redundancy)
+
+    for step in range(1, top_k):
+        scores = lambda_ * relevance - (1 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        pick = int(scores.argmax())
+        selected[step] = pick
+        available[pick] = False
+        np.maximum(redundancy, candidate_vectors @ candidate_vectors[pick], out=redundancy)
+
+    return selected
+
+
+def mmr_rerank(
+    query_vectors: np.ndarray,
+    candidates: np.ndarray,
+    vectors_for,
+    top_k: int,
+    lambda_: float = 0.7
+) -> tuple[np.ndarray, np.ndarray]:
+    num_queries = query_vectors.shape[0]
+    D = np.full((num_queries, top_k), -np.inf, dtype="float32")
+    I = np.full((num_queries, top_k), -1, dtype="int64")
+
+    valid = candidates >= 0
+    if num_queries == 1:
+        pools = [candidates[0][valid[0]]]
+        rows = pools[0]
+        row_vectors = np.asarray(vectors_for(rows), dtype="float32")
+    else:
+        # One batched lookup for every distinct candidate across the queries.
+        rows, inverse = np.unique(candidates[valid], return_inverse=True)
+        pools = np.split(inverse, np.cumsum(valid.sum(axis=1))[:-1])
+        row_vectors = np.asarray(vectors_for(rows), dtype="float32") if rows.size else None
+
+    for q in range(num_queries):
+        if pools[q].size == 0:
+            continue
+        pool_vectors = row_vectors if num_queries == 1 else row_vectors[pools[q]]
+        picked = mmr_select(query_vectors[q], pool_vectors, top_k, lambda_)
+        D[q, :picked.size] = pool_vectors[picked] @ query_vectors[q]
+        I[q, :picked.size] = candidates[q][valid[q]][picked]
+    return D, I
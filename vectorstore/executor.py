@@ -0,0 +1,139 @@
+import contextvars
+import queue
+import threading
+import time
+
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from config import QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, TOP_K
+from vectorstore.filters import SearchFilter
+
+
+@dataclass
+class _Request:
+    vector: np.ndarray
+    key: tuple
+    future: Future
+    # The caller's context (query deadline, trace, per-request tracing switch),
+    # so its re-ranking spans land in the caller's trace.
+    context: contextvars.Context
+
+
+class QueryExecutor:
+    def __init__(self, store, max_batch: int = QUERY_BATCH_SIZE, max_wait_ms: float = QUERY_BATCH_WAIT_MS):
+        self.store = store
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.queries = 0
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        # A single search thread per process: concurrent callers are coalesced
+        # into one FAISS call that uses the store's whole OpenMP budget, instead
+        # of every caller starting its own team of OpenMP threads.
+        self._thread = threading.Thread(target=self._run, name="vectorstore-query", daemon=True)
+        self._thread.start()
+
+    def submit(
+        self,
+        query_vector: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> Future:
+        future = Future()
+        vector = np.asarray(query_vector, dtype="float32").reshape(-1)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Query executor is closed")
+            self._queue.put(_Request(vector, (top_k, filters, diversify), future, contextvars.copy_context()))
+        return future
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None,
+        timeout: Optional[float] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        futures = [self.submit(vector, top_k, filters, diversify) for vector in np.atleast_2d(query_vectors)]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(None if deadline is None else max(0.0, deadline - time.monotonic())))
+            except TimeoutError:
+                for pending in futures:
+                    pending.cancel()
+                raise
+        return np.stack([D for D, _ in results]), np.stack([I for _, I in results])
+
+    def _collect(self) -> tuple[list[_Request], bool]:
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            # Without a wait this only drains what queued up during the
+            # previous search, so an idle executor adds no latency.
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self) -> None:
+        while True:
+            batch, stop = self._collect()
+
+            groups = {}
+            for request in batch:
+                if request.future.set_running_or_notify_cancel():
+                    groups.setdefault(request.key, []).append(request)
+
+            for (top_k, filters, diversify), requests in groups.items():
+                vectors = np.stack([request.vector for request in requests])
+                try:
+                    D, I = self.store.search_text_candidates(vectors, top_k, filters, diversify)
+                except Exception as exc:
+                    for request in requests:
+                        request.future.set_exception(exc)
+                    continue
+                for q, request in enumerate(requests):
+                    try:
+                        result = request.context.run(
+                            self.store.finish_text_search, vectors[q:q + 1], D[q:q + 1], I[q:q + 1], top_k, diversify
+                        )
+                    except Exception as exc:
+                        request.future.set_exception(exc)
+                        continue
+                    request.future.set_result((result[0][0], result[1][0]))
+                self.batches += 1
+                self.queries += len(requests)
+
+            if stop:
+                return
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.queries / self.batches if self.batches else 0.0
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,168 @@
+import math
+import threading
+
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+import faiss
+import numpy as np
+
+from vectorstore.quantization import base_index, rerank_exact
+
+EXACT_FILTER_LIMIT = 4096
+
+
+@dataclass(frozen=True)
+class SearchFilter:
+    issue_min: Optional[int] = None
+    issue_max: Optional[int] = None
+    issues: Optional[frozenset] = None
+    titles: Optional[frozenset] = None
+
+    @classmethod
+    def create(
+        cls,
+        issue_min: Optional[int] = None,
+        issue_max: Optional[int] = None,
+        issues: Optional[Iterable[int]] = None,
+        titles: Optional[Iterable[str]] = None
+    ) -> "SearchFilter":
+        return cls(
+            issue_min=issue_min,
+            issue_max=issue_max,
+            issues=frozenset(int(issue) for issue in issues) if issues else None,
+            titles=frozenset(titles) if titles else None
+        )
+
+    def is_empty(self) -> bool:
+        return self.issue_min is None and self.issue_max is None and not self.issues and not self.titles
+
+
+class CompiledFilter:
+    def __init__(self, bits: np.ndarray, size: int, count: int, key: Optional[SearchFilter] = None):
+        self.size = size
+        self.count = count
+        self.key = key
+        # The selector reads the packed bits through a raw pointer, so they
+        # must live as long as the selector does.
+        self._bits = bits
+        self.selector = faiss.IDSelectorBitmap(len(self._bits), faiss.swig_ptr(self._bits))
+        self.params = faiss.SearchParameters(sel=self.selector)
+        self._mask = None
+        self._rows = None
+
+    @classmethod
+    def from_mask(cls, mask: np.ndarray, key: Optional[SearchFilter] = None) -> "CompiledFilter":
+        compiled = cls(np.packbits(mask, bitorder="little"), len(mask), int(mask.sum()), key)
+        compiled._mask = mask
+        return compiled
+
+    def __reduce__(self):
+        # Only the packed bits cross a process boundary (an eighth of the
+        # mask); the selector is rebuilt on the other side.
+        return (CompiledFilter, (self._bits, self.size, self.count, self.key))
+
+    @property
+    def mask(self) -> np.ndarray:
+        if self._mask is None:
+            self._mask = np.unpackbits(self._bits, count=self.size, bitorder="little").astype(bool)
+        return self._mask
+
+    @property
+    def rows(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.flatnonzero(self.mask)
+        return self._rows
+
+
+class FilterCompiler:
+    def __init__(self, metadata, cache_size: int = 64):
+        self.metadata = metadata
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._row_articles = None
+        self._article_issues = None
+        self._cache = {}
+
+    def _load(self):
+        if self._row_articles is None:
+            self._row_articles = np.asarray(self.metadata.text_row_articles(), dtype="int64")
+            self._article_issues = np.asarray(self.metadata.article_issues(), dtype="int64")
+
+    def compile(self, search_filter: Optional[SearchFilter]) -> Optional[CompiledFilter]:
+        if search_filter is None or search_filter.is_empty():
+            return None
+
+        with self._lock:
+            compiled = self._cache.get(search_filter)
+            if compiled is not None:
+                return compiled
+
+            self._load()
+            allowed = np.ones(len(self._article_issues), dtype=bool)
+            if search_filter.issue_min is not None:
+                allowed &= self._article_issues >= search_filter.issue_min
+            if search_filter.issue_max is not None:
+                allowed &= self._article_issues <= search_filter.issue_max
+            if search_filter.issues:
+                allowed &= np.isin(self._article_issues, list(search_filter.issues))
+            if search_filter.titles:
+                title_mask = np.zeros_like(allowed)
+                title_mask[self.metadata.articles_with_titles(search_filter.titles)] = True
+                allowed &= title_mask
+
+            mask = np.zeros(len(self._row_articles), dtype=bool)
+            valid = self._row_articles >= 0
+            mask[valid] = allowed[self._row_articles[valid]]
+
+            compiled = CompiledFilter.from_mask(mask, key=search_filter)
+            if len(self._cache) >= self.cache_size:
+                self._cache.pop(next(iter(self._cache)))
+            self._cache[search_filter] = compiled
+            return compiled
+
+
+def supports_search_params(index: faiss.Index) -> bool:
+    return not isinstance(base_index(index), (faiss.IndexPQ, faiss.IndexPQFastScan))
+
+
+def empty_result(num_queries: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    return (
+        np.full((num_queries, k), -np.inf, dtype="float32"),
+        np.full((num_queries, k), -1, dtype="int64")
+    )
+
+
+def filtered_search(
+    index: faiss.Index,
+    query_vectors: np.ndarray,
+    k: int,
+    compiled: CompiledFilter,
+    vectors: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    if compiled.count == 0:
+        return empty_result(query_vectors.shape[0], k)
+
+    if supports_search_params(index):
+        return index.search(query_vectors, k, params=compiled.params)
+
+    if vectors is not None and compiled.count <= EXACT_FILTER_LIMIT:
+        candidates = np.broadcast_to(compiled.rows, (query_vectors.shape[0], compiled.count))
+        return rerank_exact(query_vectors, candidates, vectors, k)
+
+    # Index types without IDSelector support: over-fetch in proportion to the
+    # filter's selectivity and widen until every query has k allowed hits.
+    fetch = min(index.ntotal, math.ceil(k * index.ntotal / compiled.count * 1.5))
+    while True:
+        D, I = index.search(query_vectors, fetch)
+        allowed = (I >= 0) & compiled.mask[np.maximum(I, 0)]
+        if fetch >= index.ntotal or (allowed.sum(axis=1) >= min(k, compiled.count)).all():
+            break
+        fetch = min(index.ntotal, fetch * 4)
+
+    out_D, out_I = empty_result(query_vectors.shape[0], k)
+    for q in range(query_vectors.shape[0]):
+        keep = np.flatnonzero(allowed[q])[:k]
+        out_D[q, :len(keep)] = D[q, keep]
+        out_I[q, :len(keep)] = I[q, keep]
+    return out_D, out_I
@@ -0,0 +1,465 @@
+import json
+import mmap
+import os
+import sqlite3
+import threading
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Sequence
+
+import numpy as np
+
+
+def issue_number(issue) -> int:
+    try:
+        return int(issue)
+    except (TypeError, ValueError):
+        return -1
+
+
+def iter_articles(metadata: dict) -> Iterator[tuple[str, str, dict]]:
+    for issue, articles in metadata.get("issues", {}).items():
+        for title, content in articles.items():
+            yield issue, title, content
+
+
+class JsonMetadata:
+    def __init__(self, metadata_path: Path):
+        with open(metadata_path, "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+
+        ids = metadata.get("ids", {})
+        text_rows = {text_id: row for row, text_id in enumerate(ids.get("text", []))}
+        image_rows = {image_id: row for row, image_id in enumerate(ids.get("image", []))}
+
+        self.text_count = len(text_rows)
+        self.image_count = len(image_rows)
+        self.articles = []
+        self._text = [None] * self.text_count
+        self._article_images = []
+        self._article_chunks = []
+        self._summaries = []
+
+        for issue, title, content in iter_articles(metadata):
+            article = len(self.articles)
+            self.articles.append({"issue": issue, "title": title})
+            self._summaries.append(content.get("summary"))
+            self._article_chunks.append([txt.get("chunk") or "" for txt in content.get("text", [])])
+            for txt in content.get("text", []):
+                row = text_rows.get(txt["id"])
+                if row is not None:
+                    self._text[row] = (article, txt)
+            self._article_images.append([
+                {"row": image_rows[img["id"]], **img}
+                for img in content.get("image", [])
+                if img["id"] in image_rows
+            ])
+
+    def text_records(self, rows: Sequence[int]) -> list[Optional[dict]]:
+        records = []
+        for row in rows:
+            entry = self._text[row] if 0 <= row < self.text_count else None
+            if entry is None:
+                records.append(None)
+                continue
+            article, txt = entry
+            records.append({**self.articles[article], **txt, "article": article})
+        return records
+
+    def article(self, article: int) -> dict:
+        return self.articles[article]
+
+    def article_summary(self, article: int) -> Optional[str]:
+        return self._summaries[article]
+
+    def article_chunks(self, article: int) -> list[str]:
+        return self._article_chunks[article]
+
+    def article_images(self, article: int) -> list[dict]:
+        return self._article_images[article]
+
+    def text_row_articles(self) -> np.ndarray:
+        return np.array([entry[0] if entry else -1 for entry in self._text], dtype="int64")
+
+    def article_issues(self) -> np.ndarray:
+        return np.array([issue_number(a["issue"]) for a in self.articles], dtype="int64")
+
+    def articles_with_titles(self, titles: Iterable[str]) -> list[int]:
+        titles = set(titles)
+        return [article for article, a in enumerate(self.articles) if a["title"] in titles]
+
+
+def _open_blob(path: Path):
+    with open(path, "rb") as f:
+        if Path(path).stat().st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _read_record(blob, offsets: np.ndarray, row: int) -> dict:
+    return json.loads(blob[int(offsets[row]):int(offsets[row + 1])])
+
+
+def _write_blob(records: list[dict], blob_path: Path, offsets_path: Path) -> None:
+    encoded = [json.dumps(record, ensure_ascii=False).encode("utf-8") for record in records]
+    offsets = np.zeros(len(encoded) + 1, dtype="uint64")
+    if encoded:
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+    with open(blob_path, "wb") as f:
+        for item in encoded:
+            f.write(item)
+    np.save(offsets_path, offsets)
+
+
+class MmapMetadata:
+    def __init__(self, directory: Path):
+        directory = Path(directory)
+
+        self._text_offsets = np.load(directory / "text_offsets.npy", mmap_mode="r")
+        self._image_offsets = np.load(directory / "image_offsets.npy", mmap_mode="r")
+        self._article_offsets = np.load(directory / "article_offsets.npy", mmap_mode="r")
+        self._content_offsets = np.load(directory / "article_content_offsets.npy", mmap_mode="r")
+        self.text_article = np.load(directory / "text_article.npy", mmap_mode="r")
+        self.image_article = np.load(directory / "image_article.npy", mmap_mode="r")
+        self.article_issue = np.load(directory / "article_issue.npy", mmap_mode="r")
+        self._title_articles = None
+
+        self._text_blob = _open_blob(directory / "text_records.bin")
+        self._image_blob = _open_blob(directory / "image_records.bin")
+        self._article_blob = _open_blob(directory / "article_records.bin")
+        self._content_blob = _open_blob(directory / "article_content.bin")
+
+        self.text_count = len(self._text_offsets) - 1
+        self.image_count = len(self._image_offsets) - 1
+
+    def article(self, article: int) -> dict:
+        return _read_record(self._article_blob, self._article_offsets, article)
+
+    def article_summary(self, article: int) -> Optional[str]:
+        return _read_record(self._content_blob, self._content_offsets, article).get("summary")
+
+    def article_chunks(self, article: int) -> list[str]:
+        return _read_record(self._content_blob, self._content_offsets, article).get("chunks", [])
+
+    def text_records(self, rows: Sequence[int]) -> list[Optional[dict]]:
+        records = []
+        for row in rows:
+            article = int(self.text_article[row]) if 0 <= row < self.text_count else -1
+            if article < 0:
+                records.append(None)
+                continue
+            txt = _read_record(self._text_blob, self._text_offsets, row)
+            article_meta = self.article(article)
+            records.append({
+                "issue": article_meta["issue"],
+                "title": article_meta["title"],
+                **txt,
+                "article": article
+            })
+        return records
+
+    def article_images(self, article: int) -> list[dict]:
+        return [
+            {"row": row, **_read_record(self._image_blob, self._image_offsets, row)}
+            for row in self.article(article)["image_rows"]
+        ]
+
+    def text_row_articles(self) -> np.ndarray:
+        return self.text_article
+
+    def article_issues(self) -> np.ndarray:
+        return self.article_issue
+
+    def articles_with_titles(self, titles: Iterable[str]) -> list[int]:
+        if self._title_articles is None:
+            title_articles = {}
+            for article in range(len(self._article_offsets) - 1):
+                title_articles.setdefault(self.article(article)["title"], []).append(article)
+            self._title_articles = title_articles
+        return [article for title in titles for article in self._title_articles.get(title, [])]
+
+
+def write_mmap_metadata(metadata: dict, directory: Path) -> None:
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    ids = metadata.get("ids", {})
+    text_rows = {text_id: row for row, text_id in enumerate(ids.get("text", []))}
+    image_rows = {image_id: row for row, image_id in enumerate(ids.get("image", []))}
+
+    text_records = [None] * len(text_rows)
+    image_records = [None] * len(image_rows)
+    text_article = np.full(len(text_rows), -1, dtype="int32")
+    image_article = np.full(len(image_rows), -1, dtype="int32")
+    article_records = []
+    article_content = []
+
+    for issue, title, content in iter_articles(metadata):
+        article = len(article_records)
+        article_image_rows = []
+        for txt in content.get("text", []):
+            row = text_rows.get(txt["id"])
+            if row is not None:
+                text_records[row] = txt
+                text_article[row] = article
+        for img in content.get("image", []):
+            row = image_rows.get(img["id"])
+            if row is not None:
+                image_records[row] = img
+                image_article[row] = article
+                article_image_rows.append(row)
+        article_records.append({"issue": issue, "title": title, "image_rows": article_image_rows})
+        # Kept out of the article records, which every search hit decodes.
+        # Every chunk in order, near-duplicates included, so the article body
+        # can be rendered without going through the index rows.
+        article_content.append({
+            "summary": content.get("summary"),
+            "chunks": [txt.get("chunk") or "" for txt in content.get("text", [])]
+        })
+
+    _write_blob([r or {} for r in text_records], directory / "text_records.bin", directory / "text_offsets.npy")
+    _write_blob([r or {} for r in image_records], directory / "image_records.bin", directory / "image_offsets.npy")
+    _write_blob(article_records, directory / "article_records.bin", directory / "article_offsets.npy")
+    _write_blob(article_content, directory / "article_content.bin", directory / "article_content_offsets.npy")
+    np.save(directory / "text_article.npy", text_article)
+    np.save(directory / "image_article.npy", image_article)
+    np.save(directory / "article_issue.npy", np.array([issue_number(a["issue"]) for a in article_records], dtype="int64"))
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE articles (
+    article INTEGER PRIMARY KEY,
+    issue TEXT NOT NULL,
+    title TEXT NOT NULL,
+    summary TEXT
+);
+CREATE TABLE article_chunks (
+    article INTEGER NOT NULL REFERENCES articles(article),
+    position INTEGER NOT NULL,
+    chunk TEXT,
+    PRIMARY KEY (article, position)
+);
+CREATE TABLE text_chunks (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    article INTEGER NOT NULL REFERENCES articles(article),
+    chunk TEXT,
+    url TEXT,
+    content_type TEXT,
+    duplicates TEXT
+);
+CREATE TABLE images (
+    row INTEGER PRIMARY KEY,
+    id TEXT NOT NULL,
+    article INTEGER NOT NULL REFERENCES articles(article),
+    image_path TEXT,
+    image_variants TEXT,
+    content_type TEXT
+);
+CREATE INDEX images_by_article ON images(article);
+-- Cover the row -> article and article -> issue scans of the filter compiler,
+-- so they read neither chunk texts nor summaries.
+CREATE INDEX text_chunks_by_article ON text_chunks(article);
+CREATE INDEX articles_by_issue ON articles(issue);
+"""
+
+
+class SqliteMetadata:
+    def __init__(self, db_path: Path, cache_size: int = 1024):
+        self.db_path = Path(db_path)
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        connection = self._connection()
+        self.text_count = connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM text_chunks").fetchone()[0]
+        self.image_count = connection.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM images").fetchone()[0]
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def _cached(self, row: int) -> Optional[dict]:
+        with self._cache_lock:
+            record = self._cache.get(row)
+            if record is not None:
+                self._cache.move_to_end(row)
+            return record
+
+    def _remember(self, records: dict) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            for row, record in records.items():
+                self._cache[row] = record
+                self._cache.move_to_end(row)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def text_records(self, rows: Sequence[int]) -> list[Optional[dict]]:
+        rows = [int(row) for row in rows]
+        found = {}
+        missing = []
+        for row in rows:
+            if row < 0:
+                continue
+            record = self._cached(row)
+            if record is None:
+                missing.append(row)
+            else:
+                found[row] = record
+
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            fetched = {}
+            for row, text_id, chunk, url, content_type, duplicates, article, issue, title in self._connection().execute(
+                "SELECT t.row, t.id, t.chunk, t.url, t.content_type, t.duplicates, a.article, a.issue, a.title "
+                "FROM text_chunks t JOIN articles a ON a.article = t.article "
+                f"WHERE t.row IN ({placeholders})",
+                missing
+            ):
+                fetched[row] = {
+                    "issue": issue,
+                    "title": title,
+                    "id": text_id,
+                    "chunk": chunk,
+                    "url": url,
+                    "content_type": content_type,
+                    "article": article
+                }
+                if duplicates:
+                    fetched[row]["duplicates"] = json.loads(duplicates)
+            self._remember(fetched)
+            found.update(fetched)
+
+        return [found.get(row) for row in rows]
+
+    def article(self, article: int) -> dict:
+        issue, title = self._connection().execute(
+            "SELECT issue, title FROM articles WHERE article = ?", (article,)
+        ).fetchone()
+        return {"issue": issue, "title": title}
+
+    def article_summary(self, article: int) -> Optional[str]:
+        row = self._connection().execute("SELECT summary FROM articles WHERE article = ?", (article,)).fetchone()
+        return row[0] if row else None
+
+    def article_chunks(self, article: int) -> list[str]:
+        return [
+            chunk for (chunk,) in self._connection().execute(
+                "SELECT chunk FROM article_chunks WHERE article = ? ORDER BY position", (article,)
+            )
+        ]
+
+    def article_images(self, article: int) -> list[dict]:
+        return [
+            {
+                "row": row,
+                "id": image_id,
+                "image_path": image_path,
+                "image_variants": json.loads(image_variants) if image_variants else None,
+                "content_type": content_type
+            }
+            for row, image_id, image_path, image_variants, content_type in self._connection().execute(
+                "SELECT row, id, image_path, image_variants, content_type FROM images WHERE article = ? ORDER BY row",
+                (article,)
+            )
+        ]
+
+    def text_row_articles(self) -> np.ndarray:
+        row_articles = np.full(self.text_count, -1, dtype="int64")
+        rows = self._connection().execute("SELECT row, article FROM text_chunks").fetchall()
+        if rows:
+            data = np.array(rows, dtype="int64")
+            row_articles[data[:, 0]] = data[:, 1]
+        return row_articles
+
+    def article_issues(self) -> np.ndarray:
+        rows = self._connection().execute("SELECT article, issue FROM articles").fetchall()
+        issues = np.full(max((article for article, _ in rows), default=-1) + 1, -1, dtype="int64")
+        for article, issue in rows:
+            issues[article] = issue_number(issue)
+        return issues
+
+    def articles_with_titles(self, titles: Iterable[str]) -> list[int]:
+        titles = list(titles)
+        placeholders = ",".join("?" * len(titles))
+        return [
+            article for (article,) in self._connection().execute(
+                f"SELECT article FROM articles WHERE title IN ({placeholders})", titles
+            )
+        ]
+
+
+def write_sqlite_metadata(metadata: dict, db_path: Path, batch_size: int = 10000) -> None:
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_suffix(db_path.suffix + ".tmp")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    ids = metadata.get("ids", {})
+    text_rows = {text_id: row for row, text_id in enumerate(ids.get("text", []))}
+    image_rows = {image_id: row for row, image_id in enumerate(ids.get("image", []))}
+
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.executescript(SQLITE_SCHEMA)
+
+        articles, chunks, texts, images = [], [], [], []
+
+        def flush():
+            with connection:
+                connection.executemany("INSERT INTO articles VALUES (?, ?, ?, ?)", articles)
+                connection.executemany("INSERT INTO article_chunks VALUES (?, ?, ?)", chunks)
+                connection.executemany("INSERT INTO text_chunks VALUES (?, ?, ?, ?, ?, ?, ?)", texts)
+                connection.executemany("INSERT INTO images VALUES (?, ?, ?, ?, ?, ?)", images)
+            articles.clear()
+            chunks.clear()
+            texts.clear()
+            images.clear()
+
+        for article, (issue, title, content) in enumerate(iter_articles(metadata)):
+            articles.append((article, issue, title, content.get("summary")))
+            for position, txt in enumerate(content.get("text", [])):
+                chunks.append((article, position, txt.get("chunk")))
+            for txt in content.get("text", []):
+                row = text_rows.get(txt["id"])
+                if row is not None:
+                    duplicates = txt.get("duplicates")
+                    texts.append((
+                        row, txt["id"], article, txt.get("chunk"), txt.get("url"), txt.get("content_type"),
+                        json.dumps(duplicates) if duplicates else None
+                    ))
+            for img in content.get("image", []):
+                row = image_rows.get(img["id"])
+                if row is not None:
+                    variants = img.get("image_variants")
+                    images.append((
+                        row, img["id"], article, img.get("image_path"),
+                        json.dumps(variants) if variants else None, img.get("content_type")
+                    ))
+            if len(texts) + len(images) >= batch_size:
+                flush()
+        flush()
+    finally:
+        connection.close()
+
+    os.replace(tmp_path, db_path)
+
+
+def open_metadata(backend: str, metadata_path: Path, mmap_metadata_dir: Path, metadata_db_path: Path, cache_size: int = 1024):
+    if backend == "sqlite":
+        return SqliteMetadata(metadata_db_path, cache_size=cache_size)
+    if backend == "mmap":
+        return MmapMetadata(mmap_metadata_dir)
+    if backend == "json":
+        return JsonMetadata(metadata_path)
+    raise ValueError(f"Unknown metadata backend: {backend}")
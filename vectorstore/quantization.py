@@ -0,0 +1,85 @@
+import math
+
+from typing import Optional
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "fp16", "sq8", "pq")
+
+
+def _pq_subquantizers(dim: int, requested: int) -> int:
+    m = min(requested, dim)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = "flat",
+    pq_m: int = 64,
+    pq_nbits: int = 8,
+    ids: Optional[np.ndarray] = None
+) -> faiss.Index:
+    dim = vectors.shape[1]
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "fp16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "pq":
+        # PQ training needs at least 2**nbits points per codebook.
+        nbits = max(1, min(pq_nbits, int(math.log2(max(len(vectors), 2)))))
+        index = faiss.IndexPQ(dim, _pq_subquantizers(dim, pq_m), nbits, faiss.METRIC_INNER_PRODUCT)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    if not index.is_trained:
+        index.train(vectors)
+    if ids is None:
+        index.add(vectors)
+        return index
+
+    index = faiss.IndexIDMap(index)
+    index.add_with_ids(vectors, np.asarray(ids, dtype="int64"))
+    return index
+
+
+def base_index(index: faiss.Index) -> faiss.Index:
+    index = faiss.downcast_index(index)
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def is_compressed(index: faiss.Index) -> bool:
+    return not isinstance(base_index(index), faiss.IndexFlat)
+
+
+def index_memory_bytes(index: faiss.Index) -> int:
+    return int(faiss.serialize_index(index).size)
+
+
+def rerank_exact(
+    query_vectors: np.ndarray,
+    candidates: np.ndarray,
+    vectors: np.ndarray,
+    top_k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    num_queries = query_vectors.shape[0]
+    D = np.full((num_queries, top_k), -np.inf, dtype="float32")
+    I = np.full((num_queries, top_k), -1, dtype="int64")
+
+    for q in range(num_queries):
+        rows = np.unique(candidates[q][candidates[q] >= 0])
+        if rows.size == 0:
+            continue
+        scores = np.asarray(vectors[rows], dtype="float32") @ query_vectors[q]
+        keep = min(top_k, rows.size)
+        best = np.argpartition(-scores, keep - 1)[:keep]
+        best = best[np.argsort(-scores[best])]
+        D[q, :keep] = scores[best]
+        I[q, :keep] = rows[best]
+    return D, I
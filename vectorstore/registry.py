@@ -0,0 +1,243 @@
+import threading
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+from config import (
+    INDEXES_DIR,
+    CORPORA_DIR,
+    CORPUS_MEMORY_BUDGET_MB,
+    QUERY_BATCHING,
+    SNAPSHOT_POLL_S,
+    SNAPSHOT_VERIFY,
+)
+from vectorstore.executor import QueryExecutor
+from vectorstore.snapshots import corpus_paths, current_version, is_corpus, snapshot_dir, verify_snapshot
+from vectorstore.vectorstore import VectorStore
+
+
+def discover_corpora(corpora_dir: Path = CORPORA_DIR, default_dir: Path = INDEXES_DIR) -> dict[str, Path]:
+    corpora = {"default": Path(default_dir)}
+    if Path(corpora_dir).is_dir():
+        for directory in sorted(Path(corpora_dir).iterdir()):
+            if directory.is_dir() and is_corpus(directory):
+                corpora[directory.name] = directory
+    return corpora
+
+
+@dataclass(eq=False)
+class Corpus:
+    name: str
+    directory: Path
+    version: Optional[str]
+    store: VectorStore
+    executor: Optional[QueryExecutor]
+    refs: int = 0
+    # Set once the registry stops handing this corpus out (evicted or replaced
+    # by a newer snapshot); it is closed when its last lease is released.
+    retired: bool = False
+
+    @property
+    def memory_bytes(self) -> int:
+        return self.store.memory_bytes
+
+    def close(self) -> None:
+        if self.executor is not None:
+            self.executor.close()
+        self.store.close()
+
+
+class CorpusRegistry:
+    def __init__(
+        self,
+        corpora: dict[str, Path],
+        memory_budget_mb: float = CORPUS_MEMORY_BUDGET_MB,
+        batching: bool = QUERY_BATCHING,
+        poll_interval: float = SNAPSHOT_POLL_S,
+        verify: bool = SNAPSHOT_VERIFY,
+        **store_options
+    ):
+        self.corpora = {name: Path(directory) for name, directory in corpora.items()}
+        self.memory_budget = int(memory_budget_mb * 1e6)
+        self.batching = batching
+        self.verify = verify
+        self.store_options = store_options
+        self.loads = 0
+        self.evictions = 0
+        self.swaps = 0
+        self._loaded: OrderedDict[str, Corpus] = OrderedDict()
+        self._loading: dict[str, Future] = {}
+        self._failed_versions: set[tuple[str, str]] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher = None
+        if poll_interval > 0:
+            self._watcher = threading.Thread(
+                target=self._watch, args=(poll_interval,), name="snapshot-watcher", daemon=True
+            )
+            self._watcher.start()
+
+    def names(self) -> list[str]:
+        return sorted(self.corpora)
+
+    def loaded(self) -> list[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    @property
+    def memory_bytes(self) -> int:
+        with self._lock:
+            return sum(corpus.memory_bytes for corpus in self._loaded.values())
+
+    def versions(self) -> dict[str, Optional[str]]:
+        with self._lock:
+            return {name: corpus.version for name, corpus in self._loaded.items()}
+
+    def register(self, name: str, directory: Path) -> None:
+        with self._lock:
+            self.corpora[name] = Path(directory)
+
+    def acquire(self, name: str, timeout: Optional[float] = None) -> Corpus:
+        while True:
+            with self._lock:
+                corpus = self._loaded.get(name)
+                if corpus is not None:
+                    self._loaded.move_to_end(name)
+                    corpus.refs += 1
+                    return corpus
+                if name not in self.corpora:
+                    raise KeyError(f"Unknown corpus {name!r}, available: {', '.join(sorted(self.corpora))}")
+                pending = self._loading.get(name)
+                loading = pending is None
+                if loading:
+                    pending = self._loading[name] = Future()
+
+            if not loading:
+                # Someone else is reading this corpus already; wait for that
+                # load instead of reading the same indexes a second time.
+                pending.result(timeout)
+                continue
+
+            try:
+                corpus = self._load(name)
+            except BaseException as exc:
+                with self._lock:
+                    del self._loading[name]
+                pending.set_exception(exc)
+                raise
+
+            with self._lock:
+                del self._loading[name]
+                corpus.refs += 1
+                self._loaded[name] = corpus
+                self.loads += 1
+                unloaded = self._evict()
+            pending.set_result(None)
+            for old in unloaded:
+                old.close()
+            return corpus
+
+    def release(self, corpus: Corpus) -> None:
+        with self._lock:
+            corpus.refs -= 1
+            unload = corpus.retired and corpus.refs == 0
+        if unload:
+            corpus.close()
+
+    @contextmanager
+    def lease(self, name: str, timeout: Optional[float] = None) -> Iterator[Corpus]:
+        corpus = self.acquire(name, timeout)
+        try:
+            yield corpus
+        finally:
+            self.release(corpus)
+
+    def load(self, name: str) -> None:
+        self.release(self.acquire(name))
+
+    def _load(self, name: str, version: Optional[str] = None) -> Corpus:
+        directory = self.corpora[name]
+        version = version or current_version(directory)
+        serving = snapshot_dir(directory, version)
+        if version is not None:
+            verify_snapshot(serving, checksums=self.verify)
+        store = VectorStore(**corpus_paths(serving), **self.store_options)
+        executor = QueryExecutor(store) if self.batching else None
+        print(
+            f"Loaded corpus {name!r}" + (f" snapshot {version}" if version else "") +
+            f" with {store.metadata.text_count} text chunks and "
+            f"{store.metadata.image_count} images ({store.memory_bytes / 1e6:.1f} MB)"
+        )
+        return Corpus(name, directory, version, store, executor)
+
+    def refresh(self) -> list[str]:
+        # Loads any newer published snapshot of a loaded corpus next to the
+        # old one, then swaps it in under the lock: queries already holding
+        # the old version finish on it, new ones get the new version.
+        swapped = []
+        with self._lock:
+            loaded = list(self._loaded.values())
+        for corpus in loaded:
+            version = current_version(corpus.directory)
+            if version is None or version == corpus.version or (corpus.name, version) in self._failed_versions:
+                continue
+            try:
+                fresh = self._load(corpus.name, version)
+            except Exception as e:
+                print(f"Keeping corpus {corpus.name!r} at {corpus.version}: snapshot {version} failed to load: {e}")
+                self._failed_versions.add((corpus.name, version))
+                continue
+
+            with self._lock:
+                replaced = self._loaded.get(corpus.name) is corpus
+                if replaced:
+                    self._loaded[corpus.name] = fresh
+                    corpus.retired = True
+                    self.swaps += 1
+                    unloaded = ([corpus] if corpus.refs == 0 else []) + self._evict()
+            if not replaced:
+                # Evicted or swapped by someone else while this one loaded.
+                fresh.close()
+                continue
+            print(f"Swapped corpus {corpus.name!r} from {corpus.version} to snapshot {version}")
+            swapped.append(corpus.name)
+            for old in unloaded:
+                old.close()
+        return swapped
+
+    def _watch(self, poll_interval: float) -> None:
+        while not self._stop.wait(poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Snapshot check failed: {e}")
+
+    def _evict(self) -> list[Corpus]:
+        # Least recently used first; the corpus just loaded is the most recent
+        # and stays even if it alone is over the budget. Corpora still serving
+        # queries are dropped from the registry now and closed on release.
+        unloaded = []
+        if not self.memory_budget:
+            return unloaded
+        while len(self._loaded) > 1 and sum(c.memory_bytes for c in self._loaded.values()) > self.memory_budget:
+            name, corpus = self._loaded.popitem(last=False)
+            corpus.retired = True
+            self.evictions += 1
+            print(f"Unloaded corpus {name!r} to stay within {self.memory_budget / 1e6:.0f} MB")
+            if corpus.refs == 0:
+                unloaded.append(corpus)
+        return unloaded
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+        with self._lock:
+            corpora = list(self._loaded.values())
+            self._loaded.clear()
+        for corpus in corpora:
+            corpus.close()
@@ -0,0 +1,262 @@
+import heapq
+import json
+import os
+import zlib
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Optional, Sequence
+
+import faiss
+import numpy as np
+
+from vectorstore.filters import CompiledFilter, SearchFilter, empty_result, filtered_search
+from vectorstore.quantization import build_index, is_compressed
+
+SHARD_STRATEGIES = ("issue", "hash")
+MANIFEST_NAME = "manifest.json"
+
+
+def _issue_ranges(issues: np.ndarray, num_shards: int) -> list[tuple[int, int]]:
+    # Contiguous issue ranges holding roughly the same number of rows each, so
+    # new issues only ever touch the newest shard.
+    unique, counts = np.unique(issues, return_counts=True)
+    bounds = np.searchsorted(np.cumsum(counts), np.linspace(0, counts.sum(), num_shards + 1)[1:-1], side="right")
+    groups = [group for group in np.split(unique, bounds) if group.size]
+    return [(int(group[0]), int(group[-1])) for group in groups]
+
+
+def assign_shards(ids: Sequence[str], issues: Sequence[int], num_shards: int, strategy: str = "issue") -> list[np.ndarray]:
+    if strategy == "issue":
+        issues = np.asarray(issues, dtype="int64")
+        return [
+            np.flatnonzero((issues >= low) & (issues <= high))
+            for low, high in _issue_ranges(issues, num_shards)
+        ]
+    if strategy == "hash":
+        buckets = np.array([zlib.crc32(item_id.encode("utf-8")) % num_shards for item_id in ids], dtype="int64")
+        return [np.flatnonzero(buckets == shard) for shard in range(num_shards)]
+    raise ValueError(f"Unknown shard strategy: {strategy}")
+
+
+def write_shards(
+    vectors: np.ndarray,
+    ids: Sequence[str],
+    issues: Sequence[int],
+    shards_dir: Path,
+    num_shards: int,
+    strategy: str = "issue",
+    index_type: str = "flat",
+    pq_m: int = 64,
+    pq_nbits: int = 8
+) -> dict:
+    shards_dir = Path(shards_dir)
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    issues = np.asarray(issues, dtype="int64")
+
+    shards = []
+    for shard, rows in enumerate(assign_shards(ids, issues, num_shards, strategy)):
+        if rows.size == 0:
+            continue
+        name = f"shard_{shard:03d}"
+        # Shards store global row ids so metadata, filters and re-ranking
+        # vectors stay shared across every shard.
+        index = build_index(vectors[rows], index_type, pq_m=pq_m, pq_nbits=pq_nbits, ids=rows)
+        faiss.write_index(index, str(shards_dir / f"{name}.index"))
+        shards.append({
+            "name": name,
+            "path": f"{name}.index",
+            "rows": int(rows.size),
+            "issue_min": int(issues[rows].min()),
+            "issue_max": int(issues[rows].max()),
+        })
+
+    manifest = {
+        "strategy": strategy,
+        "index_type": index_type,
+        "dim": int(vectors.shape[1]),
+        "total": int(vectors.shape[0]),
+        "shards": shards,
+    }
+    tmp_path = shards_dir / f"{MANIFEST_NAME}.tmp"
+    tmp_path.write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    os.replace(tmp_path, shards_dir / MANIFEST_NAME)
+    return manifest
+
+
+def has_shards(shards_dir: Path) -> bool:
+    return (Path(shards_dir) / MANIFEST_NAME).exists()
+
+
+def remove_shards(shards_dir: Path) -> None:
+    manifest_path = Path(shards_dir) / MANIFEST_NAME
+    if not manifest_path.exists():
+        return
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest_path.unlink()
+    for shard in manifest["shards"]:
+        (Path(shards_dir) / shard["path"]).unlink(missing_ok=True)
+
+
+def merge_topk(results: Sequence[tuple[np.ndarray, np.ndarray]], k: int) -> tuple[np.ndarray, np.ndarray]:
+    num_queries = results[0][0].shape[0]
+    D, I = empty_result(num_queries, k)
+    for q in range(num_queries):
+        streams = [zip(shard_D[q], shard_I[q]) for shard_D, shard_I in results]
+        merged = heapq.merge(*streams, key=lambda hit: hit[0], reverse=True)
+        for rank, (score, row) in enumerate(islice((hit for hit in merged if hit[1] >= 0), k)):
+            D[q, rank] = score
+            I[q, rank] = row
+    return D, I
+
+
+def _overlaps(shard: dict, search_filter: Optional[SearchFilter]) -> bool:
+    if search_filter is None:
+        return True
+    if search_filter.issue_min is not None and shard["issue_max"] < search_filter.issue_min:
+        return False
+    if search_filter.issue_max is not None and shard["issue_min"] > search_filter.issue_max:
+        return False
+    if search_filter.issues and not any(shard["issue_min"] <= issue <= shard["issue_max"] for issue in search_filter.issues):
+        return False
+    return True
+
+
+def _search_shard(index: faiss.Index, query_vectors: np.ndarray, k: int, compiled: Optional[CompiledFilter]):
+    if compiled is None:
+        return index.search(query_vectors, min(k, index.ntotal))
+    return filtered_search(index, query_vectors, min(k, index.ntotal), compiled)
+
+
+# Process-pool workers load their shards once in the initializer and keep them
+# in this module-level dict for the life of the worker.
+_worker_shards: dict[str, faiss.Index] = {}
+# Filters arrive as packed bitmaps; workers keep the ones they have seen so a
+# repeated filter reuses its unpacked mask instead of rebuilding it.
+_worker_filters: OrderedDict = OrderedDict()
+WORKER_FILTER_CACHE = 64
+
+
+def _init_worker(shards_dir: str, names: list[str], io_flags: int, threads: int = 1) -> None:
+    faiss.omp_set_num_threads(threads)
+    manifest = json.loads((Path(shards_dir) / MANIFEST_NAME).read_text(encoding="utf-8"))
+    for shard in manifest["shards"]:
+        if shard["name"] in names:
+            _worker_shards[shard["name"]] = faiss.read_index(str(Path(shards_dir) / shard["path"]), io_flags)
+
+
+def _search_worker_shard(name: str, query_vectors: np.ndarray, k: int, compiled: Optional[CompiledFilter]):
+    if compiled is not None and compiled.key is not None:
+        compiled = _worker_filters.setdefault(compiled.key, compiled)
+        _worker_filters.move_to_end(compiled.key)
+        while len(_worker_filters) > WORKER_FILTER_CACHE:
+            _worker_filters.popitem(last=False)
+    return _search_shard(_worker_shards[name], query_vectors, k, compiled)
+
+
+def _reconstruct_shard(index: faiss.Index, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    index = faiss.downcast_index(index)
+    shard_rows = faiss.vector_to_array(index.id_map)
+    local = np.flatnonzero(np.isin(shard_rows, rows))
+    if local.size == 0:
+        return np.empty(0, dtype="int64"), np.empty((0, index.d), dtype="float32")
+    return shard_rows[local], index.index.reconstruct_batch(local)
+
+
+def _reconstruct_worker_shard(name: str, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    return _reconstruct_shard(_worker_shards[name], rows)
+
+
+class ShardedIndex:
+    def __init__(
+        self,
+        shards_dir: Path,
+        hosted_shards: Optional[Sequence[str]] = None,
+        io_flags: int = 0,
+        workers: int = 4,
+        executor: str = "thread",
+        threads: Optional[int] = None
+    ):
+        self.shards_dir = Path(shards_dir)
+        self.manifest = json.loads((self.shards_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+        self.shards = [
+            shard for shard in self.manifest["shards"]
+            if hosted_shards is None or shard["name"] in hosted_shards
+        ]
+        if not self.shards:
+            raise ValueError(f"No shards to host in {self.shards_dir} (requested {hosted_shards})")
+
+        self.d = self.manifest["dim"]
+        self.ntotal = sum(shard["rows"] for shard in self.shards)
+        self.executor_type = executor
+        workers = max(1, min(workers, len(self.shards)))
+        names = [shard["name"] for shard in self.shards]
+        # Shards are searched in parallel, so each one gets its share of the
+        # process's OpenMP budget.
+        shard_threads = max(1, (threads or os.cpu_count() or 1) // workers)
+
+        self.indexes = {}
+        if executor == "thread":
+            for shard in self.shards:
+                self.indexes[shard["name"]] = faiss.read_index(str(self.shards_dir / shard["path"]), io_flags)
+            self.compressed = is_compressed(next(iter(self.indexes.values())))
+            self._executor: Executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="shard",
+                initializer=faiss.omp_set_num_threads,
+                initargs=(shard_threads,)
+            )
+        elif executor == "process":
+            self.compressed = self.manifest["index_type"] != "flat"
+            self._executor = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(str(self.shards_dir), names, io_flags, shard_threads)
+            )
+        else:
+            raise ValueError(f"Unknown shard executor: {executor}")
+
+    def search(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        compiled: Optional[CompiledFilter] = None,
+        search_filter: Optional[SearchFilter] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        shards = [shard for shard in self.shards if _overlaps(shard, search_filter)]
+        if not shards:
+            return empty_result(query_vectors.shape[0], k)
+
+        # The compiled filter is the one FilterCompiler caches per filter, so
+        # shards share its bitmap and selector instead of rebuilding them.
+        if self.executor_type == "thread":
+            futures = [
+                self._executor.submit(_search_shard, self.indexes[shard["name"]], query_vectors, k, compiled)
+                for shard in shards
+            ]
+        else:
+            futures = [
+                self._executor.submit(_search_worker_shard, shard["name"], query_vectors, k, compiled)
+                for shard in shards
+            ]
+        return merge_topk([future.result() for future in futures], k)
+
+    def reconstruct_batch(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype="int64")
+        if self.executor_type == "thread":
+            futures = [self._executor.submit(_reconstruct_shard, index, rows) for index in self.indexes.values()]
+        else:
+            futures = [self._executor.submit(_reconstruct_worker_shard, shard["name"], rows) for shard in self.shards]
+
+        vectors = np.zeros((rows.size, self.d), dtype="float32")
+        order = np.argsort(rows)
+        for future in futures:
+            found, found_vectors = future.result()
+            if found.size:
+                vectors[order[np.searchsorted(rows[order], found)]] = found_vectors
+        return vectors
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
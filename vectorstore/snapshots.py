@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import time
+
+from pathlib import Path
+from typing import Iterable, Optional
+
+from config import (
+    TEXT_INDEX_PATH,
+    IMAGE_INDEX_PATH,
+    TEXT_SHARDS_DIR,
+    TEXT_VECTORS_PATH,
+    IMAGE_VECTORS_PATH,
+    UNIFIED_METADATA_PATH,
+    MMAP_METADATA_DIR,
+    METADATA_DB_PATH,
+    SNAPSHOT_KEEP,
+)
+from vectorstore.sharding import has_shards
+
+# A corpus directory either holds the index files itself (the layout before
+# snapshots) or a snapshots/ directory of immutable versions and a CURRENT file
+# naming the one to serve. Builds write a new version and replace CURRENT in a
+# single rename, so readers see the old set or the new one, never a mix.
+CURRENT_NAME = "CURRENT"
+SNAPSHOTS_DIR_NAME = "snapshots"
+SNAPSHOT_MANIFEST_NAME = "snapshot.json"
+
+INDEX_FILES = (
+    TEXT_INDEX_PATH.name,
+    IMAGE_INDEX_PATH.name,
+    TEXT_SHARDS_DIR.name,
+    TEXT_VECTORS_PATH.name,
+    IMAGE_VECTORS_PATH.name,
+)
+METADATA_FILES = (
+    UNIFIED_METADATA_PATH.name,
+    MMAP_METADATA_DIR.name,
+    METADATA_DB_PATH.name,
+)
+
+
+def corpus_paths(directory: Path) -> dict[str, Path]:
+    directory = Path(directory)
+    return {
+        "text_index_path": directory / TEXT_INDEX_PATH.name,
+        "image_index_path": directory / IMAGE_INDEX_PATH.name,
+        "metadata_path": directory / UNIFIED_METADATA_PATH.name,
+        "mmap_metadata_dir": directory / MMAP_METADATA_DIR.name,
+        "metadata_db_path": directory / METADATA_DB_PATH.name,
+        "text_vectors_path": directory / TEXT_VECTORS_PATH.name,
+        "image_vectors_path": directory / IMAGE_VECTORS_PATH.name,
+        "text_shards_dir": directory / TEXT_SHARDS_DIR.name,
+    }
+
+
+def is_corpus(directory: Path) -> bool:
+    directory = Path(directory)
+    return (
+        (directory / CURRENT_NAME).exists()
+        or (directory / TEXT_INDEX_PATH.name).exists()
+        or has_shards(directory / TEXT_SHARDS_DIR.name)
+    )
+
+
+def current_version(corpus_dir: Path) -> Optional[str]:
+    try:
+        return (Path(corpus_dir) / CURRENT_NAME).read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def snapshot_dir(corpus_dir: Path, version: Optional[str] = None) -> Path:
+    version = version or current_version(corpus_dir)
+    if version is None:
+        return Path(corpus_dir)
+    return Path(corpus_dir) / SNAPSHOTS_DIR_NAME / version
+
+
+def new_version() -> str:
+    # Sorts in creation order; the suffix keeps two builds in one second apart.
+    return time.strftime("%Y%m%dT%H%M%SZ", time.gmtime()) + "-" + secrets.token_hex(3)
+
+
+def file_checksum(path: Path, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _snapshot_files(directory: Path) -> list[Path]:
+    return sorted(
+        path for path in directory.rglob("*")
+        if path.is_file() and path.name != SNAPSHOT_MANIFEST_NAME
+    )
+
+
+def write_manifest(directory: Path, version: str) -> dict:
+    directory = Path(directory)
+    manifest = {
+        "version": version,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "files": {
+            path.relative_to(directory).as_posix(): {"bytes": path.stat().st_size, "sha256": file_checksum(path)}
+            for path in _snapshot_files(directory)
+        }
+    }
+    (directory / SNAPSHOT_MANIFEST_NAME).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def verify_snapshot(directory: Path, checksums: bool = False) -> dict:
+    directory = Path(directory)
+    manifest = json.loads((directory / SNAPSHOT_MANIFEST_NAME).read_text(encoding="utf-8"))
+    for name, expected in manifest["files"].items():
+        path = directory / name
+        if not path.is_file():
+            raise ValueError(f"Snapshot {manifest['version']} is missing {name}")
+        if path.stat().st_size != expected["bytes"]:
+            raise ValueError(f"Snapshot {manifest['version']}: {name} has {path.stat().st_size} bytes, expected {expected['bytes']}")
+        if checksums and file_checksum(path) != expected["sha256"]:
+            raise ValueError(f"Snapshot {manifest['version']}: checksum mismatch for {name}")
+    return manifest
+
+
+def _fsync_dir(directory: Path) -> None:
+    if hasattr(os, "O_DIRECTORY"):
+        fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def publish(corpus_dir: Path, version: str) -> None:
+    corpus_dir = Path(corpus_dir)
+    pointer = corpus_dir / CURRENT_NAME
+    tmp = corpus_dir / f"{CURRENT_NAME}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, pointer)
+    _fsync_dir(corpus_dir)
+
+
+def link_files(source_dir: Path, target_dir: Path, names: Iterable[str]) -> None:
+    # Hard links share unchanged files between versions without copying them;
+    # snapshot files are never modified in place, so sharing is safe.
+    def link(src, dst):
+        try:
+            os.link(src, dst)
+        except OSError:
+            shutil.copy2(src, dst)
+
+    for name in names:
+        source = Path(source_dir) / name
+        if source.is_dir():
+            shutil.copytree(source, Path(target_dir) / name, copy_function=link)
+        elif source.is_file():
+            link(source, Path(target_dir) / name)
+
+
+def prune_snapshots(corpus_dir: Path, keep: int = SNAPSHOT_KEEP) -> list[str]:
+    # Older versions stay around for a while so processes that have not
+    # swapped yet can still open their files.
+    root = Path(corpus_dir) / SNAPSHOTS_DIR_NAME
+    if not root.is_dir():
+        return []
+    current = current_version(corpus_dir)
+    versions = sorted(path.name for path in root.iterdir() if path.is_dir() and not path.name.startswith("."))
+    removed = [version for version in versions[:-keep] if version != current] if keep > 0 else []
+    for version in removed:
+        shutil.rmtree(root / version)
+    return removed
+
+
+class SnapshotWriter:
+    def __init__(self, corpus_dir: Path, keep: int = SNAPSHOT_KEEP):
+        self.corpus_dir = Path(corpus_dir)
+        self.keep = keep
+        self.version = new_version()
+        self.directory = self.corpus_dir / SNAPSHOTS_DIR_NAME / f".{self.version}.partial"
+        self.manifest: Optional[dict] = None
+
+    def __enter__(self) -> "SnapshotWriter":
+        self.directory.mkdir(parents=True)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            return
+
+        self.manifest = write_manifest(self.directory, self.version)
+        final = self.corpus_dir / SNAPSHOTS_DIR_NAME / self.version
+        os.rename(self.directory, final)
+        self.directory = final
+        _fsync_dir(final.parent)
+        publish(self.corpus_dir, self.version)
+        print(f"Published snapshot {self.version} ({len(self.manifest['files'])} files): {final}")
+
+        for version in prune_snapshots(self.corpus_dir, self.keep):
+            print(f"Removed old snapshot {version}")
@@ -1,43 +1,243 @@
+import os
+import threading
+
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence
 
+import faiss
 import numpy as np
 
-import faiss
+from config import (
+    TEXT_INDEX_PATH,
+    IMAGE_INDEX_PATH,
+    TEXT_SHARDS_DIR,
+    TEXT_VECTORS_PATH,
+    IMAGE_VECTORS_PATH,
+    UNIFIED_METADATA_PATH,
+    MMAP_METADATA_DIR,
+    METADATA_DB_PATH,
+    SERVING_MODE,
+    METADATA_BACKEND,
+    METADATA_CACHE_SIZE,
+    RERANK_POOL,
+    MMR_ENABLED,
+    MMR_LAMBDA,
+    MMR_POOL,
+    HOSTED_SHARDS,
+    SHARD_WORKERS,
+    SHARD_EXECUTOR,
+    FAISS_THREADS,
+    TOP_K,
+)
+from vectorstore.diversity import mmr_rerank
+from vectorstore.filters import CompiledFilter, FilterCompiler, SearchFilter, empty_result, filtered_search
+from vectorstore.metadata import open_metadata
+from vectorstore.quantization import is_compressed, rerank_exact
+from vectorstore.sharding import ShardedIndex, has_shards
+
+
+def thread_budget(threads: int = FAISS_THREADS) -> int:
+    return threads if threads > 0 else os.cpu_count() or 1
 
-from config import TOP_K
 
 class VectorStore:
-    def __init__(self):
-        self.text_index = None
-        self.image_index = None
-        self.text_metadata = []
-        self.image_metadata = []
+    def __init__(
+        self,
+        text_index_path: Path = TEXT_INDEX_PATH,
+        image_index_path: Path = IMAGE_INDEX_PATH,
+        metadata_path: Path = UNIFIED_METADATA_PATH,
+        mmap_metadata_dir: Path = MMAP_METADATA_DIR,
+        metadata_db_path: Path = METADATA_DB_PATH,
+        serving_mode: str = SERVING_MODE,
+        metadata_backend: str = METADATA_BACKEND,
+        text_vectors_path: Path = TEXT_VECTORS_PATH,
+        image_vectors_path: Path = IMAGE_VECTORS_PATH,
+        rerank_pool: int = RERANK_POOL,
+        text_shards_dir: Path = TEXT_SHARDS_DIR,
+        hosted_shards: Optional[list[str]] = HOSTED_SHARDS,
+        diversify: bool = MMR_ENABLED,
+        mmr_lambda: float = MMR_LAMBDA,
+        mmr_pool: int = MMR_POOL,
+        threads: int = FAISS_THREADS,
+        tracer=None
+    ):
+        self.serving_mode = serving_mode
+        self.rerank_pool = rerank_pool
+        self.diversify = diversify
+        self.mmr_lambda = mmr_lambda
+        self.mmr_pool = mmr_pool
+        self.threads = thread_budget(threads)
+        self._thread_state = threading.local()
+        self.tracer = tracer
+
+        if serving_mode == "mmap":
+            io_flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+        elif serving_mode == "heap":
+            io_flags = 0
+        else:
+            raise ValueError(f"Unknown serving mode: {serving_mode}")
+
+        if has_shards(text_shards_dir):
+            self.text_index = ShardedIndex(
+                text_shards_dir,
+                hosted_shards=hosted_shards,
+                io_flags=io_flags,
+                workers=SHARD_WORKERS,
+                executor=SHARD_EXECUTOR,
+                threads=self.threads
+            )
+            text_compressed = self.text_index.compressed
+            print(f"Hosting {len(self.text_index.shards)} of {len(self.text_index.manifest['shards'])} text index shards")
+        else:
+            self.text_index = faiss.read_index(str(text_index_path), io_flags)
+            text_compressed = is_compressed(self.text_index)
+        self.image_index = faiss.read_index(str(image_index_path), io_flags)
+        self.text_vectors = self._load_rerank_vectors(text_compressed, text_vectors_path)
+        self.image_vectors = self._load_rerank_vectors(is_compressed(self.image_index), image_vectors_path)
+        self.metadata = open_metadata(
+            metadata_backend,
+            metadata_path=metadata_path,
+            mmap_metadata_dir=mmap_metadata_dir,
+            metadata_db_path=metadata_db_path,
+            cache_size=METADATA_CACHE_SIZE
+        )
+        self.filters = FilterCompiler(self.metadata)
+
+        # Estimated from the on-disk size of what this store holds in process
+        # memory; memory-mapped indexes and vectors live in the shared page cache.
+        resident = [Path(metadata_path)] if metadata_backend == "json" else []
+        if serving_mode == "heap":
+            if isinstance(self.text_index, ShardedIndex):
+                resident += [self.text_index.shards_dir / shard["path"] for shard in self.text_index.shards]
+            else:
+                resident.append(Path(text_index_path))
+            resident.append(Path(image_index_path))
+        self.memory_bytes = sum(path.stat().st_size for path in resident)
+
+    @staticmethod
+    def _load_rerank_vectors(compressed: bool, vectors_path: Path) -> Optional[np.ndarray]:
+        if compressed and Path(vectors_path).exists():
+            return np.load(vectors_path, mmap_mode="r")
+        return None
+
+    def _span(self, name: str):
+        return self.tracer.span(name) if self.tracer is not None else nullcontext()
+
+    def apply_thread_budget(self) -> None:
+        # OpenMP keeps the thread count per calling thread, so the budget has
+        # to be set in every thread that searches, not once per process.
+        if getattr(self._thread_state, "threads", None) != self.threads:
+            faiss.omp_set_num_threads(self.threads)
+            self._thread_state.threads = self.threads
+
+    def _search_candidates(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        compiled: Optional[CompiledFilter],
+        filters: Optional[SearchFilter]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if isinstance(self.text_index, ShardedIndex):
+            return self.text_index.search(query_vectors, k, compiled, filters)
+        if compiled is None:
+            return self.text_index.search(query_vectors, k)
+        return filtered_search(self.text_index, query_vectors, k, compiled, self.text_vectors)
 
-    def load_from_file(
+    def text_vectors_for(self, rows: np.ndarray) -> np.ndarray:
+        if self.text_vectors is not None:
+            return np.asarray(self.text_vectors[rows], dtype="float32")
+        return self.text_index.reconstruct_batch(rows)
+
+    def image_vectors_for(self, rows: Sequence[int]) -> np.ndarray:
+        if self.image_vectors is not None:
+            return np.asarray(self.image_vectors[rows], dtype="float32")
+        return self.image_index.reconstruct_batch(np.asarray(rows, dtype="int64"))
+
+    def search_text_index(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        D, I = self.search_text_candidates(query_vectors, top_k, filters, diversify)
+        return self.finish_text_search(query_vectors, D, I, top_k, diversify)
+
+    def search_text_candidates(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # The index scan, batched across queries by the query executor; the
+        # per-query re-ranking is left to finish_text_search.
+        self.apply_thread_budget()
+        compiled = self.filters.compile(filters)
+        if compiled is not None and compiled.count == 0:
+            return empty_result(query_vectors.shape[0], top_k)
+
+        diversify = self.diversify if diversify is None else diversify
+        k = max(top_k, self.mmr_pool) if diversify else top_k
+        if self.text_vectors is not None:
+            k = max(k, self.rerank_pool)
+        return self._search_candidates(query_vectors, k, compiled, filters)
+
+    def finish_text_search(
         self,
-        text_index_path: Path,
-        image_index_path: Path,
-        text_metadata: Optional[list[dict]] = None,
-        image_metadata: Optional[list[dict]] = None
-    ) -> None:
-        if text_index_path.exists():
-            self.text_index = faiss.read_index(str(text_index_path))
-        if image_index_path.exists():
-            self.image_index = faiss.read_index(str(image_index_path))
-        if text_metadata:
-            self.text_metadata = text_metadata
-        if image_metadata:
-            self.image_metadata = image_metadata
-
-    def search_text(self, query_vector: list[float], top_k: int = TOP_K) -> list[dict]:
-        if self.text_index is None:
-            raise ValueError("Text index not loaded")
-        D, I = self.text_index.search(np.array([query_vector], dtype="float32"), top_k)
-        return [{"score": float(D[0][i]), **self.text_metadata[I[0][i]]} for i in range(len(I[0]))]
-
-    def search_image(self, query_vector: list[float], top_k: int = TOP_K) -> list[dict]:
-        if self.image_index is None:
-            raise ValueError("Image index not loaded")
-        D, I = self.image_index.search(np.array([query_vector], dtype="float32"), top_k)
-        return [{"score": float(D[0][i]), **self.image_metadata[I[0][i]]} for i in range(len(I[0]))]
+        query_vectors: np.ndarray,
+        D: np.ndarray,
+        I: np.ndarray,
+        top_k: int = TOP_K,
+        diversify: Optional[bool] = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if not (I >= 0).any():
+            return empty_result(query_vectors.shape[0], top_k)
+        diversify = self.diversify if diversify is None else diversify
+        k = max(top_k, self.mmr_pool) if diversify else top_k
+
+        if self.text_vectors is not None:
+            with self._span("exact_rerank"):
+                D, I = rerank_exact(query_vectors, I, self.text_vectors, k)
+
+        if not diversify:
+            return D[:, :top_k], I[:, :top_k]
+        with self._span("mmr"):
+            return mmr_rerank(query_vectors, I, self.text_vectors_for, top_k, self.mmr_lambda)
+
+    def resolve_text_hits(self, scores: np.ndarray, indices: np.ndarray) -> list[list[dict]]:
+        scores = np.atleast_2d(scores)
+        indices = np.atleast_2d(indices)
+        # One metadata lookup for the hits of every query in the batch.
+        records = self.metadata.text_records(indices.ravel())
+
+        results = []
+        for q in range(indices.shape[0]):
+            hits = []
+            for rank in range(indices.shape[1]):
+                record = records[q * indices.shape[1] + rank]
+                if record is None:
+                    continue
+                hits.append({
+                    "id": record["id"],
+                    "score": float(scores[q, rank]),
+                    "rank": rank + 1,
+                    **record
+                })
+            results.append(hits)
+        return results
+
+    def search_text(
+        self,
+        query_vectors: np.ndarray,
+        top_k: int = TOP_K,
+        filters: Optional[SearchFilter] = None,
+        diversify: Optional[bool] = None
+    ) -> list[list[dict]]:
+        D, I = self.search_text_index(query_vectors, top_k, filters, diversify)
+        return self.resolve_text_hits(D, I)
+
+    def close(self) -> None:
+        if isinstance(self.text_index, ShardedIndex):
+            self.text_index.close()